@@ -1,28 +1,27 @@
-from .lib import xgb, accuracy_score, roc_auc_score, classification_report
+from .lib import np, xgb, accuracy_score, roc_auc_score, classification_report
 
 class AdvancedModels:
     """
     This class provides methods for training and evaluating advanced machine learning models.
     """
 
-    def train_xgboost(X_train, y_train, X_test, y_test):
+    def train_xgboost(X_train, y_train, X_test, y_test, cache=None):
         """
         Trains an XGBoost classifier and evaluates its performance on the test data.
 
         Parameters:
-        - X_train: array-like, shape (n_samples, n_features), training input data
+        - X_train: array-like or scipy.sparse matrix, shape (n_samples, n_features), training input data
         - y_train: array-like, shape (n_samples,), training target labels
-        - X_test: array-like, shape (n_samples, n_features), testing input data
+        - X_test: array-like or scipy.sparse matrix, shape (n_samples, n_features), testing input data
         - y_test: array-like, shape (n_samples,), testing target labels
+        - cache: ModelCache or None, cache of the trained booster and its scores
 
         Returns:
         - bst: trained XGBoost model
         """
-        dtrain = xgb.DMatrix(X_train, label=y_train)
-        dtest = xgb.DMatrix(X_test, label=y_test)
-
-        val_pos = y_train[y_train == 1].count()
-        val_neg = y_train[y_train == 0].count()
+        # Works for both Series and NumPy labels (the sparse path)
+        val_pos = np.sum(np.asarray(y_train) == 1)
+        val_neg = np.sum(np.asarray(y_train) == 0)
         scale_pos_weight = val_neg / val_pos
 
         params = {
@@ -37,15 +36,29 @@ class AdvancedModels:
         }
         num_round = 200
 
-        evals = [(dtrain, 'train'), (dtest, 'eval')]
-        bst = xgb.train(params, dtrain, num_round, evals, early_stopping_rounds=10)
+        def train():
+            dtrain = xgb.DMatrix(X_train, label=y_train)
+            dtest = xgb.DMatrix(X_test, label=y_test)
+
+            evals = [(dtrain, 'train'), (dtest, 'eval')]
+            bst = xgb.train(params, dtrain, num_round, evals, early_stopping_rounds=10)
+
+            y_pred_prob = bst.predict(dtest)
+            y_pred = (y_pred_prob > 0.5).astype(int)
+            report = {
+                'accuracy': accuracy_score(y_test, y_pred),
+                'roc_auc': roc_auc_score(y_test, y_pred_prob),
+                'classification_report': classification_report(y_test, y_pred),
+            }
+            return bst, report
 
-        y_pred_prob = bst.predict(dtest)
-        y_pred = (y_pred_prob > 0.5).astype(int)
+        if cache is None:
+            bst, report = train()
+        else:
+            settings = {'params': params, 'num_round': num_round, 'early_stopping_rounds': 10}
+            bst, report = cache.cached('XGBoost', 'xgboost.Booster', settings, (X_train, y_train, X_test, y_test), train)
 
-        accuracy = accuracy_score(y_test, y_pred)
-        roc_auc = roc_auc_score(y_test, y_pred_prob)
-        print(f'Accuracy: {accuracy * 100:.2f}%')
-        print(f'ROC AUC: {roc_auc:.2f}')
-        print(classification_report(y_test, y_pred))
+        print(f"Accuracy: {report['accuracy'] * 100:.2f}%")
+        print(f"ROC AUC: {report['roc_auc']:.2f}")
+        print(report['classification_report'])
         return bst
\ No newline at end of file
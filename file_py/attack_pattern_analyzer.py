@@ -1,4 +1,5 @@
-from .lib import px, plt, Counter
+from .lib import np, pd, px, plt, Counter
+from .ragged_events import RaggedEvents
 
 class AttackPatternAnalyzer:
     """Class to analyze attack patterns in a DataFrame based on severity values, attack and signature sequences."""
@@ -12,20 +13,37 @@ class AttackPatternAnalyzer:
         """
         self.df = df
 
-    def pattern_before_attack(self, num_attacks, severity_value):
+    PATTERN_COLUMNS = ['signature', 'RuleAnnotation.mitre_attack.id', 'path_category_detailed', 'EventType', 'tag', 'severity_id']
+
+    def _ragged(self):
+        # The list columns are flattened once per analyzer and reused by every call
+        if not hasattr(self, '_ragged_events'):
+            self._ragged_events = RaggedEvents.from_event_df(self.df, AttackPatternAnalyzer.PATTERN_COLUMNS)
+        return self._ragged_events
+
+    def compute_pattern_before_attack(self, num_attacks, severity_value):
         """
-        Analyze patterns before attacks within a specific severity range.
-        
+        Compute the percentage of each value in the attacks before attacks within a specific severity range.
+
+        The previous num_attacks attacks of every filtered attack form a window; an attack covered by
+        several windows is counted once per window. The number of windows covering each attack is found
+        with a difference array, and the counts come from np.bincount on the integer codes of the
+        RaggedEvents columns, weighted by that number.
+
         Parameters:
         num_attacks (int): Number of attacks to analyze before the current attack.
         severity_value (float): The target severity value to filter attacks.
-        
+
         Raises:
         ValueError: If severity_value is not between 25 and 100.
+
+        Returns:
+        dict: A DataFrame per column with the columns 'value', 'count' and 'percentage',
+        in order of first appearance. None if there are no attacks.
         """
         if severity_value < 25 or severity_value > 100:
             raise ValueError("severity_value must be between 25 and 100")
-        
+
         severity_lower_bound = severity_value - 2.5
         severity_upper_bound = severity_value + 2.5
 
@@ -36,32 +54,60 @@ class AttackPatternAnalyzer:
         # Filter rows within the specified severity_mean range
         filtered_df = self.df[(self.df['severity_mean'] >= severity_lower_bound) &
                               (self.df['severity_mean'] <= severity_upper_bound)]
-        
 
-        results = {
-            'signature': [],
-            'RuleAnnotation.mitre_attack.id': [],
-            'path_category_detailed':[],
-            'EventType': [],
-            'tag': [],
-            'severity_id': []
-        }
+        # Number of windows covering each attack: each window is the rows [idx - num_attacks, idx)
+        idx = np.asarray(filtered_df.index, dtype=np.int64)
+        idx = idx[idx > num_attacks]
+        coverage = np.zeros(len(self.df) + 1, dtype=np.int64)
+        np.add.at(coverage, np.maximum(0, idx - num_attacks), 1)
+        np.add.at(coverage, np.minimum(idx, len(self.df)), -1)
+        coverage = np.cumsum(coverage[:-1])
+
+        ragged = self._ragged()
+        weights = np.repeat(coverage, ragged.count())
+        covered = weights > 0
+
+        tables = {}
+        for col in AttackPatternAnalyzer.PATTERN_COLUMNS:
+            codes = ragged.codes[col][covered]
+            counts = np.bincount(codes, weights=weights[covered], minlength=len(ragged.vocabularies[col])).astype(np.int64)
+            # Keep the values in order of first appearance
+            present, first = np.unique(codes, return_index=True)
+            present = present[np.argsort(first)]
+            counts = counts[present]
+            total = counts.sum()
+            tables[col] = pd.DataFrame({
+                'value': ragged.vocabularies[col][present],
+                'count': counts,
+                'percentage': [round(count / total * 100, 2) for count in counts],
+            })
+
+        return tables
+
+    def pattern_before_attack(self, num_attacks, severity_value):
+        """
+        Analyze patterns before attacks within a specific severity range.
         
-        for idx in filtered_df.index:
-            if idx > num_attacks:
-                start_idx = max(0, idx - num_attacks)
-                relevant_rows = self.df.iloc[start_idx:idx]
-                
-                for col in results.keys():
-                    values = relevant_rows[col].sum()
-                    results[col].extend(values)
+        Parameters:
+        num_attacks (int): Number of attacks to analyze before the current attack.
+        severity_value (float): The target severity value to filter attacks.
+        
+        Raises:
+        ValueError: If severity_value is not between 25 and 100.
+
+        Returns:
+        dict: The percentage tables of compute_pattern_before_attack.
+        """
+        tables = self.compute_pattern_before_attack(num_attacks, severity_value)
+        if tables is None:
+            return
 
         # Plotting the results with Matplotlib and Plotly
-        for col, values in results.items():
-            counter = Counter(values)
-            labels, counts = zip(*counter.items())
-            total = sum(counts)
-            percentages = [round(count / total * 100, 2) for count in counts]
+        for col, table in tables.items():
+            if table.empty:
+                continue
+            labels = tuple(table['value'])
+            percentages = list(table['percentage'])
             
             if col == 'RuleAnnotation.mitre_attack.id' or col == 'signature':
                 # Use Plotly for these columns
@@ -97,6 +143,8 @@ class AttackPatternAnalyzer:
                 
                 plt.show()
 
+        return tables
+
     def pattern_inside_attack(self, severity_value):
         """
         Analyze patterns within attacks for a specific severity range.
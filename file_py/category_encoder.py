@@ -0,0 +1,192 @@
+from .lib import np, pd, json
+
+class CategoryEncoder:
+    """A fit/transform encoder for categorical columns with a vocabulary that can be saved to disk.
+
+    The vocabulary of each column is learned once with `fit` and then reused, so the
+    codes (mode 'label') or the dummy columns (mode 'onehot') stay the same across days.
+    New batches are encoded with a lookup in the vocabulary instead of a refit, and
+    categories never seen during `fit` go to a reserved bucket: code -1 in mode 'label'
+    and the '<column>___unknown__' dummy column in mode 'onehot'.
+
+    With the same data, mode 'label' gives the codes of sklearn's LabelEncoder and mode
+    'onehot' the columns of pd.get_dummies, plus the reserved columns.
+
+    Attributes:
+        UNKNOWN (str): The name of the reserved bucket for unseen categories.
+
+    Methods:
+        fit(df): Learns the vocabulary of each column.
+        transform(df): Encodes the columns with the learned vocabularies.
+        fit_transform(df): Learns the vocabularies and encodes the columns.
+        transform_sparse(df, include_unknown): One-hot encodes the columns into a scipy.sparse CSR matrix.
+        feature_names(): Returns the dummy column names produced in mode 'onehot'.
+        save(file_path): Saves the vocabularies to a JSON file.
+        load(file_path): Loads an encoder saved with save().
+    """
+
+    UNKNOWN = '__unknown__'
+
+    def __init__(self, columns, mode='label'):
+        """
+        Initializes the encoder.
+
+        Args:
+            columns (list): The columns to encode.
+            mode (str): 'label' for integer codes, 'onehot' for dummy columns.
+        """
+        if mode not in ('label', 'onehot'):
+            raise ValueError("mode must be 'label' or 'onehot'")
+        self.columns = list(columns)
+        self.mode = mode
+        self.vocabularies = {}
+
+    @property
+    def is_fitted(self):
+        return bool(self.vocabularies)
+
+    def fit(self, df):
+        """Learns the vocabulary of each column.
+
+        Args:
+            df (pandas.DataFrame): The DataFrame containing the columns to encode.
+
+        Returns:
+            CategoryEncoder: The fitted encoder.
+        """
+        for column in self.columns:
+            values = pd.unique(df[column].dropna().to_numpy(dtype=object))
+            # Plain Python values keep the vocabulary JSON serializable
+            self.vocabularies[column] = sorted(value.item() if isinstance(value, np.generic) else value for value in values)
+        return self
+
+    def codes(self, series, column):
+        """Returns the vocabulary codes of a Series, with -1 for unseen categories.
+
+        Args:
+            series (pandas.Series): The values to encode.
+            column (str): The column whose vocabulary is used.
+
+        Returns:
+            numpy.ndarray: The integer codes.
+        """
+        vocabulary = self.vocabularies[column]
+        return pd.Categorical(series.to_numpy(dtype=object), categories=vocabulary).codes.astype(np.int64)
+
+    def transform(self, df):
+        """Encodes the columns with the learned vocabularies.
+
+        Args:
+            df (pandas.DataFrame): The DataFrame to encode.
+
+        Returns:
+            pandas.DataFrame: The encoded DataFrame.
+        """
+        if not self.is_fitted:
+            raise ValueError("CategoryEncoder must be fitted before transform")
+
+        df = df.copy()
+        if self.mode == 'label':
+            for column in self.columns:
+                df[column] = self.codes(df[column], column)
+            return df
+
+        dummies = []
+        for column in self.columns:
+            codes = self.codes(df[column], column)
+            width = len(self.vocabularies[column]) + 1
+            # The reserved bucket is the last dummy column of each block
+            codes[codes == -1] = width - 1
+            block = np.zeros((len(df), width), dtype=bool)
+            block[np.arange(len(df)), codes] = True
+            dummies.append(pd.DataFrame(block, index=df.index, columns=self.feature_names(column)))
+
+        return pd.concat([df.drop(columns=self.columns)] + dummies, axis=1)
+
+    def transform_sparse(self, df, include_unknown=True):
+        """One-hot encodes the columns into a scipy.sparse CSR matrix.
+
+        Each row has exactly one non-zero entry per encoded column, so the matrix is built
+        directly from the vocabulary codes without materializing the dummy columns.
+
+        Args:
+            df (pandas.DataFrame): The DataFrame to encode.
+            include_unknown (bool): If False, the reserved columns are left out and unseen
+                categories get an all-zero block, as with pd.get_dummies.
+
+        Returns:
+            tuple: The CSR matrix of shape (len(df), n_dummies) and the list of its column names.
+        """
+        if not self.is_fitted:
+            raise ValueError("CategoryEncoder must be fitted before transform")
+
+        rows, cols, names = [], [], []
+        offset = 0
+        for column in self.columns:
+            codes = self.codes(df[column], column)
+            width = len(self.vocabularies[column])
+            column_names = self.feature_names(column)
+            if include_unknown:
+                codes[codes == -1] = width
+                width += 1
+            else:
+                column_names = column_names[:-1]
+            seen = codes >= 0
+            rows.append(np.flatnonzero(seen))
+            cols.append(codes[seen] + offset)
+            names.extend(column_names)
+            offset += width
+
+        from .lib import sparse
+        rows = np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+        cols = np.concatenate(cols) if cols else np.array([], dtype=np.int64)
+        matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(df), offset))
+        return matrix, names
+
+    def fit_transform(self, df):
+        """Learns the vocabularies and encodes the columns.
+
+        Args:
+            df (pandas.DataFrame): The DataFrame to encode.
+
+        Returns:
+            pandas.DataFrame: The encoded DataFrame.
+        """
+        return self.fit(df).transform(df)
+
+    def feature_names(self, column=None):
+        """Returns the dummy column names produced in mode 'onehot'.
+
+        Args:
+            column (str, optional): Returns only the names of this column.
+
+        Returns:
+            list: The dummy column names.
+        """
+        columns = self.columns if column is None else [column]
+        return [f'{c}_{value}' for c in columns for value in self.vocabularies[c] + [CategoryEncoder.UNKNOWN]]
+
+    def save(self, file_path):
+        """Saves the vocabularies to a JSON file.
+
+        Args:
+            file_path (str): The path of the JSON file.
+        """
+        with open(file_path, 'w') as f:
+            json.dump({'mode': self.mode, 'columns': self.columns, 'vocabularies': self.vocabularies}, f, indent=2)
+
+    @staticmethod
+    def load(file_path):
+        """Loads an encoder saved with save().
+
+        Args:
+            file_path (str): The path of the JSON file.
+
+        Returns:
+            CategoryEncoder: The fitted encoder.
+        """
+        with open(file_path) as f:
+            state = json.load(f)
+        encoder = CategoryEncoder(state['columns'], mode=state['mode'])
+        encoder.vocabularies = state['vocabularies']
+        return encoder
@@ -1,4 +1,5 @@
-from .lib import pd, StandardScaler, LabelEncoder
+from .lib import np, pd
+from .category_encoder import CategoryEncoder
 
 class CsvPreprocessingScaler:
     """A utility class for preprocessing CSV data and applying scaling.
@@ -8,32 +9,101 @@ class CsvPreprocessingScaler:
     converting data types, and scaling features.
 
     Attributes:
-        None
+        PIPELINE_COLUMNS (list): The columns of a Splunk export needed by RawPreprocessing.
+        PIPELINE_DTYPES (dict): The dtypes used to read PIPELINE_COLUMNS.
+        CATEGORICAL_COLUMNS (list): The columns stored as categorical after a pruned read.
+        LE_COLUMNS (list): The columns encoded by LEPreprocessing.
+        OHE_COLUMNS (list): The columns encoded by OhePreprocessing.
+        PATH_CATEGORY_RULES (list): The (category, match, patterns) rules used to categorize paths, in priority order.
 
     Methods:
-        read_csv_file(file_path): Reads a CSV file and returns a DataFrame.
+        read_csv_file(file_path, pruned, extra_columns): Reads a CSV file and returns a DataFrame.
         drop_unnecessary_columns(df, columns_to_drop): Drops specified columns from a DataFrame.
         convert_to_datetime(df, column): Converts a column in a DataFrame to datetime format.
+        categorize_paths(paths, rules): Categorizes a Series of paths with a rule table.
         categorize_and_count_paths(df): Categorizes paths in a DataFrame and counts occurrences.
         RawPreprocessing(df): Performs raw preprocessing steps on a DataFrame.
+        explode_and_categorize(df): Performs the row-local part of RawPreprocessing.
+        parquet_schema(time_type): Returns the Arrow schema of the Parquet file written by RawPreprocessingChunked.
+        RawPreprocessingChunked(file_path, output_path, chunksize, max_null_fraction): Performs RawPreprocessing in chunks, writing a Parquet file.
         RawPreprocessingWSig(df): Performs raw preprocessing steps on a DataFrame, keeping 'signature'.
-        LEPreprocessing(df): Performs label encoding preprocessing on a DataFrame.
-        OhePreprocessing(df): Performs one-hot encoding preprocessing on a DataFrame.
-        stdScaler(df): Applies standard scaling to the features of a DataFrame.
+        LEPreprocessing(df, encoder): Performs label encoding preprocessing on a DataFrame.
+        OhePreprocessing(df, encoder, sparse_output): Performs one-hot encoding preprocessing on a DataFrame.
+        ohe_sparse_matrix(df, encoder, include_unknown): One-hot encodes a raw-preprocessed DataFrame into a CSR matrix.
+        stdScaler(df, columns, scaler): Applies standard scaling to the features of a DataFrame.
     """
 
+    PIPELINE_COLUMNS = ["signature", "RuleAnnotation.mitre_attack.id", "_time", "parent_process_id", "process_id",
+                        "process_path", "severity_id", "EventType", "tag"]
+
+    PIPELINE_DTYPES = {
+        "signature": "category",
+        "RuleAnnotation.mitre_attack.id": "object",
+        "parent_process_id": "Int64",
+        "process_id": "Int64",
+        "process_path": "object",
+        "severity_id": "Int64",
+        "EventType": "Int64",
+        "tag": "category",
+    }
+
+    CATEGORICAL_COLUMNS = ["signature", "tag", "EventType"]
+
+    LE_COLUMNS = ["signature", "RuleAnnotation.mitre_attack.id", "parent_process_id", "process_id", 'path_category_detailed', "severity_id", "EventType", "tag"]
+
+    OHE_COLUMNS = ["signature", "RuleAnnotation.mitre_attack.id", 'path_category_detailed', "severity_id", "EventType", "tag"]
+
+    # Each rule is (category, 'contains' or 'startswith', patterns); the first matching rule wins
+    PATH_CATEGORY_RULES = [
+        ('Temporary', 'contains', ['\\temp\\', '\\tmp\\', '\\appdata\\local\\temp\\']),
+        ('System Files', 'startswith', ['c:\\windows\\system32\\', 'c:\\windows\\syswow64\\']),
+        ('Program Files', 'startswith', ['c:\\program files\\', 'c:\\program files (x86)\\']),
+        ('User Files', 'startswith', ['c:\\users\\']),
+        ('Network Locations', 'startswith', ['\\\\']),
+    ]
+
     @staticmethod
-    def read_csv_file(file_path):
+    def read_csv_file(file_path, pruned=False, extra_columns=None):
         """Reads a CSV file and returns a DataFrame.
 
+        With `pruned=True` only the columns needed by the preprocessing pipeline
+        (plus `extra_columns`) are read, with explicit dtypes, categorical 'signature',
+        'tag' and 'EventType' and '_time' parsed while reading. The pyarrow parser
+        is used when it is installed.
+
         Args:
             file_path (str): The path to the CSV file.
+            pruned (bool): If True, reads only PIPELINE_COLUMNS and extra_columns.
+            extra_columns (list, optional): Additional columns to read in pruned mode.
 
         Returns:
             pandas.DataFrame: The DataFrame containing the CSV data.
         """
         try:
-            df = pd.read_csv(file_path, low_memory=False)
+            if not pruned:
+                df = pd.read_csv(file_path, low_memory=False)
+                return df
+
+            head = pd.read_csv(file_path, nrows=1)
+            wanted = CsvPreprocessingScaler.PIPELINE_COLUMNS + list(extra_columns or [])
+            usecols = [column for column in head.columns if column in wanted]
+            dtypes = {column: dtype for column, dtype in CsvPreprocessingScaler.PIPELINE_DTYPES.items() if column in usecols}
+
+            # The heavy backends are imported where they are used, so importing this module stays cheap
+            from .lib import pyarrow
+            if pyarrow is not None:
+                df = pd.read_csv(file_path, usecols=usecols, dtype=dtypes, engine='pyarrow')
+                # pyarrow normalises '_time' to UTC: restore the offset written in the export
+                if '_time' in df.columns and not head.empty:
+                    tz = pd.to_datetime(head['_time']).dt.tz
+                    df['_time'] = df['_time'].dt.tz_convert(tz) if tz is not None else df['_time'].dt.tz_localize(None)
+            else:
+                df = pd.read_csv(file_path, usecols=usecols, dtype=dtypes, parse_dates=['_time'] if '_time' in usecols else None)
+
+            # 'EventType' is numeric, so it becomes categorical only once its values are parsed
+            for column in CsvPreprocessingScaler.CATEGORICAL_COLUMNS:
+                if column in df.columns:
+                    df[column] = df[column].astype('category')
             return df
         except FileNotFoundError:
             print(f"File {file_path} not found.")
@@ -74,6 +144,44 @@ class CsvPreprocessingScaler:
         except Exception as e:
             print(f"An error occurred while converting {column} to datetime: {e}")
 
+    @staticmethod
+    def categorize_paths(paths, rules=None, default='Other'):
+        """Categorizes a Series of paths with a rule table.
+
+        Each distinct path is lower-cased and tested only once, with vectorized string
+        operations and np.select over the rules in priority order.
+
+        Args:
+            paths (pandas.Series): The paths to categorize.
+            rules (list, optional): The (category, match, patterns) rules, where match is
+                'contains' or 'startswith'. Defaults to PATH_CATEGORY_RULES.
+            default (str): The category of the paths matching no rule.
+
+        Returns:
+            pandas.Series: The category of each path, with the same index as `paths`.
+        """
+        if rules is None:
+            rules = CsvPreprocessingScaler.PATH_CATEGORY_RULES
+
+        codes, uniques = pd.factorize(paths)
+        lowered = pd.Series(uniques, dtype=object).str.lower()
+
+        conditions = []
+        for _, match, patterns in rules:
+            if match == 'startswith':
+                condition = lowered.str.startswith(tuple(patterns))
+            elif match == 'contains':
+                condition = np.logical_or.reduce([lowered.str.contains(pattern, regex=False) for pattern in patterns])
+            else:
+                raise ValueError(f"Unknown match type '{match}', use 'contains' or 'startswith'")
+            conditions.append(np.asarray(pd.Series(condition).fillna(False), dtype=bool))
+
+        categories = np.select(conditions, [category for category, _, _ in rules], default=default) if rules else np.full(len(uniques), default)
+
+        # Missing paths have code -1, which picks the appended default category
+        categories = np.append(categories.astype(object), default)
+        return pd.Series(categories[codes], index=paths.index, name='path_category_detailed')
+
     @staticmethod
     def categorize_and_count_paths(df):
         """Categorizes paths in a DataFrame and counts occurrences.
@@ -86,24 +194,7 @@ class CsvPreprocessingScaler:
         """
         data = pd.DataFrame()
         data["process_path"] = df["process_path"]
-
-        def categorize_path_detailed(path):
-            path_lower = path.lower()
-            if '\\temp\\' in path_lower or '\\tmp\\' in path_lower or '\\appdata\\local\\temp\\' in path_lower:
-                return 'Temporary'
-            elif path_lower.startswith('c:\\windows\\system32\\') or path_lower.startswith('c:\\windows\\syswow64\\'):
-                return 'System Files'
-            elif path_lower.startswith('c:\\program files\\') or path_lower.startswith('c:\\program files (x86)\\'):
-                return 'Program Files'
-            elif path_lower.startswith('c:\\users\\'):
-                return 'User Files'
-            elif path_lower.startswith('\\\\'):
-                return 'Network Locations'
-            else:
-                return 'Other'
-
-        # Apply the detailed categorization function to the 'process_path' column
-        data['path_category_detailed'] = data['process_path'].apply(categorize_path_detailed)
+        data['path_category_detailed'] = CsvPreprocessingScaler.categorize_paths(df["process_path"])
         
         return data
 
@@ -129,6 +220,20 @@ class CsvPreprocessingScaler:
                            "tag::eventtype", "AppVersion"]
         df = CsvPreprocessingScaler.drop_unnecessary_columns(df, columns_to_drop)
         
+        return CsvPreprocessingScaler.explode_and_categorize(df)
+
+    @staticmethod
+    def explode_and_categorize(df):
+        """Converts '_time', explodes the MITRE ids, categorizes the paths and keeps the pipeline columns.
+
+        This is the row-local part of RawPreprocessing, so it can also be applied chunk by chunk.
+
+        Args:
+            df (pandas.DataFrame): The DataFrame with the relevant rows already selected.
+
+        Returns:
+            pandas.DataFrame: The preprocessed DataFrame.
+        """
         # Convert '_time' column to datetime
         CsvPreprocessingScaler.convert_to_datetime(df, '_time')
         
@@ -138,13 +243,115 @@ class CsvPreprocessingScaler:
         # Explode rows with lists of values into multiple separate rows
         df = df.explode('RuleAnnotation.mitre_attack.id')
 
-        categorized_paths_df = CsvPreprocessingScaler.categorize_and_count_paths(df)
-        df = df.join(categorized_paths_df.set_index(df.index), rsuffix='_detailed')
+        # The exploded rows share their index labels, so the categories are assigned by position
+        df['path_category_detailed'] = CsvPreprocessingScaler.categorize_paths(df['process_path']).to_numpy()
 
         df = df[["signature", "RuleAnnotation.mitre_attack.id", "_time", "parent_process_id", "process_id", 'path_category_detailed', "severity_id", "EventType", "tag"]]
 
+        # Categorical columns from a pruned read keep only the categories still in use
+        for column in df.select_dtypes(include='category').columns:
+            df[column] = df[column].cat.remove_unused_categories()
+
         return df
 
+    @staticmethod
+    def parquet_schema(time_type=None):
+        """Returns the Arrow schema of the output of explode_and_categorize, as written by RawPreprocessingChunked.
+
+        Args:
+            time_type (pyarrow.DataType, optional): The type of '_time', whose time zone comes from the export.
+                A timestamp without time zone if None.
+
+        Returns:
+            pyarrow.Schema: The schema.
+        """
+        from .lib import pyarrow
+        return pyarrow.schema([
+            ("signature", pyarrow.string()),
+            ("RuleAnnotation.mitre_attack.id", pyarrow.string()),
+            ("_time", time_type if time_type is not None else pyarrow.timestamp('us')),
+            ("parent_process_id", pyarrow.int64()),
+            ("process_id", pyarrow.int64()),
+            ("path_category_detailed", pyarrow.string()),
+            ("severity_id", pyarrow.int64()),
+            ("EventType", pyarrow.int64()),
+            ("tag", pyarrow.string()),
+        ])
+
+    @staticmethod
+    def RawPreprocessingChunked(file_path, output_path, chunksize=100000, max_null_fraction=0.5):
+        """Performs RawPreprocessing on a CSV file in chunks and writes the result to a Parquet file.
+
+        The file is read twice: the first pass counts the missing values of every column on the
+        relevant rows, the second pass reads only the pipeline columns, explodes and categorizes
+        each chunk and appends it to the output file. Memory use is bounded by `chunksize`.
+
+        Unlike RawPreprocessing, the missing-values threshold is a fraction of the relevant rows,
+        so it keeps the same meaning whatever the size of the export.
+
+        Args:
+            file_path (str): The path to the Splunk CSV export.
+            output_path (str): The path of the Parquet file to write.
+            chunksize (int): The number of CSV rows read at a time.
+            max_null_fraction (float): Columns with a larger fraction of missing values are dropped.
+
+        Returns:
+            str: The path of the written Parquet file.
+
+        Raises:
+            ImportError: If pyarrow is not installed.
+            ValueError: If one of the pipeline columns is missing or exceeds the missing-values threshold.
+        """
+        from .lib import pyarrow, pq
+        if pq is None:
+            raise ImportError("RawPreprocessingChunked requires pyarrow")
+
+        subset = ["RuleAnnotation.mitre_attack.id", "signature"]
+
+        # First pass: missing values per column on the relevant rows, and a '_time' value for its type
+        null_counts = None
+        relevant_rows = 0
+        time_sample = None
+        for chunk in pd.read_csv(file_path, chunksize=chunksize, low_memory=False):
+            chunk = chunk.dropna(subset=subset)
+            counts = chunk.isnull().sum()
+            null_counts = counts if null_counts is None else null_counts.add(counts, fill_value=0)
+            relevant_rows += len(chunk)
+            if time_sample is None and '_time' in chunk.columns and chunk['_time'].notna().any():
+                time_sample = chunk['_time'].dropna().iloc[:1]
+
+        if null_counts is None or relevant_rows == 0:
+            print(f"File {file_path} has no relevant rows.")
+            return None
+
+        columns = CsvPreprocessingScaler.PIPELINE_COLUMNS
+        dropped = null_counts.index[null_counts / relevant_rows > max_null_fraction]
+        missing = [column for column in columns if column not in null_counts.index or column in dropped]
+        if missing:
+            raise ValueError(f"Columns {missing} are missing or have more than {max_null_fraction:.0%} missing values")
+
+        # Second pass: only the pipeline columns, every chunk converted to the same declared schema,
+        # so a column that is entirely null in a chunk does not get the 'null' type
+        time_type = pyarrow.array(pd.to_datetime(time_sample)).type if time_sample is not None else None
+        schema = CsvPreprocessingScaler.parquet_schema(time_type)
+        dtypes = {column: ('object' if dtype == 'category' else dtype)
+                  for column, dtype in CsvPreprocessingScaler.PIPELINE_DTYPES.items()}
+        writer = None
+        try:
+            for chunk in pd.read_csv(file_path, chunksize=chunksize, usecols=columns, dtype=dtypes):
+                chunk = chunk.dropna(subset=subset)
+                if chunk.empty:
+                    continue
+                table = pyarrow.Table.from_pandas(CsvPreprocessingScaler.explode_and_categorize(chunk), schema=schema, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(output_path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        return output_path
+
     @staticmethod
     def RawPreprocessingWSig(df):
         """Performs raw preprocessing steps on a DataFrame, keeping 'signature'.
@@ -159,17 +366,27 @@ class CsvPreprocessingScaler:
         return df
 
     @staticmethod
-    def LEPreprocessing(df):
+    def LEPreprocessing(df, encoder=None):
         """Performs label encoding preprocessing on a DataFrame.
 
         Args:
             df (pandas.DataFrame): The DataFrame to preprocess.
+            encoder (CategoryEncoder, optional): A 'label' encoder over LE_COLUMNS. If given, it is
+                fitted on this data when not fitted yet, and its stored vocabularies are used
+                instead of refitting a LabelEncoder, so codes stay the same across files.
 
         Returns:
             pandas.DataFrame: The preprocessed DataFrame.
         """
         df = CsvPreprocessingScaler.RawPreprocessing(df)
-        columns_to_encode_for_LE = ["signature", "RuleAnnotation.mitre_attack.id", "parent_process_id", "process_id", 'path_category_detailed', "severity_id", "EventType", "tag"]
+        columns_to_encode_for_LE = CsvPreprocessingScaler.LE_COLUMNS
+
+        if encoder is not None:
+            if not encoder.is_fitted:
+                encoder.fit(df)
+            return encoder.transform(df)
+
+        from .lib import LabelEncoder
         label_encoder = LabelEncoder()
 
         for column in columns_to_encode_for_LE:
@@ -181,21 +398,46 @@ class CsvPreprocessingScaler:
         return df
 
     @staticmethod
-    def OhePreprocessing(df):
+    def OhePreprocessing(df, encoder=None, sparse_output=False):
         """Performs one-hot encoding preprocessing on a DataFrame.
 
+        With `sparse_output=True` the result is a scipy.sparse CSR matrix instead of a dense
+        DataFrame. Its columns are the same as the dense output, in the same order: the
+        non-encoded columns ('_time' as integer seconds, as in PreprocessingTrainTestSplit)
+        followed by the dummy columns. The rows follow RawPreprocessing, so the labels can
+        be taken from RunLogParser.process_attacks on RawPreprocessing(df).
+
         Args:
             df (pandas.DataFrame): The DataFrame to preprocess.
+            encoder (CategoryEncoder, optional): A 'onehot' encoder over OHE_COLUMNS. If given, it is
+                fitted on this data when not fitted yet, and the dummy columns come from its stored
+                vocabularies instead of pd.get_dummies, so they stay the same across files.
+            sparse_output (bool): If True, returns a CSR matrix and its column names.
 
         Returns:
-            pandas.DataFrame: The preprocessed DataFrame.
+            pandas.DataFrame: The preprocessed DataFrame, or a (scipy.sparse.csr_matrix, list)
+            tuple with `sparse_output=True`.
         """
         df = CsvPreprocessingScaler.RawPreprocessing(df)
-        columns_to_encode_for_OH = ["signature", "RuleAnnotation.mitre_attack.id", 'path_category_detailed', "severity_id", "EventType", "tag"]
+        columns_to_encode_for_OH = CsvPreprocessingScaler.OHE_COLUMNS
 
         # Replace newlines in 'tag' column
         df['tag'] = df['tag'].str.replace('\n', '_')
 
+        if sparse_output:
+            # Without a stored vocabulary the columns mirror pd.get_dummies, so no reserved bucket
+            include_unknown = encoder is not None
+            if encoder is None:
+                encoder = CategoryEncoder(columns_to_encode_for_OH, mode='onehot')
+            if not encoder.is_fitted:
+                encoder.fit(df)
+            return CsvPreprocessingScaler.ohe_sparse_matrix(df, encoder, include_unknown)
+
+        if encoder is not None:
+            if not encoder.is_fitted:
+                encoder.fit(df)
+            return encoder.transform(df)
+
         try:
             df = pd.get_dummies(df, columns=columns_to_encode_for_OH)
         except Exception as e:
@@ -204,18 +446,61 @@ class CsvPreprocessingScaler:
         return df
     
     @staticmethod
-    def stdScaler(df):
+    def ohe_sparse_matrix(df, encoder, include_unknown=True):
+        """One-hot encodes a raw-preprocessed DataFrame into a CSR matrix, as OhePreprocessing with `sparse_output=True`.
+
+        Args:
+            df (pandas.DataFrame): The output of RawPreprocessing, with newlines in 'tag' already replaced.
+            encoder (CategoryEncoder): A fitted 'onehot' encoder over OHE_COLUMNS.
+            include_unknown (bool): Whether the reserved columns for unseen categories are kept.
+
+        Returns:
+            tuple: The CSR matrix and the list of its column names.
+        """
+        from .lib import sparse
+        dummies, dummy_names = encoder.transform_sparse(df, include_unknown=include_unknown)
+
+        passthrough = df.drop(columns=encoder.columns)
+        if '_time' in passthrough.columns:
+            passthrough['_time'] = pd.DatetimeIndex(passthrough['_time']).as_unit('ns').asi8 // 10**9
+        matrix = sparse.hstack([sparse.csr_matrix(passthrough.to_numpy(dtype=np.float64, na_value=np.nan)), dummies], format='csr')
+        return matrix, list(passthrough.columns) + dummy_names
+
+    @staticmethod
+    def stdScaler(df, columns=None, scaler=None):
         """Applies standard scaling to the features of a DataFrame.
 
+        A scipy.sparse matrix (from OhePreprocessing with `sparse_output=True`) is scaled
+        without centering, so it stays sparse; its '_time' column, found through `columns`,
+        is left unscaled as in the dense case.
+
         Args:
-            df (pandas.DataFrame): The DataFrame to scale.
+            df (pandas.DataFrame or scipy.sparse matrix): The data to scale.
+            columns (list, optional): The column names of a sparse matrix.
+            scaler (StandardScaler, optional): If given, it is fitted on this data when not fitted yet
+                and reused otherwise, so that new data, e.g. the batches of ScoringEngine, is scaled as
+                the training data. For sparse input it must be a StandardScaler(with_mean=False).
 
         Returns:
-            pandas.DataFrame: The scaled DataFrame.
+            pandas.DataFrame: The scaled DataFrame, or a scaled CSR matrix for sparse input.
+
+        Raises:
+            ValueError: If a scaler with with_mean=True is given for sparse input.
         """
-        scaler = StandardScaler()
+        from .lib import sparse, StandardScaler
+        if scaler is not None and sparse.issparse(df) and scaler.get_params().get('with_mean', False):
+            raise ValueError("A sparse matrix cannot be centered: pass a StandardScaler(with_mean=False)")
+        if scaler is not None and not hasattr(scaler, 'scale_'):
+            scaler.fit(df if sparse.issparse(df) else df.drop(columns="_time"))
+
+        if sparse.issparse(df):
+            scale = (StandardScaler(with_mean=False).fit(df) if scaler is None else scaler).scale_.copy()
+            if columns is not None and '_time' in columns:
+                scale[list(columns).index('_time')] = 1.0
+            return sparse.csr_matrix(df.multiply(1.0 / scale))
+
         try:
-            df_scaled = scaler.fit_transform(df.drop(columns="_time"))
+            df_scaled = StandardScaler().fit_transform(df.drop(columns="_time")) if scaler is None else scaler.transform(df.drop(columns="_time"))
             return pd.merge(pd.DataFrame(df_scaled, columns=df.drop(columns="_time").columns), df["_time"], left_index=True, right_index=True)
         except Exception as e:
             print(f"An error occurred during standard scaling: {e}")
@@ -1,11 +1,12 @@
-from .lib import Sequential, Dense, classification_report
+from .lib import inspect, Sequential, Dense, classification_report
+from .model_cache import ModelCache
 
 class DeepLearningModel:
     """
     This class provides methods for training and evaluating a deep learning model using Keras.
     """
 
-    def train_deep_learning_model(X_train, y_train, X_test, y_test):
+    def train_deep_learning_model(X_train, y_train, X_test, y_test, cache=None):
         """
         Trains a deep learning model and evaluates its performance on the test data.
 
@@ -14,26 +15,38 @@ class DeepLearningModel:
         - y_train: array-like, shape (n_samples,), training target labels
         - X_test: array-like, shape (n_samples, n_features), testing input data
         - y_test: array-like, shape (n_samples,), testing target labels
+        - cache: ModelCache or None, cache of the trained model and its scores
 
         Returns:
         - model: trained deep learning model
         """
-        model = Sequential([
-            Dense(64, activation='relu', input_shape=(X_train.shape[1],)),
-            Dense(32, activation='relu'),
-            Dense(1, activation='sigmoid')
-        ])
+        def train():
+            model = Sequential([
+                Dense(64, activation='relu', input_shape=(X_train.shape[1],)),
+                Dense(32, activation='relu'),
+                Dense(1, activation='sigmoid')
+            ])
 
-        model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+            model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
 
-        model.fit(X_train, y_train, epochs=10, batch_size=32, verbose=1)
+            model.fit(X_train, y_train, epochs=10, batch_size=32, verbose=1)
 
-        loss, accuracy = model.evaluate(X_test, y_test, verbose=0)
-        print(f'Test Accuracy: {accuracy}')
+            loss, accuracy = model.evaluate(X_test, y_test, verbose=0)
 
-        y_pred_prob = model.predict(X_test)
-        y_pred = (y_pred_prob > 0.5).astype(int)
+            y_pred_prob = model.predict(X_test)
+            y_pred = (y_pred_prob > 0.5).astype(int)
+            return model, {'accuracy': float(accuracy), 'classification_report': classification_report(y_test, y_pred)}
+
+        if cache is None:
+            model, report = train()
+        else:
+            # The architecture and the training settings are those written in train(): its source is the key,
+            # so any change to the layers, the optimizer or the fit arguments invalidates the cached model
+            settings = {'train': ModelCache.fingerprint(inspect.getsource(train))}
+            model, report = cache.cached('Deep Learning Model', 'keras.Sequential', settings, (X_train, y_train, X_test, y_test), train)
+
+        print(f"Test Accuracy: {report['accuracy']}")
 
         print("Classification Report for Deep Learning Model:")
-        print(classification_report(y_test, y_pred))
+        print(report['classification_report'])
         return model
\ No newline at end of file
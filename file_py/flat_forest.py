@@ -0,0 +1,408 @@
+from .lib import np, pd, os, json, math, tempfile, sparse
+
+class FlatForest:
+    """A tree ensemble compiled into flat NumPy node arrays, for low-latency inference.
+
+    The trees of a fitted Decision Tree, Random Forest, Extra Trees, Gradient Boosting, XGBoost or
+    CatBoost model are stored in the same arrays: every node has a feature, a threshold, a left
+    and a right child, a direction for missing values and a value. A sample goes left when its
+    feature is <= the threshold; the leaves point to themselves, so all the trees are walked at
+    once, one depth level per step, with a few array gathers for the whole batch. The value of the
+    leaves is combined as
+
+        probability = link(scale * sum of the leaf values + bias)
+
+    with an identity link for the averaged forests and a sigmoid for the boosted models.
+
+    Thresholds are stored as float32 and compared with the features cast to float32, as the
+    libraries do, so the compiled model takes the same path as the original in every tree.
+    CatBoost's symmetric trees are expanded into full binary trees.
+
+        flat = FlatForest.compile(best_model, X_check=X_test)
+        flat.predict_proba(X_test)
+
+    Methods:
+        compile(model, X_check, atol): Compiles a fitted tree model, optionally checking parity.
+        decision_function(X): Returns the raw score of each sample.
+        predict_proba(X): Returns the class probabilities.
+        predict(X): Returns the predicted classes.
+        parity(model, X): Returns the largest probability difference from the original model.
+        save(path): Saves the arrays to a .npz file.
+        load(path): Loads a FlatForest saved with save().
+    """
+
+    def __init__(self, feature, threshold, left, right, default_left, value, roots, n_features,
+                 scale=1.0, bias=0.0, link='identity', sparse_missing=False, classes=(0, 1)):
+        """
+        Initializes the model from its node arrays.
+
+        Args:
+            feature (numpy.ndarray): The feature index of each node (any valid index for the leaves).
+            threshold (numpy.ndarray): The float32 threshold of each node; a sample goes left when <=.
+            left (numpy.ndarray): The left child of each node; a leaf is its own child.
+            right (numpy.ndarray): The right child of each node.
+            default_left (numpy.ndarray): Whether a missing value goes left at each node.
+            value (numpy.ndarray): The value of each leaf.
+            roots (numpy.ndarray): The root node of each tree.
+            n_features (int): The number of input features.
+            scale (float): The factor of the sum of the leaf values.
+            bias (float): The offset added to the scaled sum.
+            link (str): 'identity' or 'logistic', the function from the score to the probability.
+            sparse_missing (bool): Whether the implicit zeros of a sparse input are missing values (XGBoost).
+            classes (sequence): The two class labels.
+        """
+        if link not in ('identity', 'logistic'):
+            raise ValueError("link must be 'identity' or 'logistic'")
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float32)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.n_features = int(n_features)
+        self.scale = float(scale)
+        self.bias = float(bias)
+        self.link = link
+        self.sparse_missing = bool(sparse_missing)
+        self.classes_ = np.asarray(classes)
+
+        # The walk needs as many steps as the deepest leaf
+        self.max_depth = 0
+        frontier = self.roots[self.left[self.roots] != self.roots]
+        while len(frontier):
+            self.max_depth += 1
+            children = np.concatenate([self.left[frontier], self.right[frontier]])
+            frontier = children[self.left[children] != children]
+
+        # Left and right child side by side, so a step is one gather at 2 * node + goes_right
+        self.children = np.column_stack([self.left, self.right]).ravel()
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @staticmethod
+    def _floor32(threshold):
+        """Returns the largest float32 <= each threshold, so that x <= t keeps its result for float32 x."""
+        threshold = np.asarray(threshold, dtype=np.float64)
+        floor = threshold.astype(np.float32)
+        above = floor > threshold
+        floor[above] = np.nextafter(floor[above], np.float32(-np.inf))
+        return floor
+
+    @staticmethod
+    def _pack(trees, n_features, **kwargs):
+        """Concatenates trees given as dicts of node arrays with local child indices (-1 for the leaves)."""
+        feature, threshold, left, right, default_left, value, roots = [], [], [], [], [], [], []
+        offset = 0
+        for tree in trees:
+            n_nodes = len(tree['left'])
+            nodes = np.arange(offset, offset + n_nodes, dtype=np.int64)
+            leaf = np.asarray(tree['left']) < 0
+            feature.append(np.where(leaf, 0, tree['feature']))
+            threshold.append(np.where(leaf, np.float32(np.inf), FlatForest._floor32(np.where(leaf, 0.0, tree['threshold']))))
+            left.append(np.where(leaf, nodes, np.asarray(tree['left']) + offset))
+            right.append(np.where(leaf, nodes, np.asarray(tree['right']) + offset))
+            default_left.append(np.asarray(tree['default_left'], dtype=bool) | leaf)
+            value.append(np.where(leaf, tree['value'], 0.0))
+            roots.append(offset)
+            offset += n_nodes
+        if offset >= 2**31:
+            raise ValueError("The model has too many nodes for int32 indices")
+        return FlatForest(np.concatenate(feature), np.concatenate(threshold), np.concatenate(left), np.concatenate(right),
+                          np.concatenate(default_left), np.concatenate(value), np.array(roots), n_features, **kwargs)
+
+    @staticmethod
+    def compile(model, X_check=None, atol=1e-6):
+        """Compiles a fitted tree model.
+
+        Args:
+            model: A fitted DecisionTreeClassifier, RandomForestClassifier, ExtraTreesClassifier,
+                GradientBoostingClassifier, XGBClassifier, xgboost.Booster (binary:logistic) or
+                CatBoostClassifier, trained on a binary target with numeric features.
+            X_check (array-like or scipy.sparse matrix, optional): Samples on which the probabilities
+                of the compiled model are compared with those of the original.
+            atol (float): The largest difference accepted on X_check.
+
+        Returns:
+            FlatForest: The compiled model.
+
+        Raises:
+            ValueError: If the model is not supported, or differs from the original by more than atol.
+        """
+        module, name = type(model).__module__, type(model).__name__
+        if module.startswith('sklearn'):
+            if name == 'GradientBoostingClassifier':
+                flat = FlatForest.from_gradient_boosting(model)
+            elif name in ('DecisionTreeClassifier', 'ExtraTreeClassifier', 'RandomForestClassifier', 'ExtraTreesClassifier'):
+                flat = FlatForest.from_sklearn_trees(model)
+            else:
+                raise ValueError(f"Unsupported scikit-learn model: {name}")
+        elif module.startswith('xgboost'):
+            flat = FlatForest.from_xgboost(model)
+        elif module.startswith('catboost'):
+            flat = FlatForest.from_catboost(model)
+        else:
+            raise ValueError(f"Unsupported model: {module}.{name}")
+
+        if X_check is not None:
+            difference = flat.parity(model, X_check)
+            if difference > atol:
+                raise ValueError(f"The compiled model differs from {name} by {difference:.3g} (> {atol:.3g})")
+        return flat
+
+    @staticmethod
+    def _binary_classes(model):
+        classes = getattr(model, 'classes_', np.array([0, 1]))
+        if len(classes) != 2:
+            raise ValueError("Only binary classifiers can be compiled")
+        return classes
+
+    @staticmethod
+    def _sklearn_tree(tree, values):
+        """Returns the node arrays of a fitted sklearn Tree, with the given value of each node."""
+        return {
+            'feature': tree.feature,
+            'threshold': tree.threshold,
+            'left': tree.children_left,
+            'right': tree.children_right,
+            # Trees trained without missing values send them right, as sklearn does
+            'default_left': getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=bool)),
+            'value': values,
+        }
+
+    @staticmethod
+    def from_sklearn_trees(model):
+        """Compiles a DecisionTreeClassifier, or a forest of them (Random Forest, Extra Trees), averaging the leaf probabilities."""
+        classes = FlatForest._binary_classes(model)
+        estimators = [model] if hasattr(model, 'tree_') else model.estimators_
+        trees = []
+        for estimator in estimators:
+            counts = estimator.tree_.value[:, 0, :]
+            # Probability of the second class at each node, as predict_proba of the tree
+            trees.append(FlatForest._sklearn_tree(estimator.tree_, counts[:, 1] / np.maximum(counts.sum(axis=1), np.finfo(float).tiny)))
+        return FlatForest._pack(trees, model.n_features_in_, scale=1.0 / len(trees), classes=classes)
+
+    @staticmethod
+    def from_gradient_boosting(model):
+        """Compiles a binary GradientBoostingClassifier with a 'zero' or prior init."""
+        classes = FlatForest._binary_classes(model)
+        if model.init_ == 'zero':
+            log_odds = 0.0
+        elif type(model.init_).__name__ == 'DummyClassifier' and model.init_.strategy == 'prior':
+            prior = float(model.init_.class_prior_[1])
+            log_odds = math.log(prior / (1 - prior))
+        else:
+            raise ValueError("Only the 'zero' and prior inits of GradientBoostingClassifier can be compiled")
+
+        trees = [FlatForest._sklearn_tree(estimator.tree_, model.learning_rate * estimator.tree_.value[:, 0, 0]) for estimator in model.estimators_[:, 0]]
+        # The raw score of the exponential loss is half the log-odds
+        scale = 2.0 if model.loss == 'exponential' else 1.0
+        return FlatForest._pack(trees, model.n_features_in_, scale=scale, bias=log_odds, link='logistic', classes=classes)
+
+    @staticmethod
+    def from_xgboost(model):
+        """Compiles an XGBClassifier or a binary:logistic Booster.
+
+        An XGBClassifier keeps only the trees up to its best iteration, as its predict_proba does;
+        a Booster keeps all its trees, as its predict does.
+        """
+        booster = model.get_booster() if hasattr(model, 'get_booster') else model
+        config = json.loads(bytes(booster.save_raw('json')).decode('utf-8'))['learner']
+        if config['objective']['name'] not in ('binary:logistic', 'reg:logistic'):
+            raise ValueError(f"Unsupported XGBoost objective: {config['objective']['name']}")
+        gbm = config['gradient_booster']
+        if gbm['name'] != 'gbtree':
+            raise ValueError(f"Unsupported XGBoost booster: {gbm['name']}")
+
+        n_trees = len(gbm['model']['trees'])
+        if hasattr(model, 'get_booster'):
+            try:
+                n_trees = int(gbm['model']['iteration_indptr'][model.best_iteration + 1])
+            except AttributeError:
+                pass
+
+        trees = []
+        for tree in gbm['model']['trees'][:n_trees]:
+            if any(tree['split_type']):
+                raise ValueError("XGBoost models with categorical splits cannot be compiled")
+            condition = np.asarray(tree['split_conditions'], dtype=np.float32)
+            left = np.asarray(tree['left_children'])
+            # XGBoost goes left when x < condition: the largest float32 below it makes it x <= threshold
+            threshold = np.where(left < 0, 0.0, np.nextafter(condition, np.float32(-np.inf))).astype(np.float64)
+            trees.append({
+                'feature': np.asarray(tree['split_indices']),
+                'threshold': threshold,
+                'left': left,
+                'right': np.asarray(tree['right_children']),
+                'default_left': np.asarray(tree['default_left'], dtype=bool),
+                # The split condition of a leaf holds its value
+                'value': condition.astype(np.float64),
+            })
+
+        # base_score is stored as a probability, written as '0.5' or '[5E-1]'
+        base_score = float(config['learner_model_param']['base_score'].strip('[]'))
+        bias = math.log(base_score / (1 - base_score))
+        n_features = int(config['learner_model_param']['num_feature'])
+        return FlatForest._pack(trees, n_features, bias=bias, link='logistic', sparse_missing=True, classes=FlatForest._binary_classes(model))
+
+    @staticmethod
+    def from_catboost(model):
+        """Compiles a binary CatBoostClassifier with numeric features and symmetric trees."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.json')
+            model.save_model(path, format='json')
+            with open(path, encoding='utf-8') as f:
+                exported = json.load(f)
+        if 'oblivious_trees' not in exported:
+            raise ValueError("Only CatBoost models with symmetric trees can be compiled")
+        if exported['features_info'].get('categorical_features') or exported['features_info'].get('text_features'):
+            raise ValueError("CatBoost models with categorical or text features cannot be compiled")
+        float_features = exported['features_info']['float_features']
+
+        trees = []
+        for tree in exported['oblivious_trees']:
+            splits = tree['splits']
+            if any(split['split_type'] != 'FloatFeature' for split in splits):
+                raise ValueError("CatBoost models with non-numeric splits cannot be compiled")
+            if len(tree['leaf_values']) != 2 ** len(splits):
+                raise ValueError("Only binary CatBoost models can be compiled")
+            depth = len(splits)
+            n_internal = 2 ** depth - 1
+            feature, threshold, default_left = np.zeros(n_internal, dtype=np.int64), np.zeros(n_internal), np.zeros(n_internal, dtype=bool)
+            # The leaf index has the first split as its lowest bit, so the root tests the last one
+            for level in range(depth):
+                split = splits[depth - 1 - level]
+                info = float_features[split['float_feature_index']]
+                nodes = slice(2 ** level - 1, 2 ** (level + 1) - 1)
+                feature[nodes] = info['flat_feature_index']
+                threshold[nodes] = split['border']
+                # CatBoost sets bit 1 when x > border; missing values are the minimum unless treated as 'Max'
+                default_left[nodes] = info.get('nan_value_treatment') != 'Max'
+            internal = np.arange(n_internal)
+            trees.append({
+                'feature': np.concatenate([feature, np.zeros(n_internal + 1, dtype=np.int64)]),
+                'threshold': np.concatenate([threshold, np.zeros(n_internal + 1)]),
+                'left': np.concatenate([2 * internal + 1, -np.ones(n_internal + 1, dtype=np.int64)]),
+                'right': np.concatenate([2 * internal + 2, -np.ones(n_internal + 1, dtype=np.int64)]),
+                'default_left': np.concatenate([default_left, np.ones(n_internal + 1, dtype=bool)]),
+                'value': np.concatenate([np.zeros(n_internal), tree['leaf_values']]),
+            })
+
+        scale, bias = exported.get('scale_and_bias', [1.0, [0.0]])
+        bias = bias[0] if isinstance(bias, list) else bias
+        n_features = max([info['flat_feature_index'] for info in float_features] + [-1]) + 1
+        return FlatForest._pack(trees, n_features, scale=scale, bias=bias, link='logistic', classes=FlatForest._binary_classes(model))
+
+    def _as_array(self, X):
+        """Returns the samples as a C-contiguous float32 array with NaN for the missing values."""
+        if sparse.issparse(X):
+            if self.sparse_missing:
+                coo = sparse.coo_matrix(X)
+                dense = np.full(coo.shape, np.nan, dtype=np.float32)
+                dense[coo.row, coo.col] = coo.data
+                X = dense
+            else:
+                X = X.toarray()
+        elif isinstance(X, (pd.DataFrame, pd.Series)):
+            X = X.to_numpy(dtype=np.float32, na_value=np.nan)
+        X = np.ascontiguousarray(np.atleast_2d(X), dtype=np.float32)
+        if X.shape[1] != self.n_features:
+            raise ValueError(f"X has {X.shape[1]} features, the model expects {self.n_features}")
+        return X
+
+    def decision_function(self, X):
+        """Returns the raw score of each sample, scale * sum of its leaf values + bias.
+
+        Args:
+            X (array-like, pandas.DataFrame or scipy.sparse matrix): The samples.
+
+        Returns:
+            numpy.ndarray: The scores.
+        """
+        X = self._as_array(X)
+        n_samples = X.shape[0]
+        flat = X.ravel()
+        scores = np.empty(n_samples)
+        # Blocks bound the (samples, trees) index arrays to about a million entries
+        block = max(1, 2**20 // max(1, self.n_trees))
+        for start in range(0, n_samples, block):
+            stop = min(n_samples, start + block)
+            # The missing-value rule costs two more gathers per step, so it is skipped for complete blocks
+            missing = np.isnan(X[start:stop]).any()
+            offsets = np.arange(start, stop, dtype=np.intp)[:, None] * self.n_features
+            node = np.broadcast_to(self.roots, (stop - start, self.n_trees))
+            for _ in range(self.max_depth):
+                x = flat.take(offsets + self.feature.take(node))
+                # NaN > t is False, so missing values go left unless their node sends them right
+                goes_right = x > self.threshold.take(node)
+                if missing:
+                    goes_right |= np.isnan(x) & ~self.default_left.take(node)
+                moved = self.children.take(2 * node + goes_right)
+                # The leaves point to themselves, so nothing moves once every sample is in a leaf
+                if np.array_equal(moved, node):
+                    break
+                node = moved
+            scores[start:stop] = self.value.take(node).sum(axis=1)
+        return self.scale * scores + self.bias
+
+    def predict_proba(self, X):
+        """Returns the class probabilities, as predict_proba of the original model.
+
+        Args:
+            X (array-like, pandas.DataFrame or scipy.sparse matrix): The samples.
+
+        Returns:
+            numpy.ndarray: The probabilities, shape (n_samples, 2).
+        """
+        scores = self.decision_function(X)
+        positive = 1.0 / (1.0 + np.exp(-scores)) if self.link == 'logistic' else scores
+        return np.column_stack([1.0 - positive, positive])
+
+    def predict(self, X):
+        """Returns the predicted class of each sample."""
+        return self.classes_[(self.predict_proba(X)[:, 1] > 0.5).astype(int)]
+
+    def parity(self, model, X):
+        """Returns the largest difference between the positive-class probabilities of the compiled and the original model.
+
+        Args:
+            model: The original model.
+            X (array-like, pandas.DataFrame or scipy.sparse matrix): The samples.
+
+        Returns:
+            float: The largest absolute difference.
+        """
+        if type(model).__module__.startswith('xgboost') and type(model).__name__ == 'Booster':
+            from .lib import xgb
+            expected = model.predict(xgb.DMatrix(X))
+        else:
+            expected = model.predict_proba(X)[:, 1]
+        return float(np.max(np.abs(self.predict_proba(X)[:, 1] - expected), initial=0.0))
+
+    def save(self, path):
+        """Saves the arrays to a .npz file.
+
+        Args:
+            path (str): The file path.
+        """
+        np.savez(path, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+                 default_left=self.default_left, value=self.value, roots=self.roots, classes=self.classes_,
+                 settings=np.array(json.dumps({'n_features': self.n_features, 'scale': self.scale, 'bias': self.bias,
+                                               'link': self.link, 'sparse_missing': self.sparse_missing})))
+
+    @staticmethod
+    def load(path):
+        """Loads a FlatForest saved with save().
+
+        Args:
+            path (str): The file path.
+
+        Returns:
+            FlatForest: The model.
+        """
+        with np.load(path, allow_pickle=False) as arrays:
+            settings = json.loads(str(arrays['settings']))
+            return FlatForest(arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'], arrays['default_left'],
+                              arrays['value'], arrays['roots'], classes=arrays['classes'], **settings)
@@ -0,0 +1,105 @@
+from .lib import np, clone, StratifiedKFold
+
+class FoldCache:
+    """Cross-validation folds computed once and shared by every configuration and algorithm of a search.
+
+    The stratified splits are computed once. Every fold keeps its training indices in a stratified
+    random order, so the first n of them are a class-balanced subsample of size n, which is the
+    resource of successive halving. The fold matrices are cached by (fold, n), and so are their
+    transforms by a preprocessing step (e.g. the StandardScaler of a Pipeline). The preprocessing
+    is therefore fitted once per fold instead of once per configuration.
+
+    Methods:
+        n_max(): Returns the size of the smallest training fold.
+        fold(i, n_samples, preprocessing): Returns the training and validation matrices of a fold.
+        evict(n_samples): Drops the cached matrices of one subsample size.
+        clear(): Drops the cached matrices.
+    """
+
+    def __init__(self, X, y, cv=5, random_state=0):
+        """
+        Computes the splits.
+
+        Args:
+            X (array-like or scipy.sparse matrix): The training input data.
+            y (array-like): The training target labels.
+            cv (int): The number of folds, as the cv of GridSearchCV (StratifiedKFold without shuffling).
+            random_state (int): The seed of the subsampling order.
+        """
+        self.X = X
+        self.y = np.asarray(y)
+        self.splits = []
+        rng = np.random.default_rng(random_state)
+        for train, validation in StratifiedKFold(n_splits=cv).split(np.zeros(len(self.y)), self.y):
+            self.splits.append((FoldCache.stratified_order(train, self.y[train], rng), validation))
+        self._cache = {}
+
+    @staticmethod
+    def stratified_order(indices, labels, rng):
+        """Shuffles indices so that every prefix keeps the class proportions of labels.
+
+        Args:
+            indices (numpy.ndarray): The indices to order.
+            labels (numpy.ndarray): The label of each index.
+            rng (numpy.random.Generator): The random generator.
+
+        Returns:
+            numpy.ndarray: The ordered indices.
+        """
+        permutation = rng.permutation(len(indices))
+        _, inverse, counts = np.unique(labels[permutation], return_inverse=True, return_counts=True)
+        # Rank of every sample inside its class, in the shuffled order
+        by_class = np.argsort(inverse, kind='stable')
+        rank = np.empty(len(indices), dtype=np.int64)
+        rank[by_class] = np.arange(len(indices)) - np.repeat(np.cumsum(counts) - counts, counts)
+        # The classes are interleaved by relative position, so any prefix is stratified
+        return indices[permutation[np.argsort((rank + 0.5) / counts[inverse], kind='stable')]]
+
+    @staticmethod
+    def _take(X, indices):
+        return X.iloc[indices] if hasattr(X, 'iloc') else X[indices]
+
+    def n_max(self):
+        """Returns the size of the smallest training fold, the largest resource of every fold."""
+        return min(len(train) for train, _ in self.splits)
+
+    def fold(self, i, n_samples=None, preprocessing=None):
+        """Returns the training and validation matrices of a fold.
+
+        Args:
+            i (int): The fold.
+            n_samples (int, optional): The size of the training subsample. The whole fold if None.
+            preprocessing (estimator, optional): A transformer fitted on the training subsample
+                and applied to both matrices, e.g. the steps of a Pipeline before the model.
+
+        Returns:
+            tuple: (X_train, y_train, X_validation, y_validation).
+        """
+        train, validation = self.splits[i]
+        n_samples = len(train) if n_samples is None else min(n_samples, len(train))
+        key = (i, n_samples, None if preprocessing is None else repr(preprocessing))
+        if key not in self._cache:
+            if preprocessing is None:
+                subsample = train[:n_samples]
+                self._cache[key] = (FoldCache._take(self.X, subsample), self.y[subsample], FoldCache._take(self.X, validation), self.y[validation])
+            else:
+                X_train, y_train, X_validation, y_validation = self.fold(i, n_samples)
+                transformer = clone(preprocessing).fit(X_train, y_train)
+                self._cache[key] = (transformer.transform(X_train), y_train, transformer.transform(X_validation), y_validation)
+        return self._cache[key]
+
+    def evict(self, n_samples=None):
+        """Drops the cached matrices of one subsample size, e.g. when a round of successive halving ends.
+
+        Args:
+            n_samples (int, optional): The size of the training subsample, as passed to fold.
+                The whole folds if None.
+        """
+        for key in list(self._cache):
+            train = self.splits[key[0]][0]
+            if key[1] == (len(train) if n_samples is None else min(n_samples, len(train))):
+                del self._cache[key]
+
+    def clear(self):
+        """Drops the cached matrices."""
+        self._cache.clear()
@@ -0,0 +1,79 @@
+from .lib import np, pd, hashlib, functools, weakref, OrderedDict
+
+class FrameMemo:
+    """A memoization layer for the aggregates computed from a DataFrame.
+
+    The results of a decorated function are cached in memory under the fingerprint of its
+    input frame, so drawing the same aggregates again (another theme, another export format,
+    a report re-run) never recomputes the groupbys over the full event table.
+
+    The fingerprint must cost much less than the aggregates it skips, so it does not hash every
+    row: it combines the identity of the frame with its layout (columns, dtypes, shape) and the
+    hash of SAMPLE_ROWS evenly spaced rows. A result is therefore only reused for the same frame
+    object, and a change in place is detected when it alters the layout or a sampled row; a frame
+    edited elsewhere in place should be copied, or the cache cleared, before drawing it again.
+
+    Attributes:
+        SAMPLE_ROWS (int): The number of rows hashed by the fingerprint.
+
+    Methods:
+        fingerprint(df, columns): Returns the fingerprint of a DataFrame.
+        memoize(columns, maxsize): Decorator that caches a function of a DataFrame by fingerprint.
+    """
+
+    SAMPLE_ROWS = 1024
+
+    @staticmethod
+    def fingerprint(df, columns=None):
+        """Returns the fingerprint of a DataFrame, in time independent of its number of rows.
+
+        Args:
+            df (pandas.DataFrame): The frame.
+            columns (list, optional): Fingerprint only these columns. All columns if None.
+
+        Returns:
+            str: The hexadecimal BLAKE2 digest of the identity of the frame, its columns, dtypes,
+            shape and of the values and index of SAMPLE_ROWS evenly spaced rows.
+        """
+        columns = list(df.columns) if columns is None else [column for column in columns if column in df.columns]
+        positions = np.unique(np.linspace(0, len(df) - 1, min(len(df), FrameMemo.SAMPLE_ROWS)).astype(np.int64))
+        # The rows are taken before the columns, so only the sample is copied
+        sample = df.iloc[positions][columns]
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr((id(df), columns, [str(dtype) for dtype in sample.dtypes], df.shape)).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(sample, index=True).to_numpy().tobytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def memoize(columns=None, maxsize=32):
+        """Decorator that caches a function of a DataFrame by the fingerprint of the frame.
+
+        The first argument of the function must be the DataFrame; the other arguments are part
+        of the key and must be hashable. A copy of the cached result is returned, so callers
+        can modify it freely. The decorated function gains `cache_clear()`.
+
+        Args:
+            columns (list, optional): The columns the function reads. Only these are hashed.
+            maxsize (int): The number of results kept; the least recently used are dropped.
+
+        Returns:
+            callable: The decorator.
+        """
+        def decorator(func):
+            cache = OrderedDict()
+
+            @functools.wraps(func)
+            def wrapper(df, *args, **kwargs):
+                key = (FrameMemo.fingerprint(df, columns), args, tuple(sorted(kwargs.items())))
+                # The frame is kept by weak reference, so an id reused by a new frame is not a hit
+                if key in cache and cache[key][0]() is df:
+                    cache.move_to_end(key)
+                else:
+                    cache[key] = (weakref.ref(df), func(df, *args, **kwargs))
+                    if len(cache) > maxsize:
+                        cache.popitem(last=False)
+                return cache[key][1].copy()
+
+            wrapper.cache_clear = cache.clear
+            return wrapper
+        return decorator
@@ -1,22 +1,26 @@
-from .lib import RandomForestClassifier, GradientBoostingClassifier, GaussianNB, Pipeline, KNeighborsClassifier, StandardScaler, LogisticRegression, make_scorer, f1_score, GridSearchCV
+from .lib import np, math, time, ParameterGrid, Parallel, delayed, effective_n_jobs, clone, RandomForestClassifier, ExtraTreesClassifier, GradientBoostingClassifier, GaussianNB, Pipeline, KNeighborsClassifier, StandardScaler, LogisticRegression, make_scorer, f1_score, GridSearchCV
+from .fold_cache import FoldCache
+from .model_cache import ModelCache
 
 class HyperparameterTuning:
     """
-    This class provides methods for tuning hyperparameters of machine learning models using grid search.
+    This class provides methods for tuning hyperparameters of machine learning models using grid search
+    or a budget-aware successive halving search.
     """
 
-    def tune_hyperparameters(X_train, y_train):
-        """
-        Performs hyperparameter tuning for various machine learning algorithms using grid search.
+    # Estimators whose fits release the GIL: their folds are fitted in threads, which share the cached
+    # fold matrices without copying them. The others (e.g. GradientBoosting, whose boosting loop holds
+    # the GIL) are fitted in worker processes.
+    THREAD_SAFE = (RandomForestClassifier, ExtraTreesClassifier, KNeighborsClassifier)
 
-        Parameters:
-        - X_train: array-like, shape (n_samples, n_features), training input data
-        - y_train: array-like, shape (n_samples,), training target labels
+    def search_spaces():
+        """
+        Returns the algorithms to tune and their parameter grids.
 
         Returns:
-        - best_models: dict, best estimator for each algorithm after hyperparameter tuning
+        - algorithms: dict, algorithm name -> (estimator, parameter grid)
         """
-        algorithms = {
+        return {
             'Random Forest': (RandomForestClassifier(), {
                 'n_estimators': [100, 200, 300],
                 'max_depth': [None, 10, 20],
@@ -44,12 +48,257 @@ class HyperparameterTuning:
             })
         }
 
+    def tune_hyperparameters(X_train, y_train, mode='grid', time_budget=None, factor=3, cv=5, n_jobs=-1, random_state=0, cache=None):
+        """
+        Performs hyperparameter tuning for various machine learning algorithms.
+
+        Parameters:
+        - X_train: array-like, shape (n_samples, n_features), training input data
+        - y_train: array-like, shape (n_samples,), training target labels
+        - mode: str, 'grid' for an exhaustive grid search, 'halving' for successive halving (see successive_halving)
+        - time_budget: float or None, wall-clock budget in seconds of the halving search, None for no limit
+        - factor: int, fraction of the configurations kept at each halving round (1 / factor)
+        - cv: int, number of cross-validation folds
+        - n_jobs: int, number of parallel jobs, -1 for all the cores
+        - random_state: int, seed of the subsamples of the halving search
+        - cache: ModelCache or None, cache of the best model of each algorithm with its parameters and score
+
+        Returns:
+        - best_models: dict, best estimator for each algorithm after hyperparameter tuning
+        """
+        if mode not in ('grid', 'halving'):
+            raise ValueError("mode must be 'grid' or 'halving'")
+        algorithms = HyperparameterTuning.search_spaces()
+        if mode == 'halving':
+            return HyperparameterTuning.successive_halving(X_train, y_train, algorithms, time_budget, factor, cv, n_jobs, random_state, cache)
+
+        data = ModelCache.fingerprint(X_train, y_train) if cache is not None else None
         scorer = make_scorer(f1_score)
         best_models = {}
         for name, (model, params) in algorithms.items():
-            grid_search = GridSearchCV(model, params, scoring=scorer, cv=5, n_jobs=-1)
+            if cache is not None:
+                key = HyperparameterTuning.cache_key(model, params, {'search': 'grid', 'cv': cv}, data)
+                if HyperparameterTuning.load_cached(cache, key, name, best_models):
+                    continue
+            grid_search = GridSearchCV(model, params, scoring=scorer, cv=cv, n_jobs=n_jobs)
             grid_search.fit(X_train, y_train)
             best_models[name] = grid_search.best_estimator_
             print(f'Best parameters for {name}: {grid_search.best_params_}')
             print(f'Best F1-score: {grid_search.best_score_}')
-        return best_models
\ No newline at end of file
+            if cache is not None:
+                cache.save(key, grid_search.best_estimator_, {'best_params': grid_search.best_params_, 'best_score': grid_search.best_score_}, name)
+        if cache is not None:
+            cache.evict()
+        return best_models
+
+    def cache_key(model, params, settings, data):
+        """
+        Returns the key in the ModelCache of the best model of a search.
+
+        Parameters:
+        - model: estimator, the untrained estimator of the search
+        - params: dict, parameter grid
+        - settings: dict, settings of the search (mode, folds, budget...)
+        - data: str, fingerprint of the training data
+
+        Returns:
+        - key: str
+        """
+        return ModelCache.key(ModelCache.class_name(model), {'estimator': model.get_params(), 'grid': params, **settings}, data)
+
+    def load_cached(cache, key, name, best_models):
+        """
+        Loads the best model of a search from the cache into best_models and prints its parameters and score.
+
+        Returns:
+        - hit: bool, True if the model was in the cache
+        """
+        entry = cache.load(key)
+        if entry is None:
+            return False
+        best_models[name], report = entry
+        print(f'{name}: loaded from the model cache')
+        print(f"Best parameters for {name}: {report['best_params']}")
+        print(f"Best F1-score: {report['best_score']}")
+        return True
+
+    def split_preprocessing(model, params):
+        """
+        Splits a Pipeline whose grid only tunes the last step into its fixed preprocessing and its model,
+        so that the preprocessing of each fold can be cached by FoldCache.
+
+        Parameters:
+        - model: estimator or Pipeline
+        - params: dict, parameter grid of the model
+
+        Returns:
+        - (preprocessing, estimator, prefix): tuple, the preprocessing steps (None if there are none),
+          the estimator to tune and the prefix of its parameters in the grid
+        """
+        if isinstance(model, Pipeline) and len(model.steps) > 1:
+            prefix = model.steps[-1][0] + '__'
+            if all(key.startswith(prefix) for key in params):
+                return Pipeline(model.steps[:-1]), model.steps[-1][1], prefix
+        return None, model, ''
+
+    def fit_and_score(estimator, X_train, y_train, X_validation, y_validation):
+        """Fits an estimator on a fold and returns its F1-score on the validation part."""
+        return f1_score(y_validation, estimator.fit(X_train, y_train).predict(X_validation))
+
+    def halving_search(model, params, factor, random_state=0):
+        """
+        Returns the state of the successive halving search of one algorithm, before its first round.
+
+        Parameters:
+        - model: estimator or Pipeline
+        - params: dict, parameter grid of the model
+        - factor: int, as in tune_hyperparameters
+        - random_state: int, seed of the order in which the first round scores the configurations
+
+        Returns:
+        - search: dict, the estimator to tune with its preprocessing (see split_preprocessing), the
+          configurations, the current round with the configurations still in the search and the scores
+          already computed in it, and the best configuration found so far
+        """
+        preprocessing, estimator, prefix = HyperparameterTuning.split_preprocessing(model, params)
+        candidates = list(ParameterGrid(params))
+        # A first round cut by the time budget scores a random part of the grid, not its first corner
+        order = np.random.default_rng(random_state).permutation(len(candidates)).tolist()
+        return {
+            'model': model, 'estimator': estimator, 'preprocessing': preprocessing, 'prefix': prefix,
+            'candidates': candidates,
+            'n_rounds': 1 + (math.ceil(math.log(len(candidates), factor)) if len(candidates) > 1 else 0),
+            'round': 0, 'remaining': order, 'scores': {},
+            'best': 0, 'best_score': float('nan'), 'n_samples_best': 0, 'evaluated': 0, 'time': 0.0
+        }
+
+    def run_rounds(search, folds, factor, min_candidates, min_resources, batch_size, n_jobs, deadline=None):
+        """
+        Runs the rounds of a halving search from where it stopped, until the search ends or the deadline passes.
+
+        A round is evaluated in batches of configurations, best first (the first round in a random order);
+        every batch fits all the folds of its configurations in a single dispatch. Once the deadline has
+        passed no new batch is started, but a round
+        is never cut short before min_candidates configurations have been scored, and the best of the scored
+        ones becomes the best configuration. The fold matrices of a round are dropped when it ends or is cut.
+
+        Parameters:
+        - search: dict, state of the search (see halving_search), updated in place
+        - folds: FoldCache, folds of the training data
+        - factor, min_candidates: as in successive_halving
+        - min_resources: int, training samples per fold of the first round
+        - batch_size: int, configurations per batch
+        - n_jobs: int, number of parallel jobs
+        - deadline: float or None, time.perf_counter() value at which the search stops
+
+        Returns:
+        - finished: bool, True if the last round has been completed
+        """
+        start = time.perf_counter()
+        cv, n_max = len(folds.splits), folds.n_max()
+        estimator, prefix, candidates = search['estimator'], search['prefix'], search['candidates']
+        prefer = 'threads' if isinstance(estimator, HyperparameterTuning.THREAD_SAFE) else 'processes'
+        with Parallel(n_jobs=n_jobs, prefer=prefer) as parallel:
+            while search['round'] < search['n_rounds']:
+                remaining, scores = search['remaining'], search['scores']
+                steps_left = search['n_rounds'] - 1 - search['round']
+                n_samples = n_max if steps_left == 0 else max(min_resources, n_max // factor ** steps_left)
+                while len(scores) < len(remaining):
+                    if deadline is not None and time.perf_counter() > deadline and (len(scores) >= min_candidates or (not scores and search['round'] > 0)):
+                        break
+                    # The configurations are scored in the order of remaining, so the scored ones are a prefix
+                    batch = remaining[len(scores):len(scores) + batch_size]
+                    fold_scores = parallel(
+                        delayed(HyperparameterTuning.fit_and_score)(
+                            clone(estimator).set_params(**{key[len(prefix):]: value for key, value in candidates[c].items()}),
+                            *folds.fold(i, n_samples, search['preprocessing']))
+                        for c in batch for i in range(cv))
+                    for k, c in enumerate(batch):
+                        scores[c] = float(np.mean(fold_scores[k * cv:(k + 1) * cv]))
+                    search['evaluated'] += len(batch)
+                folds.evict(n_samples)
+
+                if scores:
+                    # Best first; ties keep the order of the previous round
+                    ranked = sorted(scores, key=lambda c: -scores[c])
+                    search['best'], search['best_score'], search['n_samples_best'] = ranked[0], scores[ranked[0]], n_samples
+                if len(scores) < len(remaining):
+                    search['time'] += time.perf_counter() - start
+                    return False
+                search['remaining'], search['scores'] = ranked[:math.ceil(len(ranked) / factor)], {}
+                search['round'] += 1
+        search['time'] += time.perf_counter() - start
+        return True
+
+    def successive_halving(X_train, y_train, algorithms, time_budget=None, factor=3, cv=5, n_jobs=-1, random_state=0, cache=None, min_candidates=None):
+        """
+        Tunes the algorithms with successive halving over the number of training samples.
+
+        In the first round every configuration is cross-validated on a small stratified subsample of each
+        training fold; only the best 1 / factor go to the next round, which uses factor times more samples,
+        until the last round uses the whole folds. The validation folds are always complete. The splits and
+        the fold matrices (with the fixed preprocessing of the pipelines) are computed once per round by
+        FoldCache, shared by all the configurations of the round and dropped when the round ends.
+
+        With a time budget, each algorithm gets a share of the remaining time proportional to the size of
+        its grid, so the time left unused by an algorithm is carried forward to the next ones. A search whose
+        share runs out is paused (see run_rounds); once every algorithm has had its share, the time left is
+        shared in the same way among the paused searches, which resume where they stopped. A search still
+        unfinished keeps the best configuration of the last round evaluated. The best configuration of each
+        algorithm is then refitted on the whole training data.
+
+        Parameters:
+        - X_train, y_train: training data
+        - algorithms: dict, algorithm name -> (estimator, parameter grid), as search_spaces
+        - time_budget, factor, cv, n_jobs, random_state, cache: as in tune_hyperparameters
+        - min_candidates: int or None, minimum number of configurations scored in a round cut short by the
+          time budget, factor if None
+
+        Returns:
+        - best_models: dict, best estimator for each algorithm
+        """
+        min_candidates = factor if min_candidates is None else max(1, min_candidates)
+        folds = FoldCache(X_train, y_train, cv=cv, random_state=random_state)
+        data = ModelCache.fingerprint(X_train, y_train) if cache is not None else None
+        settings = {'search': 'halving', 'cv': cv, 'factor': factor, 'time_budget': time_budget, 'random_state': random_state, 'min_candidates': min_candidates}
+        n_max = folds.n_max()
+        min_resources = min(n_max, 2 * cv * len(np.unique(folds.y)))
+        deadline = None if time_budget is None else time.perf_counter() + time_budget
+        # Enough configurations per batch for at least two fold fits per job
+        batch_size = max(min_candidates, math.ceil(2 * effective_n_jobs(n_jobs) / cv))
+
+        best_models, searches, keys = {}, {}, {}
+        for name, (model, params) in algorithms.items():
+            if cache is not None:
+                keys[name] = HyperparameterTuning.cache_key(model, params, settings, data)
+                if HyperparameterTuning.load_cached(cache, keys[name], name, best_models):
+                    continue
+            searches[name] = HyperparameterTuning.halving_search(model, params, factor, random_state)
+
+        paused = list(searches)
+        for final_pass in (False, True):
+            pending = sum(len(searches[name]['candidates']) for name in paused)
+            for name in list(paused):
+                search = searches[name]
+                now = time.perf_counter()
+                share = None if deadline is None else now + max(0.0, deadline - now) * len(search['candidates']) / pending
+                pending -= len(search['candidates'])
+                if HyperparameterTuning.run_rounds(search, folds, factor, min_candidates, min_resources, batch_size, n_jobs, share):
+                    paused.remove(name)
+                elif not final_pass:
+                    continue
+
+                candidates, best = search['candidates'], search['best']
+                best_models[name] = clone(search['model']).set_params(**candidates[best]).fit(X_train, y_train)
+                if name in paused:
+                    print(f"Time budget reached for {name}: best configuration of the round with {search['n_samples_best']} samples per fold")
+                print(f'Best parameters for {name}: {candidates[best]}')
+                print(f"Best F1-score: {search['best_score']}")
+                print(f"Configurations evaluated: {search['evaluated']}, time: {search['time']:.1f} s")
+                if cache is not None:
+                    cache.save(keys[name], best_models[name], {'best_params': candidates[best], 'best_score': search['best_score']}, name)
+
+        folds.clear()
+        if cache is not None:
+            cache.evict()
+        return {name: best_models[name] for name in algorithms}
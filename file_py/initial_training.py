@@ -1,24 +1,32 @@
-from .lib import DecisionTreeClassifier, AdaBoostClassifier, XGBClassifier, CatBoostClassifier, MLPClassifier, QuadraticDiscriminantAnalysis, ExtraTreesClassifier, classification_report
+from .lib import os, time, tracemalloc, ProcessPoolExecutor, as_completed, threadpool_limits, sparse, clone, np, pd, DecisionTreeClassifier, AdaBoostClassifier, XGBClassifier, CatBoostClassifier, MLPClassifier, QuadraticDiscriminantAnalysis, ExtraTreesClassifier, classification_report
+from .model_cache import ModelCache
+
+# Training data of a worker process, set once by InitialTraining.init_training_worker
+_training_data = None
 
 class InitialTraining:
     """
     This class provides methods for training and evaluating initial machine learning models.
+
+    The models can be trained concurrently in a process pool. The total number of threads is capped
+    by a thread budget, split between the workers, so that XGBoost, CatBoost, Extra Trees and the
+    BLAS/OpenMP pools used by the other models do not oversubscribe the cores.
     """
 
-    def train_and_evaluate_initial_models(X_train, y_train, X_test, y_test):
-        """
-        Trains and evaluates a set of initial machine learning models on the provided training and testing data.
+    # Models that cannot take scipy.sparse input get a dense copy
+    DENSE_ONLY = {'Quadratic Discriminant Analysis'}
 
-        Parameters:
-        - X_train: array-like, shape (n_samples, n_features), training input data
-        - y_train: array-like, shape (n_samples,), training target labels
-        - X_test: array-like, shape (n_samples, n_features), testing input data
-        - y_test: array-like, shape (n_samples,), testing target labels
+    # Parameter that sets the number of threads of the models with their own thread pool
+    THREAD_PARAMS = {'XGBoost': 'n_jobs', 'CatBoost': 'thread_count', 'Extra Trees': 'n_jobs'}
+
+    def initial_models():
+        """
+        Returns the untrained initial models.
 
         Returns:
-        - results: dict, classification reports for each model
+        - algorithms: dict, model name -> estimator
         """
-        algorithms = {
+        return {
             'Decision Tree': DecisionTreeClassifier(),
             'AdaBoost': AdaBoostClassifier(),
             'XGBoost': XGBClassifier(use_label_encoder=False, eval_metric='logloss'),
@@ -28,11 +36,216 @@ class InitialTraining:
             'Extra Trees': ExtraTreesClassifier()
         }
 
-        results = {}
-        for name, model in algorithms.items():
+    def peak_fit_memory(model, X_train, y_train):
+        """
+        Fits a model while tracing the memory allocations and returns the peak.
+
+        Tracing slows down allocation-heavy models a lot, so this fit is never used for timing.
+
+        Parameters:
+        - model: untrained estimator
+        - X_train, y_train: training data
+
+        Returns:
+        - peak_memory_mb: float, peak of the memory allocated through Python and NumPy while training,
+          in MB; native allocations of XGBoost and CatBoost are not tracked
+        """
+        # A trace already started by the caller is kept, only its peak is reset
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        else:
+            tracemalloc.start()
+        try:
+            baseline, _ = tracemalloc.get_traced_memory()
             model.fit(X_train, y_train)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            if not tracing:
+                tracemalloc.stop()
+        return (peak - baseline) / 2**20
+
+    def report_text(report, digits=2):
+        """
+        Returns the printable table of a classification report computed with output_dict=True.
+
+        Parameters:
+        - report: dict, classification report, possibly with the resource keys of fit_and_evaluate
+        - digits: int, number of decimal digits
+
+        Returns:
+        - text: str, one row per class and average with precision, recall, f1-score and support,
+          followed by the accuracy
+        """
+        rows = {label: values for label, values in report.items() if isinstance(values, dict)}
+        table = pd.DataFrame(rows).T
+        table['support'] = table['support'].astype(int)
+        text = table.to_string(float_format=lambda value: f'{value:.{digits}f}')
+        if 'accuracy' in report:
+            text += f"\n\naccuracy: {report['accuracy']:.{digits}f}"
+        return text
+
+    def fit_and_evaluate(name, model, X_train, y_train, X_test, y_test, threads=None, profile_memory=False, latency_rows=20):
+        """
+        Trains and evaluates one model, recording its resource usage.
+
+        Parameters:
+        - name: str, name of the model
+        - model: untrained estimator
+        - X_train, y_train, X_test, y_test: training and testing data
+        - threads: int or None, maximum number of threads of the model, None for no limit
+        - profile_memory: bool, if True the peak memory is measured in a second, traced fit of a clone
+          of the model (see peak_fit_memory), so the timings are never taken under tracing
+        - latency_rows: int, number of test rows predicted one at a time for the latency
+
+        Returns:
+        - report: dict, classification report of the model (see report_text), with the additional keys
+          'wall_time' (seconds of fit, predict and report),
+          'fit_time' (seconds), 'predict_time_per_sample_ms' (batch predict time divided by the number
+          of test samples, in milliseconds), 'predict_latency_ms' (median time to predict a single row,
+          in milliseconds) and 'peak_memory_mb' (see peak_fit_memory). The memory is opt-in, because it
+          takes a second fit: 'peak_memory_mb' is None unless profile_memory is True
+        """
+        if threads is not None and name in InitialTraining.THREAD_PARAMS:
+            model.set_params(**{InitialTraining.THREAD_PARAMS[name]: threads})
+        if name in InitialTraining.DENSE_ONLY and sparse.issparse(X_train):
+            X_train, X_test = X_train.toarray(), X_test.toarray()
+
+        with threadpool_limits(limits=threads):
+            start = time.perf_counter()
+            model.fit(X_train, y_train)
+            fit_time = time.perf_counter() - start
+
+            start_predict = time.perf_counter()
             y_pred = model.predict(X_test)
-            results[name] = classification_report(y_test, y_pred, output_dict=True)
+            predict_time = time.perf_counter() - start_predict
+
+            report = classification_report(y_test, y_pred, output_dict=True)
+            report['wall_time'] = time.perf_counter() - start
+
+            # Latency of a single event: each row is predicted on its own
+            latencies = []
+            for i in range(min(latency_rows, X_test.shape[0])):
+                start_row = time.perf_counter()
+                model.predict(X_test[i:i + 1])
+                latencies.append(time.perf_counter() - start_row)
+
+            peak_memory = InitialTraining.peak_fit_memory(clone(model), X_train, y_train) if profile_memory else None
+
+        report['fit_time'] = fit_time
+        report['predict_time_per_sample_ms'] = 1000 * predict_time / max(1, X_test.shape[0])
+        report['predict_latency_ms'] = 1000 * float(np.median(latencies)) if latencies else None
+        report['peak_memory_mb'] = peak_memory
+        return report
+
+    def init_training_worker(X_train, y_train, X_test, y_test):
+        """Stores the training data in the worker process, once for all the models it trains."""
+        global _training_data
+        _training_data = (X_train, y_train, X_test, y_test)
+
+    def train_model_task(name, model, threads, return_model=False, profile_memory=False):
+        """Trains one model in the worker process; the fitted model is sent back only if return_model is True."""
+        report = InitialTraining.fit_and_evaluate(name, model, *_training_data, threads=threads, profile_memory=profile_memory)
+        return name, report, model if return_model else None
+
+    def iter_initial_models(X_train, y_train, X_test, y_test, n_jobs=1, thread_budget=None, cache=None, profile_memory=False):
+        """
+        Trains the initial models and yields each result as soon as its model finishes.
+
+        Parameters:
+        - X_train, y_train, X_test, y_test: training and testing data
+        - n_jobs: int, number of worker processes, -1 for all the cores; 1 trains the models one after another
+        - thread_budget: int or None, total number of threads of all the models, split between the workers.
+          None uses all the cores when n_jobs != 1 and leaves the models unconstrained when n_jobs == 1
+        - cache: ModelCache or None, cache of the fitted models and their reports. The models found in the
+          cache are yielded first, without training; the others are trained and stored
+        - profile_memory: bool, whether the peak memory of each model is measured (see fit_and_evaluate)
+
+        Yields:
+        - (name, report): tuple, the name of the model and its report as in fit_and_evaluate
+        """
+        algorithms = InitialTraining.initial_models()
+
+        keys = {}
+        if cache is not None:
+            # The data is hashed once for all the models; the thread settings are not part of the key
+            data = ModelCache.fingerprint(X_train, y_train, X_test, y_test)
+            for name, model in list(algorithms.items()):
+                keys[name] = ModelCache.key(ModelCache.class_name(model), model.get_params(), data)
+                entry = cache.load(keys[name])
+                if entry is not None:
+                    print(f"{name}: loaded from the model cache")
+                    del algorithms[name]
+                    yield name, entry[1]
+            if not algorithms:
+                return
+
+        def store(name, model, report):
+            if cache is not None:
+                cache.save(keys[name], model, report, name, ModelCache.class_name(model), model.get_params())
+
+        if n_jobs == -1:
+            n_jobs = os.cpu_count() or 1
+        n_workers = max(1, min(n_jobs, len(algorithms)))
+
+        if n_workers == 1:
+            for name, model in algorithms.items():
+                report = InitialTraining.fit_and_evaluate(name, model, X_train, y_train, X_test, y_test, threads=thread_budget, profile_memory=profile_memory)
+                store(name, model, report)
+                yield name, report
+            if cache is not None:
+                cache.evict()
+            return
+
+        if thread_budget is None:
+            thread_budget = os.cpu_count() or 1
+        threads = max(1, thread_budget // n_workers)
+
+        # The data is sent once per worker through the initializer, not once per model
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=InitialTraining.init_training_worker, initargs=(X_train, y_train, X_test, y_test)) as executor:
+            futures = [executor.submit(InitialTraining.train_model_task, name, model, threads, cache is not None, profile_memory) for name, model in algorithms.items()]
+            for future in as_completed(futures):
+                name, report, model = future.result()
+                store(name, model, report)
+                yield name, report
+        if cache is not None:
+            cache.evict()
+
+    def train_and_evaluate_initial_models(X_train, y_train, X_test, y_test, n_jobs=1, thread_budget=None, cache=None, profile_memory=False):
+        """
+        Trains and evaluates a set of initial machine learning models on the provided training and testing data.
+
+        Parameters:
+        - X_train: array-like or scipy.sparse matrix, shape (n_samples, n_features), training input data
+        - y_train: array-like, shape (n_samples,), training target labels
+        - X_test: array-like or scipy.sparse matrix, shape (n_samples, n_features), testing input data
+        - y_test: array-like, shape (n_samples,), testing target labels
+        - n_jobs: int, number of models trained concurrently, -1 for all the cores
+        - thread_budget: int or None, total number of threads shared by the models (see iter_initial_models)
+        - cache: ModelCache or None, cache of the fitted models and their reports
+        - profile_memory: bool, whether the peak memory of each model is measured in a second, traced fit;
+          off by default, because it doubles the training time
+
+        Returns:
+        - results: dict, classification reports for each model, with wall time, fit time, predict time,
+          single-row latency and peak memory ('peak_memory_mb', None unless profile_memory), in the order
+          of initial_models
+        """
+        names = list(InitialTraining.initial_models())
+        results = {}
+        # The reports are printed as the models finish
+        for name, report in InitialTraining.iter_initial_models(X_train, y_train, X_test, y_test, n_jobs, thread_budget, cache, profile_memory):
+            results[name] = report
             print(f"\n{name} Classification Report:")
-            print(classification_report(y_test, y_pred))
-        return results
\ No newline at end of file
+            print(InitialTraining.report_text(report))
+            usage = f"Wall time: {report['wall_time']:.2f} s, fit time: {report['fit_time']:.2f} s"
+            if report.get('predict_time_per_sample_ms') is not None:
+                usage += f", predict: {report['predict_time_per_sample_ms']:.4f} ms/sample"
+            if report.get('predict_latency_ms') is not None:
+                usage += f", latency: {report['predict_latency_ms']:.3f} ms/row"
+            if report.get('peak_memory_mb') is not None:
+                usage += f", peak memory: {report['peak_memory_mb']:.1f} MB"
+            else:
+                usage += ", peak memory: not measured (profile_memory=True)"
+            print(usage)
+        return {name: results[name] for name in names}
@@ -1,30 +1,107 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-import plotly.graph_objects as go
-import plotly.express as px
-import altair as alt
-import seaborn as sns
 import math
 import csv
+import json
+import os
+import io
+import re
+import html
+import contextlib
+import traceback
+import time
+import tracemalloc
+import functools
+import hashlib
+import inspect
+import importlib
+import importlib.metadata as importlib_metadata
+import shutil
+import argparse
+import sys
+import threading
+import queue
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from datetime import datetime,timedelta
-import xgboost as xgb
-from sklearn.model_selection import train_test_split, GridSearchCV
-from sklearn.metrics import classification_report, make_scorer, f1_score, accuracy_score, roc_auc_score
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.ensemble import AdaBoostClassifier, ExtraTreesClassifier, RandomForestClassifier, GradientBoostingClassifier
-from xgboost import XGBClassifier
-from catboost import CatBoostClassifier
-from sklearn.neural_network import MLPClassifier
-from sklearn.discriminant_analysis import QuadraticDiscriminantAnalysis
-from sklearn.naive_bayes import GaussianNB
-from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.linear_model import LogisticRegression
-from keras.models import Sequential # type: ignore
-from keras.layers import Dense  # type: ignore
-from collections import defaultdict, Counter
+from collections import defaultdict, Counter, OrderedDict, deque
 import copy
-from IPython.display import Markdown, display
\ No newline at end of file
+import weakref
+
+# Heavy backends are imported on first access, so that modules which only need
+# pandas and numpy (e.g. RunLogParser, CsvPreprocessingScaler) start quickly.
+# Each name maps to (module, attribute); attribute None binds the module itself.
+LAZY_IMPORTS = {
+    'plt': ('matplotlib.pyplot', None),
+    'mcolors': ('matplotlib.colors', None),
+    'go': ('plotly.graph_objects', None),
+    'px': ('plotly.express', None),
+    'alt': ('altair', None),
+    'sns': ('seaborn', None),
+    'xgb': ('xgboost', None),
+    'threadpool_limits': ('threadpoolctl', 'threadpool_limits'),
+    'sparse': ('scipy.sparse', None),
+    'train_test_split': ('sklearn.model_selection', 'train_test_split'),
+    'GridSearchCV': ('sklearn.model_selection', 'GridSearchCV'),
+    'StratifiedKFold': ('sklearn.model_selection', 'StratifiedKFold'),
+    'ParameterGrid': ('sklearn.model_selection', 'ParameterGrid'),
+    'clone': ('sklearn.base', 'clone'),
+    'Parallel': ('joblib', 'Parallel'),
+    'delayed': ('joblib', 'delayed'),
+    'effective_n_jobs': ('joblib', 'effective_n_jobs'),
+    'joblib': ('joblib', None),
+    'classification_report': ('sklearn.metrics', 'classification_report'),
+    'make_scorer': ('sklearn.metrics', 'make_scorer'),
+    'f1_score': ('sklearn.metrics', 'f1_score'),
+    'accuracy_score': ('sklearn.metrics', 'accuracy_score'),
+    'roc_auc_score': ('sklearn.metrics', 'roc_auc_score'),
+    'DecisionTreeClassifier': ('sklearn.tree', 'DecisionTreeClassifier'),
+    'AdaBoostClassifier': ('sklearn.ensemble', 'AdaBoostClassifier'),
+    'ExtraTreesClassifier': ('sklearn.ensemble', 'ExtraTreesClassifier'),
+    'RandomForestClassifier': ('sklearn.ensemble', 'RandomForestClassifier'),
+    'GradientBoostingClassifier': ('sklearn.ensemble', 'GradientBoostingClassifier'),
+    'XGBClassifier': ('xgboost', 'XGBClassifier'),
+    'CatBoostClassifier': ('catboost', 'CatBoostClassifier'),
+    'MLPClassifier': ('sklearn.neural_network', 'MLPClassifier'),
+    'QuadraticDiscriminantAnalysis': ('sklearn.discriminant_analysis', 'QuadraticDiscriminantAnalysis'),
+    'GaussianNB': ('sklearn.naive_bayes', 'GaussianNB'),
+    'Pipeline': ('sklearn.pipeline', 'Pipeline'),
+    'StandardScaler': ('sklearn.preprocessing', 'StandardScaler'),
+    'LabelEncoder': ('sklearn.preprocessing', 'LabelEncoder'),
+    'KNeighborsClassifier': ('sklearn.neighbors', 'KNeighborsClassifier'),
+    'LogisticRegression': ('sklearn.linear_model', 'LogisticRegression'),
+    'Sequential': ('keras.models', 'Sequential'),
+    'Dense': ('keras.layers', 'Dense'),
+    'load_model': ('keras.models', 'load_model'),
+    'Markdown': ('IPython.display', 'Markdown'),
+    'display': ('IPython.display', 'display'),
+}
+
+# Optional dependencies resolve to None when they are not installed
+OPTIONAL_IMPORTS = {
+    'pyarrow': ('pyarrow', None),
+    'pq': ('pyarrow.parquet', None),
+}
+
+def __getattr__(name):
+    """Imports a heavy or optional dependency the first time it is requested."""
+    if name in LAZY_IMPORTS:
+        module_name, attribute = LAZY_IMPORTS[name]
+        module = importlib.import_module(module_name)
+    elif name in OPTIONAL_IMPORTS:
+        module_name, attribute = OPTIONAL_IMPORTS[name]
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            module = None
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = module if attribute is None or module is None else getattr(module, attribute)
+    # Cache the value so later lookups skip __getattr__
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + list(LAZY_IMPORTS) + list(OPTIONAL_IMPORTS))
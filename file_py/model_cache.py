@@ -0,0 +1,370 @@
+from .lib import np, pd, os, json, shutil, hashlib, argparse, datetime, timedelta, importlib_metadata, sparse, joblib
+
+class ModelCache:
+    """An on-disk cache for fitted models and their evaluation reports.
+
+    Each entry is keyed by a fingerprint of the training data (and of the test data when the report
+    depends on it), the estimator class, its hyperparameters and the versions of the learning
+    libraries, so changing any of them never returns a stale model. A cache hit reloads the model
+    and its report instead of training again.
+
+    Every entry is a directory with the model and a meta.json with its name, key, estimator,
+    hyperparameters, library versions and report. Scikit-learn and CatBoost estimators are stored
+    with joblib, XGBoost boosters with their native format and Keras models as .keras files.
+
+    The least recently used entries are evicted when the cache grows beyond `max_bytes`. The cache
+    can also be listed and pruned from the command line:
+
+        python -m file_py.model_cache list
+        python -m file_py.model_cache prune --max-bytes 1000000000 --older-than 30
+        python -m file_py.model_cache clear
+
+    Attributes:
+        LIBRARIES (list): The libraries whose versions are part of every key.
+
+    Methods:
+        fingerprint(*parts): Returns the content hash of arrays, frames, sparse matrices and parameters.
+        key(estimator, params, *data): Returns the key of a model.
+        load(key): Returns the model and report of an entry, or None.
+        save(key, model, report, name, estimator, params): Stores a model and its report.
+        write_model(model, directory), read_model(path): Write and read a model in the format of its library.
+        cached(name, estimator, params, data, train): Returns a cached model and report, training it on a miss.
+        entries(): Returns the entries, most recently used first.
+        prune(max_bytes, older_than, name): Removes entries by size, age or name.
+        evict(): Removes the least recently used entries above the size limit.
+        clear(): Removes every entry.
+        main(argv): The command line interface.
+    """
+
+    LIBRARIES = ['numpy', 'scipy', 'scikit-learn', 'xgboost', 'catboost', 'keras', 'tensorflow']
+
+    META = 'meta.json'
+
+    def __init__(self, cache_dir='model_cache', max_bytes=5 * 1024**3):
+        """
+        Initializes the cache.
+
+        Args:
+            cache_dir (str): The directory where the models are stored.
+            max_bytes (int): The maximum total size of the cache, in bytes.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def library_versions():
+        """Returns the installed version of each library of LIBRARIES, None if it is not installed."""
+        versions = {}
+        for library in ModelCache.LIBRARIES:
+            try:
+                versions[library] = importlib_metadata.version(library)
+            except importlib_metadata.PackageNotFoundError:
+                versions[library] = None
+        return versions
+
+    @staticmethod
+    def _update(digest, part):
+        if sparse.issparse(part):
+            part = part.tocsr()
+            digest.update(repr(('csr', part.shape, str(part.dtype))).encode('utf-8'))
+            for array in (part.data, part.indices, part.indptr):
+                digest.update(np.ascontiguousarray(array).tobytes())
+        elif isinstance(part, (pd.DataFrame, pd.Series)):
+            columns = list(part.columns) if isinstance(part, pd.DataFrame) else [part.name]
+            digest.update(repr(('frame', columns, part.shape)).encode('utf-8'))
+            digest.update(pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes())
+        elif isinstance(part, np.ndarray):
+            digest.update(repr(('array', part.shape, str(part.dtype))).encode('utf-8'))
+            if part.dtype == object:
+                digest.update(pd.util.hash_array(part.ravel()).tobytes())
+            else:
+                digest.update(np.ascontiguousarray(part).tobytes())
+        elif isinstance(part, dict):
+            digest.update(b'dict')
+            for key in sorted(part, key=str):
+                ModelCache._update(digest, key)
+                ModelCache._update(digest, part[key])
+        elif isinstance(part, (list, tuple)):
+            digest.update(repr(('sequence', len(part))).encode('utf-8'))
+            for item in part:
+                ModelCache._update(digest, item)
+        else:
+            digest.update(repr(part).encode('utf-8'))
+
+    @staticmethod
+    def fingerprint(*parts):
+        """Returns the content hash of arrays, frames, sparse matrices, parameters and other values.
+
+        Args:
+            *parts: The values to hash. Objects other than arrays, frames and containers are hashed by repr.
+
+        Returns:
+            str: The hexadecimal BLAKE2 digest.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        for part in parts:
+            ModelCache._update(digest, part)
+        return digest.hexdigest()
+
+    @staticmethod
+    def key(estimator, params, *data):
+        """Returns the key of a model.
+
+        Args:
+            estimator (str): The estimator class, e.g. 'sklearn.ensemble.ExtraTreesClassifier'.
+            params (dict): The hyperparameters and training settings.
+            *data: The matrices and labels the model and its report depend on.
+
+        Returns:
+            str: The key.
+        """
+        return ModelCache.fingerprint(estimator, params, ModelCache.library_versions(), *data)
+
+    @staticmethod
+    def class_name(obj):
+        """Returns the full class name of an estimator, e.g. 'sklearn.tree._classes.DecisionTreeClassifier'."""
+        return f'{type(obj).__module__}.{type(obj).__qualname__}'
+
+    @staticmethod
+    def write_model(model, directory):
+        """Writes a model to a directory in the format of its library.
+
+        Args:
+            model: The fitted estimator, XGBoost booster or Keras model.
+            directory (str): The directory.
+
+        Returns:
+            str: The name of the written file: 'model.ubj', 'model.keras' or 'model.joblib'.
+        """
+        module = type(model).__module__
+        if module.startswith('xgboost') and type(model).__name__ == 'Booster':
+            model.save_model(os.path.join(directory, 'model.ubj'))
+            return 'model.ubj'
+        if module.startswith('keras') or module.startswith('tensorflow'):
+            model.save(os.path.join(directory, 'model.keras'))
+            return 'model.keras'
+        joblib.dump(model, os.path.join(directory, 'model.joblib'))
+        return 'model.joblib'
+
+    @staticmethod
+    def read_model(path):
+        """Reads a model written by write_model.
+
+        Args:
+            path (str): The path of the model file.
+
+        Returns:
+            The model.
+        """
+        # XGBoost and Keras are imported only when one of their models is loaded
+        if path.endswith('.ubj'):
+            from .lib import xgb
+            return xgb.Booster(model_file=path)
+        if path.endswith('.keras'):
+            from .lib import load_model
+            return load_model(path)
+        return joblib.load(path)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def load(self, key):
+        """Returns the model and report of an entry.
+
+        Args:
+            key (str): The key of the entry.
+
+        Returns:
+            tuple: (model, report), or None if the entry is not cached.
+        """
+        entry_dir = self._entry_dir(key)
+        meta_path = os.path.join(entry_dir, ModelCache.META)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+
+        model = ModelCache.read_model(os.path.join(entry_dir, meta['format']))
+
+        # Touch the entry so the eviction sees it as recently used
+        os.utime(meta_path)
+        return model, meta['report']
+
+    def save(self, key, model, report=None, name=None, estimator=None, params=None):
+        """Stores a model and its report.
+
+        Args:
+            key (str): The key of the entry.
+            model: The fitted estimator, XGBoost booster or Keras model.
+            report (dict, optional): The evaluation report, JSON serializable.
+            name (str, optional): A readable name shown by `entries`.
+            estimator (str, optional): The estimator class. The class of model if None.
+            params (dict, optional): The hyperparameters, stored as text for `entries`.
+        """
+        entry_dir = self._entry_dir(key)
+        # Write to a temporary directory first so an interrupted run never leaves a truncated entry
+        tmp_dir = entry_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        model_format = ModelCache.write_model(model, tmp_dir)
+
+        meta = {
+            'key': key,
+            'name': name,
+            'estimator': estimator or ModelCache.class_name(model),
+            'params': repr(params),
+            'versions': ModelCache.library_versions(),
+            'format': model_format,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'report': report,
+        }
+        with open(os.path.join(tmp_dir, ModelCache.META), 'w', encoding='utf-8') as f:
+            # NumPy scalars in the reports are written as Python numbers
+            json.dump(meta, f, indent=2, default=lambda value: value.item() if hasattr(value, 'item') else str(value))
+
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+
+    def cached(self, name, estimator, params, data, train):
+        """Returns a cached model and report, training and storing them on a cache miss.
+
+        Args:
+            name (str): A readable name of the model.
+            estimator (str): The estimator class.
+            params (dict): The hyperparameters and training settings.
+            data (tuple): The matrices and labels the model and its report depend on.
+            train (callable): Called without arguments on a miss, returns (model, report).
+
+        Returns:
+            tuple: (model, report).
+        """
+        key = ModelCache.key(estimator, params, *data)
+        entry = self.load(key)
+        if entry is not None:
+            print(f'{name}: loaded from the model cache ({key})')
+            return entry
+        model, report = train()
+        self.save(key, model, report, name, estimator, params)
+        self.evict()
+        return model, report
+
+    def entries(self):
+        """Returns the entries, most recently used first.
+
+        Returns:
+            pandas.DataFrame: The columns 'key', 'name', 'estimator', 'created', 'last_used' and 'bytes'.
+        """
+        rows = []
+        for key in os.listdir(self.cache_dir):
+            meta_path = os.path.join(self.cache_dir, key, ModelCache.META)
+            if not os.path.exists(meta_path):
+                continue
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            size = sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(os.path.join(self.cache_dir, key)) for file in files)
+            rows.append({
+                'key': key,
+                'name': meta['name'],
+                'estimator': meta['estimator'],
+                'created': meta['created'],
+                'mtime': os.path.getmtime(meta_path),
+                'bytes': size,
+            })
+        columns = ['key', 'name', 'estimator', 'created', 'mtime', 'bytes']
+        # Sorted on the exact modification time, the column shows it to the second
+        entries = pd.DataFrame(rows, columns=columns).sort_values('mtime', ascending=False, ignore_index=True)
+        entries.insert(4, 'last_used', [datetime.fromtimestamp(mtime).isoformat(timespec='seconds') for mtime in entries.pop('mtime')])
+        return entries
+
+    def remove(self, key):
+        """Removes an entry."""
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def prune(self, max_bytes=None, older_than=None, name=None):
+        """Removes entries by name, by age and then by size.
+
+        Args:
+            max_bytes (int, optional): Removes the least recently used entries until the cache fits in max_bytes.
+            older_than (float, optional): Removes the entries not used for more than this number of days.
+            name (str, optional): Removes the entries with this name.
+
+        Returns:
+            list: The keys of the removed entries.
+        """
+        entries = self.entries()
+        removed = []
+        if name is not None:
+            removed += list(entries.loc[entries['name'] == name, 'key'])
+        if older_than is not None:
+            limit = (datetime.now() - timedelta(days=older_than)).isoformat(timespec='seconds')
+            removed += list(entries.loc[entries['last_used'] < limit, 'key'])
+        if max_bytes is not None:
+            # Least recently used first
+            kept = entries[~entries['key'].isin(removed)].iloc[::-1]
+            total = kept['bytes'].sum()
+            for key, size in zip(kept['key'], kept['bytes']):
+                if total <= max_bytes:
+                    break
+                removed.append(key)
+                total -= size
+
+        removed = list(dict.fromkeys(removed))
+        for key in removed:
+            self.remove(key)
+        return removed
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in `max_bytes`.
+
+        Returns:
+            list: The keys of the removed entries.
+        """
+        return self.prune(max_bytes=self.max_bytes)
+
+    def clear(self):
+        """Removes every entry."""
+        for key in os.listdir(self.cache_dir):
+            shutil.rmtree(os.path.join(self.cache_dir, key), ignore_errors=True)
+
+    @staticmethod
+    def main(argv=None):
+        """The command line interface: lists, prunes or clears a model cache.
+
+        Args:
+            argv (list, optional): The arguments. sys.argv[1:] if None.
+        """
+        parser = argparse.ArgumentParser(prog='python -m file_py.model_cache', description='Lists and prunes the model cache.')
+        parser.add_argument('--cache-dir', default='model_cache', help='the directory of the cache (default: model_cache)')
+        commands = parser.add_subparsers(dest='command', required=True)
+        commands.add_parser('list', help='lists the entries, most recently used first')
+        prune = commands.add_parser('prune', help='removes entries by name, age or total size')
+        prune.add_argument('--max-bytes', type=int, help='removes the least recently used entries above this size')
+        prune.add_argument('--older-than', type=float, metavar='DAYS', help='removes the entries not used for more than DAYS days')
+        prune.add_argument('--name', help='removes the entries with this name')
+        commands.add_parser('clear', help='removes every entry')
+        args = parser.parse_args(argv)
+
+        if not os.path.isdir(args.cache_dir):
+            print(f'No model cache in {args.cache_dir}')
+            return
+        cache = ModelCache(args.cache_dir)
+        if args.command == 'list':
+            entries = cache.entries()
+            if entries.empty:
+                print('The model cache is empty.')
+            else:
+                print(entries.to_string(index=False))
+                print(f"\n{len(entries)} entries, {entries['bytes'].sum() / 2**20:.1f} MB")
+        elif args.command == 'prune':
+            if args.max_bytes is None and args.older_than is None and args.name is None:
+                parser.error('prune needs --max-bytes, --older-than or --name')
+            removed = cache.prune(args.max_bytes, args.older_than, args.name)
+            print(f'Removed {len(removed)} entries')
+        else:
+            cache.clear()
+            print('Model cache cleared')
+
+if __name__ == '__main__':
+    ModelCache.main()
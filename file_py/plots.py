@@ -1,4 +1,5 @@
 from .lib import plt, alt, math, pd
+from .frame_memo import FrameMemo
 
 class Plots:
     """
@@ -11,17 +12,29 @@ class Plots:
         plot_cake_attack(df):
             Generates and displays a pie chart showing the percentage of events that correspond to attacks.
         
+        compute_distributions(df):
+            Returns the counts of attack and non-attack events for each value of the distribution columns.
+
         plot_distributions(df):
             Generates and displays subplots of distributions for attack and non-attack events based on specified columns.
         
         plot_top_10_mitre_id(df):
             Generates and displays subplots of the top 10 MITRE ATT&CK IDs in overall frequency and for attacks.
         
+        compute_top_10_signatures(df):
+            Returns the top 10 signatures in overall frequency, for attacks and for non-attacks.
+
         plot_value_counts_per_unique(df):
             Plots the count of values for each unique value in a specified column of the DataFrame.
 
-        plot_precision_recall(df):
+        compute_precision_recall(df):
+            Returns precision and recall for every rule.
+
+        plot_precision_recall(df, rule_stats):
             Plots precision and recall for every rule
+
+    The compute_* methods are memoized by the fingerprint of the input frame (see FrameMemo),
+    so the charts can be drawn again without recomputing the aggregates.
     """
 
     def plot_cake_attack(df):
@@ -41,20 +54,23 @@ class Plots:
         plt.title('Percentage of Events that Correspond to Attacks')
         plt.show()
 
-    def plot_distributions(df):
+    DISTRIBUTION_COLUMNS = ['path_category_detailed', 'severity_id', 'tag', 'EventType']
+
+    @FrameMemo.memoize(columns=DISTRIBUTION_COLUMNS + ['corrisponde_ad_attacco'])
+    def compute_distributions(df):
         """
-        Method to generate and display subplots of distributions for attack and non-attack events.
+        Method to count attack and non-attack events for each value of the distribution columns.
 
         Args:
             df (DataFrame): The DataFrame containing the event data.
 
         Returns:
-            None
+            DataFrame: One row per (column, value) with the columns 'column', 'value',
+                'attacks' and 'non_attacks', the values of each column in sorted order.
         """
         is_attack = df['corrisponde_ad_attacco'] == 1
-        fig, axes = plt.subplots(4, 2, figsize=(12, 15))  # 4 rows, 2 columns
-        ylim = []
-        for i, column in enumerate(['path_category_detailed', 'severity_id', 'tag', 'EventType']):
+        tables = []
+        for column in Plots.DISTRIBUTION_COLUMNS:
 
             # Attack distribution
             attack_values = df[is_attack][column].value_counts(sort=False)
@@ -64,8 +80,34 @@ class Plots:
 
             # Combine unique values and reindex
             all_values = attack_values.index.union(non_attack_values.index)
-            attack_values = attack_values.reindex(all_values, fill_value=0)
-            non_attack_values = non_attack_values.reindex(all_values, fill_value=0)
+            tables.append(pd.DataFrame({
+                'column': column,
+                'value': all_values.to_numpy(dtype=object),
+                'attacks': attack_values.reindex(all_values, fill_value=0).to_numpy(),
+                'non_attacks': non_attack_values.reindex(all_values, fill_value=0).to_numpy(),
+            }))
+
+        return pd.concat(tables, ignore_index=True)
+
+    def plot_distributions(df):
+        """
+        Method to generate and display subplots of distributions for attack and non-attack events.
+
+        Args:
+            df (DataFrame): The DataFrame containing the event data.
+
+        Returns:
+            None
+        """
+        distributions = Plots.compute_distributions(df)
+        fig, axes = plt.subplots(4, 2, figsize=(12, 15))  # 4 rows, 2 columns
+        ylim = []
+        for i, column in enumerate(Plots.DISTRIBUTION_COLUMNS):
+
+            counts = distributions[distributions['column'] == column].set_index('value')
+            counts.index.name = column
+            attack_values = counts['attacks']
+            non_attack_values = counts['non_attacks']
 
             attack_values.plot(kind='bar', ax=axes[i, 0], color='red')
             axes[i, 0].set_title(f'Distribution of {column} (Attacks)')
@@ -103,6 +145,30 @@ class Plots:
         plt.tight_layout()
         plt.show()
 
+    @FrameMemo.memoize(columns=['signature', 'corrisponde_ad_attacco'])
+    def compute_top_10_signatures(df):
+        """
+        Method to compute the top 10 signatures in overall frequency, for attacks and for non-attacks.
+
+        Args:
+            df (DataFrame): The DataFrame containing the event data.
+
+        Returns:
+            DataFrame: The columns 'subset' ('Overall', 'Attacks' or 'Non-Attacks'), 'Signature' and 'Frequency'.
+        """
+        subsets = {
+            'Overall': df['signature'],
+            'Attacks': df[df['corrisponde_ad_attacco'] == 1]['signature'],
+            'Non-Attacks': df[df['corrisponde_ad_attacco'] == 0]['signature'],
+        }
+        tables = []
+        for subset, signatures in subsets.items():
+            top_10 = signatures.value_counts().head(10).reset_index()
+            top_10.columns = ['Signature', 'Frequency']
+            top_10.insert(0, 'subset', subset)
+            tables.append(top_10)
+        return pd.concat(tables, ignore_index=True)
+
     def plot_top_10_signatures(df):
         """
         Method to generate and display interactive bar charts of the top 10 signatures in overall frequency and for attacks.
@@ -113,15 +179,12 @@ class Plots:
         Returns:
             alt.vconcat: The concatenated Altair charts.
         """
-        # Calculate top 10 signatures overall, for attacks, and for non-attacks
-        top_10_signatures_overall = df['signature'].value_counts().head(10).reset_index()
-        top_10_signatures_attack = df[df['corrisponde_ad_attacco'] == 1]['signature'].value_counts().head(10).reset_index()
-        top_10_signatures_non_attack = df[df['corrisponde_ad_attacco'] == 0]['signature'].value_counts().head(10).reset_index()
-
-        # Rename columns for clarity
-        top_10_signatures_overall.columns = ['Signature', 'Frequency']
-        top_10_signatures_attack.columns = ['Signature', 'Frequency']
-        top_10_signatures_non_attack.columns = ['Signature', 'Frequency']
+        # Top 10 signatures overall, for attacks, and for non-attacks
+        top_10 = Plots.compute_top_10_signatures(df)
+        top_10_signatures_overall, top_10_signatures_attack, top_10_signatures_non_attack = (
+            top_10[top_10['subset'] == subset].drop(columns='subset').reset_index(drop=True)
+            for subset in ['Overall', 'Attacks', 'Non-Attacks']
+        )
 
         # Create the base selection for hovering
         selection = alt.selection_single(fields=['Signature'], on='mouseover', clear='mouseout')
@@ -262,15 +325,17 @@ class Plots:
         plt.tight_layout()
         plt.show()
 
-    def plot_precision_recall(df):
+    @FrameMemo.memoize(columns=['signature', 'corrisponde_ad_attacco'])
+    def compute_precision_recall(df):
         """
-        Calcola e plotta la precisione e il recall per ciascuna regola utilizzando Altair.
-        
+        Calcola la precisione e il recall per ciascuna regola.
+
         Args:
         df: DataFrame contenente i dati da analizzare.
+
+        Returns:
+        DataFrame con le colonne 'signature', 'total', 'true_positives', 'false_positives', 'precision' e 'recall'.
         """
-        
-        # Calcolo delle metriche per ciascuna regola
         rule_stats = df.groupby('signature')['corrisponde_ad_attacco'].agg(
             total='count',
             true_positives='sum'
@@ -279,6 +344,23 @@ class Plots:
         rule_stats['false_positives'] = rule_stats['total'] - rule_stats['true_positives']
         rule_stats['precision'] = rule_stats['true_positives'] / rule_stats['total']
         rule_stats['recall'] = rule_stats['true_positives'] / rule_stats['true_positives'].sum()
+        return rule_stats
+
+    def plot_precision_recall(df, rule_stats=None):
+        """
+        Calcola e plotta la precisione e il recall per ciascuna regola utilizzando Altair.
+        
+        Args:
+        df: DataFrame contenente i dati da analizzare.
+        rule_stats: Tabella per regola già calcolata, ad esempio 'tabella_regole' di
+            MarkdownHelper.create_value_counts_variables. Se None, viene calcolata da df.
+        """
+        
+        # Calcolo delle metriche per ciascuna regola
+        if rule_stats is None:
+            rule_stats = Plots.compute_precision_recall(df)
+        else:
+            rule_stats = rule_stats[['signature', 'total', 'true_positives', 'false_positives', 'precision', 'recall']]
         
         # Plotting con Altair
         precision_chart = alt.Chart(rule_stats).mark_bar(color='blue', opacity=0.7).encode(
@@ -1,4 +1,5 @@
-from .lib import pd, go, plt, alt
+from .lib import np, pd, go, plt, alt
+from .rule_activation_index import RuleActivationIndex
 
 class PlotsSingleAttack:
     """
@@ -8,10 +9,14 @@ class PlotsSingleAttack:
     regola specifica.
 
     Metodi:
-        analyze_rule_activations(df, rule):
+        analyze_rule_activations(df, rule, index):
             Analizza le attivazioni di una regola specificata e genera vari plot per visualizzare la frequenza
             delle attivazioni, il tipo di evento, il parent process, il process, la severità e i tag.
         
+        collect_events_before_activation(df, rule, elements_to_consider):
+            Raccoglie in un DataFrame gli eventi che precedono ogni primo avvio della serie di una regola
+            specifica durante un attacco.
+
         patterns_before_activation(df, rule, elements_to_consider):
             Analizza i pattern degli eventi che precedono l'attivazione di una regola specifica e genera plot
             per visualizzare le regole, il tipo di evento, i tag, il parent process, il process e la severità 
@@ -19,7 +24,7 @@ class PlotsSingleAttack:
     """
     
     @staticmethod
-    def analyze_rule_activations(df, rule, rule_col='signature', mitre_attack_col='RuleAnnotation.mitre_attack.id', path_col='path_category_detailed', time_col='_time', eventtype_col='EventType', parent_col='parent_process_id', process_col='process_id', severity_col='severity_id', tag_col='tag', attack_col='corrisponde_ad_attacco'):
+    def analyze_rule_activations(df, rule, rule_col='signature', mitre_attack_col='RuleAnnotation.mitre_attack.id', path_col='path_category_detailed', time_col='_time', eventtype_col='EventType', parent_col='parent_process_id', process_col='process_id', severity_col='severity_id', tag_col='tag', attack_col='corrisponde_ad_attacco', index=None):
         """
         Analizza le attivazioni di una regola specificata in un dataframe, 
         separando gli attacchi reali dai falsi positivi e generando vari grafici di supporto.
@@ -37,51 +42,38 @@ class PlotsSingleAttack:
         severity_col: Nome della colonna che contiene il livello di severità.
         tag_col: Nome della colonna che contiene i tag.
         attack_col: Nome della colonna che indica se l'attivazione corrisponde a un attacco reale.
+        index: RuleActivationIndex costruito una sola volta sul dataframe, da riusare per analizzare più regole.
+               Se None, viene costruito per la sola regola specificata.
         """ 
         
-        # Verifica se la regola specificata è presente nel dataframe
-        if rule not in df[rule_col].values:
+        # Verifica se la regola specificata è presente nel dataframe (o nell'indice)
+        if (rule not in index) if index is not None else (rule not in df[rule_col].values):
             print("La regola ricercata non è presente")
             return
         
-        # Filtra il dataframe per la regola specificata
-        df_rule = df[df[rule_col] == rule]
-        
-        # Separa le attivazioni in attacchi reali e falsi positivi
-        df_attack = df_rule[df_rule[attack_col] == 1]
-        df_non_attack = df_rule[df_rule[attack_col] == 0]
+        # Senza un indice precalcolato, lo costruisce sulle sole attivazioni della regola
+        if index is None:
+            index = RuleActivationIndex(df[df[rule_col] == rule], rule_col=rule_col, mitre_attack_col=mitre_attack_col, path_col=path_col,
+                                        time_col=time_col, eventtype_col=eventtype_col, parent_col=parent_col, process_col=process_col,
+                                        severity_col=severity_col, tag_col=tag_col, attack_col=attack_col)
+
+        # Conteggi dei valori di una colonna per gli attacchi reali (1) e per i falsi positivi (0)
+        def counts(column, attack):
+            return index.value_counts(rule, column, attack)
         
         # Funzioni per i grafici
 
         # Funzione di supporto per la frequenza di attivazione
-        def plot_activation_frequency(df_attack, df_non_attack, title):
+        def plot_activation_frequency(frequencies, title):
             """
             Plotta la frequenza delle attivazioni degli attacchi e dei falsi positivi in modo interattivo con Plotly.
             
             Args:
-            df_attack: DataFrame contenente solo attacchi reali.
-            df_non_attack: DataFrame contenente solo falsi positivi.
+            frequencies: Lista di tuple (giorno, frequenza degli attacchi, frequenza dei falsi positivi) per intervalli di 5 minuti.
             title: Titolo del grafico.
             """
             
-            # Crea nuove DataFrame con la colonna 'date' aggiunta
-            df_attack = df_attack.assign(date=df_attack['_time'].dt.date)
-            df_non_attack = df_non_attack.assign(date=df_non_attack['_time'].dt.date)
-            
-            # Prendi l'elenco dei giorni unici da entrambi i DataFrame
-            unique_days = pd.concat([df_attack['date'], df_non_attack['date']]).unique()
-            
-            for day in unique_days:
-                # Filtra i dati per il giorno specifico
-                daily_attack = df_attack[df_attack['date'] == day]
-                daily_non_attack = df_non_attack[df_non_attack['date'] == day]
-                
-                if daily_attack.empty and daily_non_attack.empty:
-                    continue  # Se non ci sono dati per quel giorno, salta al prossimo giorno
-                
-                frequency_attack = daily_attack['_time'].dt.floor('5T').value_counts().sort_index()
-                frequency_non_attack = daily_non_attack['_time'].dt.floor('5T').value_counts().sort_index()
-                
+            for day, frequency_attack, frequency_non_attack in frequencies:
                 fig = go.Figure()
                 fig.add_trace(go.Bar(x=frequency_non_attack.index, y=frequency_non_attack.values, name='Non Attacchi', marker_color='blue'))
                 fig.add_trace(go.Bar(x=frequency_attack.index, y=frequency_attack.values, name='Attacchi', marker_color='red'))
@@ -103,20 +95,18 @@ class PlotsSingleAttack:
                 fig.show()
         
         # Frequenza di Attivazione
-        plot_activation_frequency(df_attack, df_non_attack, f'Frequenza di Attivazione - {rule}')
+        plot_activation_frequency(index.activation_frequency(rule), f'Frequenza di Attivazione - {rule}')
 
-        def plot_parent_process_counts(df_attack, df_non_attack, title):
+        def plot_parent_process_counts(title):
             """
             Plotta il numero di attacchi e falsi positivi per ID del processo padre.
             
             Args:
-            df_attack: DataFrame contenente solo attacchi reali.
-            df_non_attack: DataFrame contenente solo falsi positivi.
             title: Titolo del grafico.
             """
             
-            parent_process_counts_attack = df_attack['parent_process_id'].value_counts().nlargest(10)
-            parent_process_counts_non_attack = df_non_attack['parent_process_id'].value_counts().nlargest(10)
+            parent_process_counts_attack = counts(parent_col, 1).nlargest(10)
+            parent_process_counts_non_attack = counts(parent_col, 0).nlargest(10)
             
             combined = pd.DataFrame({'Attacchi': parent_process_counts_attack, 'Non Attacchi': parent_process_counts_non_attack})
             
@@ -137,20 +127,18 @@ class PlotsSingleAttack:
             else:
                 print(f"Nessun dato disponibile per il grafico {title}")
 
-        plot_parent_process_counts(df_attack, df_non_attack, 'Attacchi e Non-Attacchi per Parent Process Id')
+        plot_parent_process_counts('Attacchi e Non-Attacchi per Parent Process Id')
 
-        def plot_process_counts(df_attack, df_non_attack, title):
+        def plot_process_counts(title):
             """
             Plotta il numero di attacchi e falsi positivi per ID del processo.
             
             Args:
-            df_attack: DataFrame contenente solo attacchi reali.
-            df_non_attack: DataFrame contenente solo falsi positivi.
             title: Titolo del grafico.
             """
             
-            process_counts_attack = df_attack['process_id'].value_counts().nlargest(10)
-            process_counts_non_attack = df_non_attack['process_id'].value_counts().nlargest(10)
+            process_counts_attack = counts(process_col, 1).nlargest(10)
+            process_counts_non_attack = counts(process_col, 0).nlargest(10)
             
             combined = pd.DataFrame({'Attacchi': process_counts_attack, 'Non Attacchi': process_counts_non_attack})
             
@@ -171,20 +159,18 @@ class PlotsSingleAttack:
             else:
                 print(f"Nessun dato disponibile per il grafico {title}")
 
-        plot_process_counts(df_attack, df_non_attack, 'Attacchi e Non-Attacchi per Process Id')
+        plot_process_counts('Attacchi e Non-Attacchi per Process Id')
 
-        def plot_path_category_detailed(df_attack, df_non_attack, title):
+        def plot_path_category_detailed(title):
             """
             Plotta il numero di attacchi e falsi positivi per categoria del Path.
             
             Args:
-            df_attack: DataFrame contenente solo attacchi reali.
-            df_non_attack: DataFrame contenente solo falsi positivi.a
             title: Titolo del grafico.
             """
             
-            path_category_detailed_attack = df_attack['path_category_detailed'].value_counts().nlargest(10)
-            path_category_detailed_non_attack = df_non_attack['path_category_detailed'].value_counts().nlargest(10)
+            path_category_detailed_attack = counts(path_col, 1).nlargest(10)
+            path_category_detailed_non_attack = counts(path_col, 0).nlargest(10)
             
             combined = pd.DataFrame({'Attacchi': path_category_detailed_attack, 'Non Attacchi': path_category_detailed_non_attack})
             
@@ -205,21 +191,19 @@ class PlotsSingleAttack:
             else:
                 print(f"Nessun dato disponibile per il grafico {title}")
 
-        plot_path_category_detailed(df_attack, df_non_attack, 'Attacchi e Non-Attacchi per Categoria del Path')
+        plot_path_category_detailed('Attacchi e Non-Attacchi per Categoria del Path')
 
-        def plot_mitre_attack_counts(df_attack, df_non_attack, title, ax):
+        def plot_mitre_attack_counts(title, ax):
             """
             Plotta il numero di attacchi e falsi positivi per tipo di evento.
             
             Args:
-            df_attack: DataFrame contenente solo attacchi reali.
-            df_non_attack: DataFrame contenente solo falsi positivi.
             title: Titolo del grafico.
             ax: Oggetto Axes su cui tracciare il grafico.
             """
             
-            mitre_attack_counts_attack = df_attack[mitre_attack_col].value_counts()
-            mitre_attack_counts_non_attack = df_non_attack[mitre_attack_col].value_counts()
+            mitre_attack_counts_attack = counts(mitre_attack_col, 1)
+            mitre_attack_counts_non_attack = counts(mitre_attack_col, 0)
                 
             combined = pd.DataFrame({'Attacchi': mitre_attack_counts_attack, 'Non Attacchi': mitre_attack_counts_non_attack})
             
@@ -239,19 +223,17 @@ class PlotsSingleAttack:
             
             plt.tight_layout()
         
-        def plot_event_type_counts(df_attack, df_non_attack, title, ax):
+        def plot_event_type_counts(title, ax):
             """
             Plotta il numero di attacchi e falsi positivi per tipo di evento.
             
             Args:
-            df_attack: DataFrame contenente solo attacchi reali.
-            df_non_attack: DataFrame contenente solo falsi positivi.
             title: Titolo del grafico.
             ax: Oggetto Axes su cui tracciare il grafico.
             """
             
-            event_type_counts_attack = df_attack[eventtype_col].value_counts()
-            event_type_counts_non_attack = df_non_attack[eventtype_col].value_counts()
+            event_type_counts_attack = counts(eventtype_col, 1)
+            event_type_counts_non_attack = counts(eventtype_col, 0)
                 
             combined = pd.DataFrame({'Attacchi': event_type_counts_attack, 'Non Attacchi': event_type_counts_non_attack})
 
@@ -271,19 +253,17 @@ class PlotsSingleAttack:
             
             plt.tight_layout()
         
-        def plot_severity_counts(df_attack, df_non_attack, title, ax):
+        def plot_severity_counts(title, ax):
             """
             Plotta il numero di attacchi e falsi positivi per livello di severità.
             
             Args:
-            df_attack: DataFrame contenente solo attacchi reali.
-            df_non_attack: DataFrame contenente solo falsi positivi.
             title: Titolo del grafico.
             ax: Oggetto Axes su cui tracciare il grafico.
             """
             
-            severity_counts_attack = df_attack[severity_col].value_counts()
-            severity_counts_non_attack = df_non_attack[severity_col].value_counts()
+            severity_counts_attack = counts(severity_col, 1)
+            severity_counts_non_attack = counts(severity_col, 0)
                 
             combined = pd.DataFrame({'Attacchi': severity_counts_attack, 'Non Attacchi': severity_counts_non_attack})
 
@@ -303,19 +283,17 @@ class PlotsSingleAttack:
             
             plt.tight_layout()
         
-        def plot_tag_counts(df_attack, df_non_attack, title, ax):
+        def plot_tag_counts(title, ax):
             """
             Plotta il numero di attacchi e falsi positivi per tag.
             
             Args:
-            df_attack: DataFrame contenente solo attacchi reali.
-            df_non_attack: DataFrame contenente solo falsi positivi.
             title: Titolo del grafico.
             ax: Oggetto Axes su cui tracciare il grafico.
             """
             
-            tag_counts_attack = df_attack[tag_col].value_counts()
-            tag_counts_non_attack = df_non_attack[tag_col].value_counts()
+            tag_counts_attack = counts(tag_col, 1)
+            tag_counts_non_attack = counts(tag_col, 0)
                 
             combined = pd.DataFrame({'Attacchi': tag_counts_attack, 'Non Attacchi': tag_counts_non_attack})
 
@@ -339,16 +317,61 @@ class PlotsSingleAttack:
         fig, axs = plt.subplots(1, 4, figsize=(25, 16))
         
         # Chiamata alle funzioni di plot con gli assi corrispondenti
-        plot_mitre_attack_counts(df_attack, df_non_attack, f'Mitre Attack Id', ax=axs[0])
-        plot_event_type_counts(df_attack, df_non_attack, f'Tipo di Evento', ax=axs[1])
-        plot_severity_counts(df_attack, df_non_attack, f'Severità', ax=axs[2])
-        plot_tag_counts(df_attack, df_non_attack, f'Tag', ax=axs[3])
+        plot_mitre_attack_counts(f'Mitre Attack Id', ax=axs[0])
+        plot_event_type_counts(f'Tipo di Evento', ax=axs[1])
+        plot_severity_counts(f'Severità', ax=axs[2])
+        plot_tag_counts(f'Tag', ax=axs[3])
         
         # Imposta il layout
         plt.tight_layout()
         plt.show()
 
 
+    @staticmethod
+    def collect_events_before_activation(df, rule, elements_to_consider, rule_col='signature', mitre_attack_col='RuleAnnotation.mitre_attack.id', path_col='path_category_detailed', time_col='_time', eventtype_col='EventType', parent_col='parent_process_id', process_col='process_id', severity_col='severity_id', tag_col='tag', attack_col='corrisponde_ad_attacco'):
+        """
+        Raccoglie gli eventi che precedono ogni "primo avvio della serie" di una regola specifica durante un attacco.
+
+        Un evento è un primo avvio della serie quando è un'attivazione della regola durante un attacco e differisce
+        dall'evento precedente in almeno una delle colonne di regola, mitre id, path, parent process, process,
+        tipo di evento, tag e severità. Il confronto con l'evento precedente è fatto con shift() su tutte le righe,
+        e gli eventi precedenti sono raccolti con un'unica selezione per indici.
+
+        Args:
+        df: DataFrame contenente i dati da analizzare.
+        rule: La regola specifica da analizzare.
+        elements_to_consider: Numero di eventi precedenti da considerare.
+        Gli altri argomenti sono i nomi delle colonne, come in patterns_before_activation.
+
+        Returns:
+        DataFrame con gli eventi precedenti, una riga per evento e per ogni primo avvio a cui precede.
+        """
+        # Ordina il DataFrame per il tempo per garantire l'ordine cronologico
+        df = df.sort_values(by=time_col)
+
+        # Un evento inizia una nuova serie se differisce dal precedente in almeno una colonna
+        series_cols = [rule_col, mitre_attack_col, path_col, parent_col, process_col, eventtype_col, tag_col, severity_col]
+        changed = pd.Series(False, index=df.index)
+        for col in series_cols:
+            changed |= df[col].ne(df[col].shift()).fillna(True).astype(bool)
+
+        is_start = ((df[rule_col] == rule) & (df[attack_col] == True)).fillna(False).astype(bool) & changed
+        # Il primo evento non ha un evento precedente con cui essere confrontato
+        starts = np.flatnonzero(is_start.to_numpy())
+        starts = starts[starts > 0]
+
+        # Posizioni degli eventi precedenti a ogni primo avvio: [max(0, i - elements_to_consider), i)
+        window_starts = np.maximum(0, starts - elements_to_consider)
+        lengths = starts - window_starts
+        positions = np.repeat(window_starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths) + np.arange(lengths.sum())
+
+        df_previous_events = df.iloc[positions].reset_index(drop=True)
+        # Le colonne categoriche tornano ai valori semplici, come nei conteggi per record
+        for col in df_previous_events.columns:
+            if isinstance(df_previous_events[col].dtype, pd.CategoricalDtype):
+                df_previous_events[col] = np.asarray(df_previous_events[col])
+        return df_previous_events
+
     def patterns_before_activation(df, rule, elements_to_consider, rule_col='signature', mitre_attack_col='RuleAnnotation.mitre_attack.id', path_col='path_category_detailed', time_col='_time', eventtype_col='EventType', parent_col='parent_process_id', process_col='process_id', severity_col='severity_id', tag_col='tag', attack_col='corrisponde_ad_attacco'):
         """
         Analizza i pattern degli eventi che precedono l'attivazione di una regola specifica.
@@ -367,6 +390,9 @@ class PlotsSingleAttack:
         severity_col: Nome della colonna che contiene il livello di severità.
         tag_col: Nome della colonna che contiene i tag.
         attack_col: Nome della colonna che indica se l'attivazione corrisponde a un attacco reale.
+
+        Returns:
+        DataFrame con gli eventi precedenti, come restituito da collect_events_before_activation.
         """
 
         # Verifica se la regola specificata è presente nel dataframe
@@ -379,37 +405,14 @@ class PlotsSingleAttack:
             print("Non ci sono attacchi")
             return
 
-        # Ordina il DataFrame per il tempo per garantire l'ordine cronologico
-        df = df.sort_values(by=time_col)
-        
-        # Lista per memorizzare gli eventi precedenti
-        previous_events = []
-
-        # Scorri il DataFrame completo
-        for i in range(1, len(df)):
-            # Ottieni l'evento attuale e precedente
-            current_event = df.iloc[i]
-            previous_event = df.iloc[i - 1]
-
-            # Verifica se l'evento attuale è la regola specificata
-            if current_event[rule_col] == rule and current_event[attack_col] == True:
-                # Controlla se l'evento attuale è un "primo avvio della serie"
-                if (current_event[rule_col] != previous_event[rule_col] or
-                    current_event[mitre_attack_col] != previous_event[mitre_attack_col] or
-                    current_event[path_col] != previous_event[path_col] or
-                    current_event[parent_col] != previous_event[parent_col] or
-                    current_event[process_col] != previous_event[process_col] or
-                    current_event[eventtype_col] != previous_event[eventtype_col] or
-                    current_event[tag_col] != previous_event[tag_col] or
-                    current_event[severity_col] != previous_event[severity_col]
-                    ):
-                    
-                    # Aggiungi gli eventi precedenti al primo avvio della serie
-                    start_idx = max(0, i - elements_to_consider)
-                    previous_events.extend(df.iloc[start_idx:i].to_dict('records'))
-
-        # Crea un DataFrame dagli eventi precedenti
-        df_previous_events = pd.DataFrame(previous_events)
+        df_previous_events = PlotsSingleAttack.collect_events_before_activation(
+            df, rule, elements_to_consider, rule_col=rule_col, mitre_attack_col=mitre_attack_col, path_col=path_col,
+            time_col=time_col, eventtype_col=eventtype_col, parent_col=parent_col, process_col=process_col,
+            severity_col=severity_col, tag_col=tag_col, attack_col=attack_col)
+
+        if df_previous_events.empty:
+            print("Non ci sono eventi precedenti all'attivazione della regola")
+            return df_previous_events
 
         def plot_rules_counts(df, column, title):
             # Calcola i conteggi
@@ -588,4 +591,6 @@ class PlotsSingleAttack:
             axes[2].text(i, v_attacks + offset, f"  {v_non_attacks}", color='blue', ha='left')
 
         plt.tight_layout()
-        plt.show()
\ No newline at end of file
+        plt.show()
+
+        return df_previous_events
@@ -0,0 +1,213 @@
+from .lib import pd, hashlib, inspect, os
+from .csv_preprocessing_scaler import CsvPreprocessingScaler
+from .category_encoder import CategoryEncoder
+
+class PreprocessingCache:
+    """An on-disk cache for the DataFrames produced by CsvPreprocessingScaler.
+
+    The outputs of RawPreprocessing, LEPreprocessing and OhePreprocessing are stored
+    as Parquet files (pickle files when pyarrow is not installed). Each entry is keyed
+    by the content hash of the source CSV, the preprocessing step, the read mode and a
+    hash of the source code of the preprocessing modules (CsvPreprocessingScaler with its
+    path rules, and the CategoryEncoder it calls), so a change to the data or to the
+    preprocessing code never returns a stale frame.
+
+    The least recently used entries are evicted when the cache grows beyond `max_bytes`.
+
+    Attributes:
+        STEPS (dict): The cacheable preprocessing steps, by name.
+
+    Methods:
+        file_hash(file_path): Returns the content hash of a file.
+        code_version(): Returns the hash of the preprocessing code.
+        load(file_path, step, pruned, invalidate): Returns a preprocessed DataFrame, from the cache when possible.
+        invalidate(file_path, step, pruned): Removes the cached entries of a source file.
+        clear(): Removes every cached entry.
+        evict(): Removes the least recently used entries above the size limit.
+        restore_categoricals(df): Restores the categorical columns of a pruned read after a Parquet round trip.
+    """
+
+    # The modules whose source is part of the cache key
+    CODE_MODULES = [CsvPreprocessingScaler, CategoryEncoder]
+
+    STEPS = {
+        'RawPreprocessing': CsvPreprocessingScaler.RawPreprocessing,
+        'LEPreprocessing': CsvPreprocessingScaler.LEPreprocessing,
+        'OhePreprocessing': CsvPreprocessingScaler.OhePreprocessing,
+    }
+
+    def __init__(self, cache_dir='file_cache', max_bytes=2 * 1024**3):
+        """
+        Initializes the cache.
+
+        Args:
+            cache_dir (str): The directory where the cached frames are stored.
+            max_bytes (int): The maximum total size of the cache, in bytes.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # pyarrow is imported here rather than with the module, so importing the cache stays cheap
+        from .lib import pyarrow
+        self.extension = '.parquet' if pyarrow is not None else '.pkl'
+        self._hashes = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def file_hash(self, file_path):
+        """Returns the content hash of a file.
+
+        The hash is remembered for as long as the file size and modification time stay the same,
+        so the same export is read only once per session.
+
+        Args:
+            file_path (str): The path to the file.
+
+        Returns:
+            str: The hexadecimal BLAKE2 digest of the file content.
+        """
+        stat = os.stat(file_path)
+        signature = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        if signature not in self._hashes:
+            digest = hashlib.blake2b(digest_size=16)
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+            self._hashes[signature] = digest.hexdigest()
+        return self._hashes[signature]
+
+    @staticmethod
+    def code_version():
+        """Returns the hash of the source code of the modules defining CODE_MODULES.
+
+        The whole module is hashed, not only the class, so the helpers and constants next to
+        it (e.g. PATH_CATEGORY_RULES) are covered too.
+
+        Returns:
+            str: A short hexadecimal digest that changes whenever the preprocessing code changes.
+        """
+        digest = hashlib.blake2b(digest_size=8)
+        for cls in PreprocessingCache.CODE_MODULES:
+            digest.update(inspect.getsource(inspect.getmodule(cls)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _entry_path(self, file_path, step, pruned):
+        key = f"{self.file_hash(file_path)}_{step}_{'pruned' if pruned else 'full'}_{PreprocessingCache.code_version()}"
+        return os.path.join(self.cache_dir, key + self.extension)
+
+    def load(self, file_path, step='RawPreprocessing', pruned=False, invalidate=False):
+        """Returns a preprocessed DataFrame, from the cache when possible.
+
+        On a cache miss the CSV is read with CsvPreprocessingScaler.read_csv_file, the step is run
+        and its output is written to the cache.
+
+        Args:
+            file_path (str): The path to the Splunk CSV export.
+            step (str): One of 'RawPreprocessing', 'LEPreprocessing' or 'OhePreprocessing'.
+            pruned (bool): Whether the CSV is read with the column-pruned mode.
+            invalidate (bool): If True, recomputes the entry even if it is cached.
+
+        Returns:
+            pandas.DataFrame: The preprocessed DataFrame.
+        """
+        if step not in PreprocessingCache.STEPS:
+            raise ValueError(f"step must be one of {list(PreprocessingCache.STEPS)}")
+
+        path = self._entry_path(file_path, step, pruned)
+        if invalidate and os.path.exists(path):
+            os.remove(path)
+
+        if os.path.exists(path):
+            # Touch the entry so the eviction sees it as recently used
+            os.utime(path)
+            df = self._read(path)
+            if step == 'RawPreprocessing' and pruned:
+                df = PreprocessingCache.restore_categoricals(df)
+            return df
+
+        df = CsvPreprocessingScaler.read_csv_file(file_path, pruned=pruned)
+        if df.empty:
+            return df
+        df = PreprocessingCache.STEPS[step](df)
+        self._write(df, path)
+        self.evict()
+        return df
+
+    def invalidate(self, file_path, step=None, pruned=None):
+        """Removes the cached entries of a source file.
+
+        Args:
+            file_path (str): The path to the Splunk CSV export.
+            step (str, optional): The step to remove. All steps if None.
+            pruned (bool, optional): The read mode to remove. Both modes if None.
+
+        Returns:
+            int: The number of removed entries.
+        """
+        prefix = self.file_hash(file_path)
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            parts = name.split('_')
+            if (parts[0] != prefix or (step is not None and parts[1] != step)
+                    or (pruned is not None and parts[2] != ('pruned' if pruned else 'full'))):
+                continue
+            os.remove(os.path.join(self.cache_dir, name))
+            removed += 1
+        return removed
+
+    def clear(self):
+        """Removes every cached entry."""
+        for name in os.listdir(self.cache_dir):
+            os.remove(os.path.join(self.cache_dir, name))
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in `max_bytes`.
+
+        Returns:
+            list: The names of the removed entries.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            stat = os.stat(os.path.join(self.cache_dir, name))
+            entries.append((stat.st_mtime_ns, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        removed = []
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, name))
+            total -= size
+            removed.append(name)
+        return removed
+
+    @staticmethod
+    def restore_categoricals(df):
+        """Restores the categorical columns of a pruned read after a Parquet round trip.
+
+        A categorical with numeric categories ('EventType', whose categories are Int64) comes back
+        from Parquet as a plain column, so a cache hit would not have the dtypes of a cache miss.
+
+        Args:
+            df (pandas.DataFrame): The frame read from the cache.
+
+        Returns:
+            pandas.DataFrame: The frame with CATEGORICAL_COLUMNS as in CsvPreprocessingScaler.read_csv_file.
+        """
+        for column in CsvPreprocessingScaler.CATEGORICAL_COLUMNS:
+            if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+                dtype = CsvPreprocessingScaler.PIPELINE_DTYPES.get(column, 'category')
+                df[column] = (df[column] if dtype == 'category' else df[column].astype(dtype)).astype('category')
+        return df
+
+    def _read(self, path):
+        if path.endswith('.parquet'):
+            return pd.read_parquet(path)
+        return pd.read_pickle(path)
+
+    def _write(self, df, path):
+        # Write to a temporary file first so an interrupted run never leaves a truncated entry
+        tmp_path = path + '.tmp'
+        if path.endswith('.parquet'):
+            df.to_parquet(tmp_path)
+        else:
+            df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
@@ -1,4 +1,4 @@
-from .lib import np, train_test_split
+from .lib import np, sparse, train_test_split
 
 class PreprocessingTrainTestSplit:
     """
@@ -18,19 +18,28 @@ class PreprocessingTrainTestSplit:
         df['_time'] = (df['_time'].astype(np.int64) // 10**9).astype(int)
         return df
 
-    def split_data(df, target_column, test_size=0.25, random_state=42):
+    def split_data(df, target_column=None, test_size=0.25, random_state=42, y=None):
         """
         Splits the preprocessed DataFrame into features (X) and target (y) and then into training and testing sets.
 
+        A scipy.sparse matrix (e.g. from CsvPreprocessingScaler.OhePreprocessing with sparse_output=True)
+        is accepted as well: it already holds only the features, so the target is passed through `y`.
+
         Parameters:
-        - df: DataFrame, preprocessed data
-        - target_column: str, name of the target column
+        - df: DataFrame or scipy.sparse matrix, preprocessed data
+        - target_column: str, name of the target column (DataFrame input only)
         - test_size: float, optional (default=0.25), proportion of the dataset to include in the test split
         - random_state: int, optional (default=42), random state for reproducibility
+        - y: array-like, optional, target labels for sparse input
         
         Returns:
         - X_train, X_test, y_train, y_test: arrays, training and testing data
         """
+        if sparse.issparse(df):
+            if y is None:
+                raise ValueError("y must be provided when splitting a sparse matrix")
+            return train_test_split(df.tocsr(), y, test_size=test_size, random_state=random_state)
+
         df = PreprocessingTrainTestSplit.preprocess_data(df)
         X = df.drop(target_column, axis=1)
         y = df[target_column]
@@ -0,0 +1,262 @@
+from .lib import np, pd
+
+class RaggedEvents:
+    """A compact columnar container for the list-valued columns of event_df.
+
+    Each column stores the integer codes of its values in one NumPy array, with a vocabulary
+    that maps the codes back to the original values. All columns share one offsets array:
+    the events of attack i are the positions offsets[i]:offsets[i + 1], so the events of
+    consecutive attacks are a contiguous slice.
+
+    Attributes:
+        EVENT_COLUMNS (list): The list-valued columns of event_df.
+        SEVERITY_STATS (dict): The severity columns of event_df and the reduction that computes them.
+
+    Methods:
+        from_event_df(event_df, columns): Builds the container from the DataFrame of create_event_df.
+        from_flat(flat, attack_id): Builds the container from one row per event.
+        to_event_df(): Returns the DataFrame with a list per attack, as create_event_df.
+        from_arrow(table): Builds the container from an Arrow table of list columns.
+        to_arrow(): Returns an Arrow table with a list column per event column.
+        values(column, start, stop): Returns the decoded values of the events of a range of attacks.
+        lists(column): Returns the Python list of values of every attack.
+        count(): Returns the number of events of each attack.
+        numeric(column): Returns the values of a numeric column as floats, NaN for the missing ones.
+        min(column), max(column), mean(column): Per-attack reductions of a numeric column.
+    """
+
+    EVENT_COLUMNS = ['RuleAnnotation.mitre_attack.id', 'severity_id', 'EventType', 'tag', 'signature', 'path_category_detailed']
+
+    SEVERITY_STATS = {'severity_max': 'max', 'severity_mean': 'mean', 'severity_min': 'min'}
+
+    def __init__(self, codes, vocabularies, offsets):
+        """
+        Initializes the container.
+
+        Args:
+            codes (dict): The int64 codes of the events, by column.
+            vocabularies (dict): The values of each code (object array), by column.
+            offsets (numpy.ndarray): The start of each attack, of length n_attacks + 1.
+        """
+        self.codes = codes
+        self.vocabularies = vocabularies
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.columns = list(codes)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @staticmethod
+    def _encode(values):
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        # Plain Python values, so the decoded lists equal the ones of create_event_df
+        vocabulary = np.empty(len(uniques), dtype=object)
+        vocabulary[:] = [value.item() if isinstance(value, np.generic) else value for value in uniques]
+        return codes.astype(np.int64), vocabulary
+
+    @staticmethod
+    def from_event_df(event_df, columns=None):
+        """Builds the container from the DataFrame of RunLogParser.create_event_df.
+
+        Args:
+            event_df (pandas.DataFrame): The DataFrame with a list of values per attack.
+            columns (list, optional): The list-valued columns to store. All EVENT_COLUMNS by default.
+
+        Returns:
+            RaggedEvents: The container.
+        """
+        columns = [c for c in RaggedEvents.EVENT_COLUMNS if c in event_df.columns] if columns is None else list(columns)
+        if not columns:
+            raise ValueError("event_df has no list-valued columns")
+
+        lengths = np.fromiter((len(values) for values in event_df[columns[0]]), dtype=np.int64, count=len(event_df))
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+        codes, vocabularies = {}, {}
+        for column in columns:
+            values = [value for values in event_df[column] for value in values]
+            if len(values) != offsets[-1]:
+                raise ValueError(f"The lists of column {column} do not have the same lengths as {columns[0]}")
+            flat = np.empty(len(values), dtype=object)
+            flat[:] = values
+            codes[column], vocabularies[column] = RaggedEvents._encode(flat)
+        return RaggedEvents(codes, vocabularies, offsets)
+
+    @staticmethod
+    def from_flat(flat, attack_id):
+        """Builds the container from one row per event.
+
+        Args:
+            flat (pandas.DataFrame): The events, grouped by attack and in order inside each attack.
+            attack_id (numpy.ndarray): The non-decreasing attack of each event.
+
+        Returns:
+            RaggedEvents: The container, with one attack per distinct attack_id.
+        """
+        attack_id = np.asarray(attack_id)
+        starts = np.flatnonzero(np.concatenate(([True], attack_id[1:] != attack_id[:-1]))) if len(attack_id) else np.array([], dtype=np.int64)
+        offsets = np.concatenate((starts, [len(attack_id)]))
+
+        codes, vocabularies = {}, {}
+        for column in flat.columns:
+            codes[column], vocabularies[column] = RaggedEvents._encode(flat[column].to_numpy(dtype=object))
+        return RaggedEvents(codes, vocabularies, offsets)
+
+    def values(self, column, start=0, stop=None):
+        """Returns the decoded values of the events of the attacks start:stop.
+
+        Args:
+            column (str): The column.
+            start (int): The first attack.
+            stop (int, optional): The attack after the last one. The last attack by default.
+
+        Returns:
+            numpy.ndarray: The values, one per event.
+        """
+        stop = len(self) if stop is None else stop
+        return self.vocabularies[column][self.codes[column][self.offsets[start]:self.offsets[stop]]]
+
+    def lists(self, column):
+        """Returns the Python list of values of every attack.
+
+        Args:
+            column (str): The column.
+
+        Returns:
+            list: A list of values per attack.
+        """
+        values = self.values(column)
+        return [values[self.offsets[i]:self.offsets[i + 1]].tolist() for i in range(len(self))]
+
+    def count(self):
+        """Returns the number of events of each attack.
+
+        Returns:
+            numpy.ndarray: The int64 counts.
+        """
+        return np.diff(self.offsets)
+
+    def numeric(self, column):
+        """Returns the values of a numeric column as float64, one per event, with NaN for the missing ones.
+
+        Args:
+            column (str): The column.
+
+        Returns:
+            numpy.ndarray: The values.
+        """
+        # The vocabulary may hold pd.NA (from Int64 columns), which astype(float) rejects
+        return pd.Series(self.vocabularies[column], dtype=object).to_numpy(dtype=float, na_value=np.nan)[self.codes[column]]
+
+    def _reduce(self, values, ufunc, default):
+        counts = self.count()
+        result = np.full(len(self), default, dtype=float)
+        # reduceat is only defined on non-empty segments
+        non_empty = counts > 0
+        if non_empty.any():
+            result[non_empty] = ufunc.reduceat(values, self.offsets[:-1][non_empty])
+        return result
+
+    def min(self, column, default=0):
+        """Returns the minimum of a numeric column per attack, skipping missing values as pandas does.
+
+        Attacks without events get default; attacks whose values are all missing get NaN.
+        """
+        # fmin ignores NaN unless both operands are NaN
+        return self._reduce(self.numeric(column), np.fmin, default)
+
+    def max(self, column, default=0):
+        """Returns the maximum of a numeric column per attack, skipping missing values as pandas does.
+
+        Attacks without events get default; attacks whose values are all missing get NaN.
+        """
+        return self._reduce(self.numeric(column), np.fmax, default)
+
+    def mean(self, column, default=0):
+        """Returns the mean of a numeric column per attack, skipping missing values as pandas does.
+
+        Attacks without events get default; attacks whose values are all missing get NaN.
+        """
+        values = self.numeric(column)
+        present = ~np.isnan(values)
+        sums = self._reduce(np.where(present, values, 0), np.add, 0)
+        counts = self._reduce(present.astype(float), np.add, 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count() > 0, sums / counts, default)
+
+    def to_event_df(self):
+        """Returns the DataFrame with a list per attack, in the shape of RunLogParser.create_event_df.
+
+        The severity columns are added when 'severity_id' is stored.
+
+        Returns:
+            pandas.DataFrame: The DataFrame.
+        """
+        event_df = pd.DataFrame({column: self.lists(column) for column in self.columns})
+        if 'severity_id' in self.columns:
+            for column, how in RaggedEvents.SEVERITY_STATS.items():
+                stat = getattr(self, how)('severity_id')
+                if how != 'mean' and (stat == np.round(stat))[~np.isnan(stat)].all():
+                    # Attacks whose severities are all missing need nullable integers
+                    stat = pd.array(stat, dtype='Float64').astype('Int64') if np.isnan(stat).any() else stat.astype(np.int64)
+                event_df[column] = stat
+        return event_df
+
+    def to_arrow(self):
+        """Returns an Arrow table with a list column per event column.
+
+        Raises:
+            ImportError: If pyarrow is not installed.
+
+        Returns:
+            pyarrow.Table: The table.
+        """
+        from .lib import pyarrow
+        if pyarrow is None:
+            raise ImportError("RaggedEvents.to_arrow requires pyarrow")
+        offsets = pyarrow.array(self.offsets, type=pyarrow.int32() if self.offsets[-1] < 2**31 else pyarrow.int64())
+        list_type = pyarrow.ListArray if offsets.type == pyarrow.int32() else pyarrow.LargeListArray
+        # Each vocabulary is converted once and expanded with take, so no event goes through Python
+        arrays = [list_type.from_arrays(offsets, pyarrow.array(self.vocabularies[column], from_pandas=True).take(self.codes[column]))
+                  for column in self.columns]
+        return pyarrow.table(arrays, names=self.columns)
+
+    @staticmethod
+    def from_arrow(table):
+        """Builds the container from an Arrow table of list columns, e.g. the output of to_arrow.
+
+        Args:
+            table (pyarrow.Table): The table. The other columns are ignored.
+
+        Raises:
+            ImportError: If pyarrow is not installed.
+            ValueError: If the list columns do not have the same offsets.
+
+        Returns:
+            RaggedEvents: The container.
+        """
+        from .lib import pyarrow
+        if pyarrow is None:
+            raise ImportError("RaggedEvents.from_arrow requires pyarrow")
+
+        codes, vocabularies, offsets = {}, {}, None
+        for name in table.column_names:
+            if not (pyarrow.types.is_list(table.schema.field(name).type) or pyarrow.types.is_large_list(table.schema.field(name).type)):
+                continue
+            array = table.column(name).combine_chunks()
+            column_offsets = array.offsets.to_numpy().astype(np.int64)
+            values = array.values.slice(column_offsets[0], column_offsets[-1] - column_offsets[0])
+            column_offsets -= column_offsets[0]
+            if offsets is None:
+                offsets = column_offsets
+            elif not np.array_equal(offsets, column_offsets):
+                raise ValueError(f"The lists of column {name} do not have the same lengths as the other columns")
+            # The dictionary encoding gives the codes without converting every event to Python
+            encoded = values.dictionary_encode(null_encoding='encode')
+            vocabularies[name] = np.empty(len(encoded.dictionary), dtype=object)
+            vocabularies[name][:] = encoded.dictionary.to_pylist()
+            codes[name] = encoded.indices.to_numpy(zero_copy_only=False).astype(np.int64)
+
+        if offsets is None:
+            raise ValueError("The table has no list columns")
+        return RaggedEvents(codes, vocabularies, offsets)
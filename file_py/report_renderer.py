@@ -0,0 +1,256 @@
+from .lib import os, io, re, html, contextlib, traceback, ProcessPoolExecutor, plt, go, alt
+from .plots_single_attack import PlotsSingleAttack
+from .rule_activation_index import RuleActivationIndex
+
+# Data shared by the jobs of a worker process, set by ReportRenderer.init_worker
+_shared = {}
+
+class ReportRenderer:
+    """A headless batch renderer that writes the charts of the plotting classes to files.
+
+    The plotting methods of the repo (Plots, PlotsSingleAttack, StatSeverity, SigmaRuleAnalysis,
+    CorrelationMatrixPlots, AttackPatternAnalyzer) either show their charts with plt.show(), fig.show()
+    or chart.display(), or return them (e.g. Plots.plot_top_10_signatures returns its Altair chart).
+    While a job runs, the show calls are redirected to files, and the returned charts are written as
+    well: Matplotlib figures are saved with the Agg backend in the requested formats, Plotly and Altair
+    charts as standalone HTML pages. A job that writes no file is reported as an error. The jobs run
+    in a process pool and an index page links every file, so a report needs no notebook kernel.
+
+    Large inputs (the event frame, a RuleActivationIndex) are registered once with `share` and sent
+    once per worker, instead of once per job.
+
+    Attributes:
+        FORMATS (tuple): The supported formats for Matplotlib figures.
+
+    Methods:
+        share(name, obj): Registers an object shared by every job and returns a reference to it.
+        add(name, func, *args, **kwargs): Adds a job that calls a plotting function.
+        add_rule_activations(df, rules): Adds an analyze_rule_activations job per rule, on one shared index.
+        render(): Runs the jobs and writes the index page.
+    """
+
+    FORMATS = ('png', 'svg')
+
+    class Shared:
+        """A reference to an object registered with ReportRenderer.share."""
+
+        def __init__(self, name):
+            self.name = name
+
+    def __init__(self, output_dir='report', formats=('png',), n_jobs=1, dpi=100):
+        """
+        Initializes the renderer.
+
+        Args:
+            output_dir (str): The directory where the files and the index page are written.
+            formats (tuple): The formats of the Matplotlib figures, among FORMATS.
+            n_jobs (int): The number of worker processes, -1 for all the cores.
+            dpi (int): The resolution of the PNG files.
+        """
+        unknown = set(formats) - set(ReportRenderer.FORMATS)
+        if unknown:
+            raise ValueError(f"Unsupported formats: {sorted(unknown)}. Use {ReportRenderer.FORMATS}")
+        self.output_dir = output_dir
+        self.formats = tuple(formats)
+        self.n_jobs = (os.cpu_count() or 1) if n_jobs == -1 else n_jobs
+        self.dpi = dpi
+        self.shared = {}
+        self.jobs = []
+
+    def share(self, name, obj):
+        """Registers an object shared by every job.
+
+        Args:
+            name (str): The name of the object.
+            obj: The object, e.g. a DataFrame or a RuleActivationIndex.
+
+        Returns:
+            ReportRenderer.Shared: The reference to pass to `add` in place of the object.
+        """
+        self.shared[name] = obj
+        return ReportRenderer.Shared(name)
+
+    def add(self, name, func, *args, **kwargs):
+        """Adds a job that calls a plotting function.
+
+        Args:
+            name (str): The title of the job in the index page.
+            func (callable): A module-level function or static method, e.g. Plots.plot_distributions.
+            *args, **kwargs: The arguments of func. Shared references are resolved in the worker.
+        """
+        self.jobs.append((name, func, args, kwargs))
+
+    def add_rule_activations(self, df, rules=None, **columns):
+        """Adds an analyze_rule_activations job per rule, all reading one RuleActivationIndex.
+
+        Args:
+            df (pandas.DataFrame): The events, as for PlotsSingleAttack.analyze_rule_activations.
+            rules (list, optional): The rules to render. Every rule in df if None.
+            **columns: The column names accepted by analyze_rule_activations.
+        """
+        rule_col = columns.get('rule_col', 'signature')
+        index = self.share('rule_activation_index', RuleActivationIndex(df, **columns))
+        rules = df[rule_col].dropna().unique() if rules is None else rules
+        for rule in rules:
+            self.add(f'Attivazioni - {rule}', PlotsSingleAttack.analyze_rule_activations, None, rule, index=index, **columns)
+
+    @staticmethod
+    def init_worker(shared):
+        """Sets the Agg backend and stores the shared objects in the worker process."""
+        global _shared
+        plt.switch_backend('Agg')
+        _shared = shared
+
+    @staticmethod
+    def _resolve(value):
+        return _shared[value.name] if isinstance(value, ReportRenderer.Shared) else value
+
+    @staticmethod
+    @contextlib.contextmanager
+    def capture(directory, slug, formats, dpi):
+        """Redirects plt.show(), fig.show() and chart.display() to files while the context is active.
+
+        Yields:
+            tuple: The list of the names of the written files, filled as the charts are shown, and a
+            function that writes a chart returned by the job (a Matplotlib figure or axes, a Plotly
+            figure, an Altair chart, or a list, tuple or dict of them) unless it was already shown.
+        """
+        files = []
+        stems = []
+        # Charts already written, so a chart both shown and returned is written once
+        written = set()
+
+        def paths(*extensions):
+            stem = f'{slug}_{len(stems):02d}'
+            stems.append(stem)
+            names = [f'{stem}.{extension}' for extension in extensions]
+            files.extend(names)
+            return [os.path.join(directory, name) for name in names]
+
+        def save_figure(figure):
+            if id(figure) not in written:
+                written.add(id(figure))
+                for file_path in paths(*formats):
+                    figure.savefig(file_path, dpi=dpi, bbox_inches='tight')
+
+        def save_matplotlib(*args, **kwargs):
+            for number in plt.get_fignums():
+                save_figure(plt.figure(number))
+            plt.close('all')
+
+        def save_plotly(figure, *args, **kwargs):
+            if id(figure) not in written:
+                written.add(id(figure))
+                figure.write_html(paths('html')[0], include_plotlyjs='cdn')
+
+        def save_altair(chart, *args, **kwargs):
+            if id(chart) not in written:
+                written.add(id(chart))
+                chart.save(paths('html')[0])
+
+        def save_result(result):
+            if isinstance(result, (list, tuple)):
+                for item in result:
+                    save_result(item)
+            elif isinstance(result, dict):
+                for item in result.values():
+                    save_result(item)
+            elif isinstance(result, plt.Figure):
+                save_figure(result)
+            elif isinstance(result, plt.Axes):
+                save_figure(result.figure)
+            elif isinstance(result, go.Figure):
+                save_plotly(result)
+            elif isinstance(result, alt.TopLevelMixin):
+                save_altair(result)
+
+        originals = (plt.show, go.Figure.show, alt.TopLevelMixin.display)
+        plt.show, go.Figure.show, alt.TopLevelMixin.display = save_matplotlib, save_plotly, save_altair
+        try:
+            yield files, save_result
+            # Figures created without a final plt.show() are saved as well
+            save_matplotlib()
+        finally:
+            plt.show, go.Figure.show, alt.TopLevelMixin.display = originals
+            plt.close('all')
+
+    @staticmethod
+    def run_job(job):
+        """Runs one job and returns its files, its printed output and its error, if any."""
+        position, name, func, args, kwargs, directory, formats, dpi = job
+        slug = f"{position:04d}_{re.sub(r'[^A-Za-z0-9_.-]+', '_', name)[:80]}"
+        args = [ReportRenderer._resolve(value) for value in args]
+        kwargs = {key: ReportRenderer._resolve(value) for key, value in kwargs.items()}
+
+        output = io.StringIO()
+        error = None
+        with contextlib.redirect_stdout(output), ReportRenderer.capture(directory, slug, formats, dpi) as (files, save_result):
+            try:
+                # Charts that are returned instead of shown are written too
+                save_result(func(*args, **kwargs))
+            except Exception:
+                # One failing chart must not stop a nightly report
+                error = traceback.format_exc()
+        if not files and error is None:
+            error = f"{name}: the job produced no chart"
+        return {'name': name, 'files': files, 'output': output.getvalue(), 'error': error}
+
+    def render(self):
+        """Runs the jobs and writes the index page.
+
+        Returns:
+            str: The path of the index page.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        jobs = [(position, name, func, args, kwargs, self.output_dir, self.formats, self.dpi)
+                for position, (name, func, args, kwargs) in enumerate(self.jobs)]
+
+        if self.n_jobs <= 1:
+            backend = plt.get_backend()
+            ReportRenderer.init_worker(self.shared)
+            try:
+                results = [ReportRenderer.run_job(job) for job in jobs]
+            finally:
+                plt.switch_backend(backend)
+        else:
+            with ProcessPoolExecutor(max_workers=self.n_jobs, initializer=ReportRenderer.init_worker, initargs=(self.shared,)) as executor:
+                # map keeps the order of the jobs in the index page
+                results = list(executor.map(ReportRenderer.run_job, jobs))
+
+        index_path = self.write_index(results)
+        errors = sum(result['error'] is not None for result in results)
+        print(f"Report written: {sum(len(result['files']) for result in results)} files, {errors} errors -> {index_path}")
+        return index_path
+
+    def write_index(self, results):
+        """Writes the index page with a section per job.
+
+        Args:
+            results (list): The results of run_job.
+
+        Returns:
+            str: The path of the index page.
+        """
+        sections = []
+        for result in results:
+            parts = [f"<h2 id=\"job-{len(sections)}\">{html.escape(result['name'])}</h2>"]
+            for name in result['files']:
+                if name.endswith('.html'):
+                    parts.append(f'<p><a href="{html.escape(name)}">{html.escape(name)}</a></p>')
+                    parts.append(f'<iframe src="{html.escape(name)}" width="100%" height="650" frameborder="0"></iframe>')
+                else:
+                    parts.append(f'<p><img src="{html.escape(name)}" style="max-width: 100%"></p>')
+            if result['output']:
+                parts.append(f"<pre>{html.escape(result['output'])}</pre>")
+            if result['error']:
+                parts.append(f"<pre style=\"color: red\">{html.escape(result['error'])}</pre>")
+            sections.append('\n'.join(parts))
+
+        toc = '\n'.join(f'<li><a href="#job-{i}">{html.escape(result["name"])}</a></li>' for i, result in enumerate(results))
+        page = ('<!DOCTYPE html>\n<html>\n<head><meta charset="utf-8"><title>Report</title></head>\n<body>\n'
+                f'<h1>Report</h1>\n<ul>\n{toc}\n</ul>\n' + '\n'.join(sections) + '\n</body>\n</html>\n')
+
+        index_path = os.path.join(self.output_dir, 'index.html')
+        with open(index_path, 'w', encoding='utf-8') as f:
+            f.write(page)
+        return index_path
@@ -0,0 +1,96 @@
+from .lib import pd
+
+class RuleActivationIndex:
+    """
+    La classe RuleActivationIndex precalcola, con un solo passaggio sul dataframe, i conteggi delle attivazioni
+    di tutte le regole usati da PlotsSingleAttack.analyze_rule_activations.
+
+    I conteggi sono raggruppati per (regola, attacco, giorno, intervallo di 5 minuti) e per (regola, attacco, valore)
+    di parent process, process, categoria del path, mitre id, tipo di evento, severità e tag. Il report di ogni
+    regola diventa così una ricerca nell'indice invece di un nuovo filtraggio del dataframe completo.
+
+    Attributi:
+        FREQUENCY (str): L'ampiezza degli intervalli della frequenza di attivazione.
+
+    Metodi:
+        activation_frequency(rule):
+            Restituisce, per ogni giorno, la frequenza di attivazione di attacchi e non-attacchi.
+
+        value_counts(rule, column, attack):
+            Restituisce i conteggi dei valori di una colonna per le attivazioni della regola.
+    """
+
+    FREQUENCY = '5min'
+
+    def __init__(self, df, rule_col='signature', mitre_attack_col='RuleAnnotation.mitre_attack.id', path_col='path_category_detailed', time_col='_time', eventtype_col='EventType', parent_col='parent_process_id', process_col='process_id', severity_col='severity_id', tag_col='tag', attack_col='corrisponde_ad_attacco'):
+        """
+        Costruisce l'indice.
+
+        Args:
+        df: DataFrame contenente i dati da analizzare.
+        Gli altri argomenti sono i nomi delle colonne, come in PlotsSingleAttack.analyze_rule_activations.
+        """
+        self.rule_col = rule_col
+        self.attack_col = attack_col
+        self.count_cols = [parent_col, process_col, path_col, mitre_attack_col, eventtype_col, severity_col, tag_col]
+
+        # Sono indicizzate solo le attivazioni di attacchi (1) e non-attacchi (0)
+        df = df[df[attack_col].isin([0, 1])]
+        self.rules = set(df[rule_col].dropna())
+
+        date = df[time_col].dt.date.rename('date')
+        bucket = df[time_col].dt.floor(RuleActivationIndex.FREQUENCY).rename(time_col)
+        frequency = df.groupby([df[rule_col], df[attack_col], date, bucket], sort=True, observed=True).size()
+        self._frequency = {key: group.droplevel([0, 1, 2]) for key, group in frequency.groupby(level=[0, 1, 2], sort=False)}
+
+        # Giorni di ogni regola: prima quelli degli attacchi e poi quelli dei non-attacchi, in ordine di apparizione
+        days = pd.DataFrame({'rule': df[rule_col], 'attack': df[attack_col] == 1, 'date': date}).drop_duplicates()
+        days = days.sort_values('attack', ascending=False, kind='stable').drop_duplicates(['rule', 'date'])
+        self._days = {rule: list(group['date']) for rule, group in days.groupby('rule', sort=False)}
+
+        # Conteggi per valore nell'ordine di prima apparizione, come value_counts prima dell'ordinamento
+        self._counts = {}
+        for col in self.count_cols:
+            counts = df.groupby([df[rule_col], df[attack_col], df[col]], sort=False, observed=True).size()
+            for key, group in counts.groupby(level=[0, 1], sort=False):
+                self._counts[(col,) + key] = group.droplevel([0, 1])
+
+    def __contains__(self, rule):
+        return rule in self.rules
+
+    def activation_frequency(self, rule):
+        """
+        Restituisce, per ogni giorno, la frequenza di attivazione della regola per intervalli di 5 minuti.
+
+        Args:
+        rule: La regola specifica.
+
+        Returns:
+        Lista di tuple (giorno, frequenza degli attacchi, frequenza dei non-attacchi), con le frequenze
+        come Series indicizzate dall'inizio dell'intervallo.
+        """
+        result = []
+        for day in self._days.get(rule, []):
+            frequency_attack = self._frequency.get((rule, 1, day), pd.Series(dtype='int64'))
+            frequency_non_attack = self._frequency.get((rule, 0, day), pd.Series(dtype='int64'))
+            result.append((day, frequency_attack, frequency_non_attack))
+        return result
+
+    def value_counts(self, rule, column, attack):
+        """
+        Restituisce i conteggi dei valori di una colonna per le attivazioni della regola.
+
+        Args:
+        rule: La regola specifica.
+        column: Una delle colonne indicizzate.
+        attack: 1 per gli attacchi, 0 per i non-attacchi.
+
+        Returns:
+        Series con i conteggi in ordine decrescente, come value_counts() sulle attivazioni filtrate.
+        """
+        if column not in self.count_cols:
+            raise ValueError(f"column must be one of {self.count_cols}")
+        counts = self._counts.get((column, rule, attack))
+        if counts is None:
+            return pd.Series(dtype='int64', name='count', index=pd.Index([], name=column))
+        return counts.sort_values(ascending=False, kind='stable').rename('count')
@@ -1,4 +1,5 @@
-from .lib import csv, pd, timedelta
+from .lib import csv, np, pd, timedelta
+from .ragged_events import RaggedEvents
 
 class RunLogParser:
     """A utility class for parsing run logs, processing attacks and creating specific datasets.
@@ -11,8 +12,11 @@ class RunLogParser:
 
     Methods:
         parse_run_log(file_path): Parses a run log CSV file and returns a list of attacks.
-        process_attacks(file_path, df): Processes attacks and updates a DataFrame accordingly.
+        match_intervals(times, starts, ends, end_side): Locates the events falling inside each time interval.
+        process_attacks(file_path, df, keep_attack_code=False): Processes attacks and updates a DataFrame accordingly.
+        attack_event_positions(file_path, df): Locates the events of every attack of the attack log.
         create_event_df(file_path, df): Creates a DataFrame of events based on the attack log.
+        create_ragged_events(file_path, df): Creates the events of every attack as a RaggedEvents container.
     """
 
     @staticmethod
@@ -40,12 +44,38 @@ class RunLogParser:
         return attacks
 
     @staticmethod
-    def process_attacks(file_path, df):
+    def match_intervals(times, starts, ends, end_side='right'):
+        """Locates the events falling inside each time interval with a single sort of the timestamps.
+
+        The timestamps are sorted once and every interval is resolved with a binary search,
+        so the cost is O((events + intervals) log events) instead of one full scan per interval.
+
+        Args:
+            times (pandas.Series): The event timestamps.
+            starts (array-like): The start of each interval (inclusive).
+            ends (array-like): The end of each interval.
+            end_side (str): 'right' to include events equal to the end, 'left' to exclude them.
+
+        Returns:
+            tuple: The positional order that sorts `times` and, for each interval, the
+            `[lo, hi)` bounds of its events inside that order.
+        """
+        times = pd.DatetimeIndex(times)
+        order = np.argsort(times.asi8, kind='stable')
+        sorted_times = times[order]
+        lo = sorted_times.searchsorted(pd.DatetimeIndex(starts), side='left')
+        hi = sorted_times.searchsorted(pd.DatetimeIndex(ends), side=end_side)
+        return order, lo, np.maximum(hi, lo)
+
+    @staticmethod
+    def process_attacks(file_path, df, keep_attack_code=False):
         """Processes attacks and updates a DataFrame accordingly.
 
         Args:
             file_path (str): The path to the run log CSV file.
             df (pandas.DataFrame): The DataFrame to be updated.
+            keep_attack_code (bool): If True, keeps the 'codice_attacco' column with the code
+                of the matched attack (NaN for events outside every attack).
 
         Returns:
             pandas.DataFrame: The updated DataFrame.
@@ -53,63 +83,117 @@ class RunLogParser:
         attacks = RunLogParser.parse_run_log(file_path)
         df_result = df.copy()
         df_result['corrisponde_ad_attacco'] = 0
-        
-        for attack in attacks:
-            codice_attacco = attack['codice_attacco']
-            data_inizio = attack['data_inizio']
-            data_fine = attack['data_fine']
-            
-            mask = (df_result['_time'] >= data_inizio) & (df_result['_time'] < data_fine + timedelta(seconds=1))
-            df_result.loc[mask, 'corrisponde_ad_attacco'] = 1
-            df_result.loc[mask, 'codice_attacco'] = codice_attacco
-        
-        df_result.drop(columns=['codice_attacco'], inplace=True)
-        
+
+        if not attacks or df_result.empty:
+            if keep_attack_code:
+                df_result['codice_attacco'] = np.nan
+            return df_result
+
+        starts = [attack['data_inizio'] for attack in attacks]
+        ends = [attack['data_fine'] + timedelta(seconds=1) for attack in attacks]
+        order, lo, hi = RunLogParser.match_intervals(df_result['_time'], starts, ends, end_side='left')
+
+        # Mark covered events with a difference array over the sorted timestamps
+        coverage = np.zeros(len(order) + 1, dtype=np.int64)
+        np.add.at(coverage, lo, 1)
+        np.add.at(coverage, hi, -1)
+        is_attack = np.empty(len(order), dtype=bool)
+        is_attack[order] = np.cumsum(coverage[:-1]) > 0
+        df_result['corrisponde_ad_attacco'] = is_attack.astype(int)
+
+        if keep_attack_code:
+            # Later attacks overwrite earlier ones, as in the run log order
+            matched = np.full(len(order), -1, dtype=np.int64)
+            for i in range(len(attacks)):
+                matched[lo[i]:hi[i]] = i
+            attack_idx = np.empty(len(order), dtype=np.int64)
+            attack_idx[order] = matched
+            codes = np.array([attack['codice_attacco'] for attack in attacks] + [np.nan], dtype=object)
+            df_result['codice_attacco'] = codes[attack_idx]
+
         return df_result
 
     @staticmethod
-    def create_event_df(file_path, df):
-        """Creates a DataFrame of events based on the attack log.
+    def attack_event_positions(file_path, df):
+        """Locates the events of every attack of the attack log.
 
         Args:
             file_path (str): The path to the attack log CSV file.
             df (pandas.DataFrame): The raw DataFrame to filter events from.
 
         Returns:
-            pandas.DataFrame: The DataFrame containing event information.
+            tuple: The attack of each event and its position in df, grouped by attack and in df order
+                inside each attack. None if there are no attacks.
         """
         # Read the attack log
         df_attack_log = pd.read_csv(file_path)
         df_attack_log['Data inizio attacco'] = pd.to_datetime(df_attack_log['Data inizio attacco'])
         df_attack_log['Data fine attacco'] = pd.to_datetime(df_attack_log['Data fine attacco'])
 
-        # Initialize the list of events
-        events = []
-        single_attack = {'RuleAnnotation.mitre_attack.id': [], 'severity_id': [], 'EventType': [], 'tag': [], 'signature': [], 'path_category_detailed': []}
-
-        for _, attack in df_attack_log.iterrows():
-            # Filter results that fall within the attack time window
-            mask = (df['_time'] >= attack['Data inizio attacco']) & (df['_time'] <= attack['Data fine attacco'])
-            df_filtered = df.loc[mask].copy()
-
-            for _, row in df_filtered.iterrows():
-                single_attack['RuleAnnotation.mitre_attack.id'].append(row['RuleAnnotation.mitre_attack.id'])
-                single_attack['severity_id'].append(row['severity_id'])
-                single_attack['EventType'].append(row['EventType'])
-                single_attack['tag'].append(row['tag'])
-                single_attack['signature'].append(row['signature'])
-                single_attack['path_category_detailed'].append(row['path_category_detailed'])
-
-            if single_attack['RuleAnnotation.mitre_attack.id']:
-                events.append(single_attack)
-            single_attack = {'RuleAnnotation.mitre_attack.id': [], 'severity_id': [], 'EventType': [], 'tag': [], 'signature': [], 'path_category_detailed': []}
-
-        if events:
-            event_df = pd.DataFrame(events)
-            event_df["severity_max"] = event_df["severity_id"].apply(max)
-            event_df["severity_mean"] = event_df["severity_id"].apply(lambda x: sum(x) / len(x))
-            event_df["severity_min"] = event_df["severity_id"].apply(min)
-            return event_df
-        else:
+        if df.empty or df_attack_log.empty:
+            return None
+
+        # Assign every event to the attack windows it falls into
+        order, lo, hi = RunLogParser.match_intervals(df['_time'], df_attack_log['Data inizio attacco'], df_attack_log['Data fine attacco'])
+        lengths = hi - lo
+        attack_id = np.repeat(np.arange(len(lo)), lengths)
+        offsets = np.repeat(lo - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths)
+        positions = order[np.arange(lengths.sum()) + offsets]
+
+        # Keep the events of each attack in the same order they have in df
+        pairs = np.lexsort((positions, attack_id))
+        attack_id = attack_id[pairs]
+        positions = positions[pairs]
+
+        if len(positions) == 0:
+            return None
+        return attack_id, positions
+
+    @staticmethod
+    def create_event_df(file_path, df):
+        """Creates a DataFrame of events based on the attack log.
+
+        Args:
+            file_path (str): The path to the attack log CSV file.
+            df (pandas.DataFrame): The raw DataFrame to filter events from.
+
+        Returns:
+            pandas.DataFrame: The DataFrame containing event information.
+        """
+        located = RunLogParser.attack_event_positions(file_path, df)
+        if located is None:
             print("Non ci sono attacchi.")
-            return pd.DataFrame()
\ No newline at end of file
+            return pd.DataFrame()
+        attack_id, positions = located
+
+        flat = df[RaggedEvents.EVENT_COLUMNS].iloc[positions].reset_index(drop=True)
+
+        # Object dtype lets categorical columns be aggregated into lists as well
+        event_df = flat.astype(object).groupby(attack_id, sort=True).agg(list).reset_index(drop=True)
+
+        severity = flat['severity_id'].groupby(attack_id, sort=True).agg(['max', 'mean', 'min']).reset_index(drop=True)
+        event_df["severity_max"] = severity['max']
+        event_df["severity_mean"] = severity['mean']
+        event_df["severity_min"] = severity['min']
+        return event_df
+
+    @staticmethod
+    def create_ragged_events(file_path, df):
+        """Creates the events of every attack as a RaggedEvents container, without building Python lists.
+
+        Args:
+            file_path (str): The path to the attack log CSV file.
+            df (pandas.DataFrame): The raw DataFrame to filter events from.
+
+        Returns:
+            RaggedEvents: The container, with the attacks in the same order as create_event_df.
+                None if there are no attacks.
+        """
+        located = RunLogParser.attack_event_positions(file_path, df)
+        if located is None:
+            print("Non ci sono attacchi.")
+            return None
+        attack_id, positions = located
+
+        flat = df[RaggedEvents.EVENT_COLUMNS].iloc[positions].reset_index(drop=True)
+        return RaggedEvents.from_flat(flat, attack_id)
@@ -0,0 +1,447 @@
+from .lib import np, pd, os, io, csv, json, sys, time, argparse, threading, queue, deque, joblib, sparse, ThreadingHTTPServer, BaseHTTPRequestHandler
+from .csv_preprocessing_scaler import CsvPreprocessingScaler
+from .category_encoder import CategoryEncoder
+from .model_cache import ModelCache
+
+class ScoringEngine:
+    """A batch scoring engine that turns raw Splunk rows into attack probabilities.
+
+    The engine holds a trained model with the fitted CategoryEncoder and StandardScaler of its
+    training data. Each micro-batch of raw rows goes through the row-local part of RawPreprocessing
+    (explode_and_categorize), the encoding of the encoder ('onehot': the sparse matrix of
+    OhePreprocessing; 'label': the codes of LEPreprocessing) and stdScaler with the stored scaler,
+    all vectorized over the batch, and the model returns the probability of 'corrisponde_ad_attacco'
+    for every preprocessed row.
+
+    The engine records the rows scored and the latency of every batch, and can run as a
+    stdin/stdout filter or as a local HTTP service:
+
+        python -m file_py.scoring_engine model_bundle --stdin --format csv < export.csv
+        python -m file_py.scoring_engine model_bundle --http 8080
+
+    Attributes:
+        NUMERIC_COLUMNS (list): The raw columns parsed as numbers, as pd.read_csv does.
+
+    Methods:
+        save(directory): Saves the model, the encoder and the scaler to a directory.
+        load(directory): Loads an engine saved with save().
+        frame(records, columns): Builds the DataFrame of a batch from CSV rows or dicts.
+        features(df): Preprocesses, encodes and scales a batch.
+        predict_proba(X): Returns the attack probability of each row of a feature matrix.
+        score(df): Scores a batch of raw rows.
+        score_stream(records, columns, batch_size, max_delay): Scores a stream of rows in micro-batches.
+        stats(): Returns the throughput and the latency percentiles.
+        serve_stdin(input, output, fmt, batch_size, max_delay): Scores CSV or JSON lines from a stream.
+        http_server(host, port, batch_size): Returns the HTTP server of the engine.
+        serve_http(host, port, batch_size): Scores the rows posted to a local HTTP server.
+        main(argv): The command line interface.
+    """
+
+    NUMERIC_COLUMNS = ['parent_process_id', 'process_id', 'severity_id', 'EventType']
+
+    def __init__(self, model, encoder, scaler=None, feature_names=None, threshold=0.5, latency_window=10000):
+        """
+        Initializes the engine.
+
+        Args:
+            model: A fitted classifier with predict_proba (e.g. a FlatForest), an XGBoost booster or a Keras model.
+            encoder (CategoryEncoder): The fitted encoder of the training data ('onehot' or 'label').
+            scaler (StandardScaler, optional): The scaler fitted by stdScaler on the training data.
+            feature_names (list, optional): The feature columns of the training data. The batches are
+                checked ('onehot') or reordered ('label') against them.
+            threshold (float): The probability above which a row is flagged as an attack.
+            latency_window (int): The number of recent batch latencies kept for the percentiles.
+        """
+        if not encoder.is_fitted:
+            raise ValueError("The encoder must be fitted on the training data")
+        self.model = model
+        self.encoder = encoder
+        self.scaler = scaler
+        self.feature_names = None if feature_names is None else list(feature_names)
+        self.threshold = threshold
+        self.latencies = deque(maxlen=latency_window)
+        self.rows = 0
+        self.batches = 0
+        self.busy_time = 0.0
+        self._lock = threading.Lock()
+
+    def save(self, directory):
+        """Saves the model, the encoder and the scaler to a directory.
+
+        Args:
+            directory (str): The directory, created if needed.
+        """
+        os.makedirs(directory, exist_ok=True)
+        model_file = ModelCache.write_model(self.model, directory)
+        self.encoder.save(os.path.join(directory, 'encoder.json'))
+        if self.scaler is not None:
+            joblib.dump(self.scaler, os.path.join(directory, 'scaler.joblib'))
+        with open(os.path.join(directory, 'engine.json'), 'w', encoding='utf-8') as f:
+            json.dump({'model': model_file, 'feature_names': self.feature_names, 'threshold': self.threshold}, f, indent=2)
+
+    @staticmethod
+    def load(directory):
+        """Loads an engine saved with save().
+
+        Args:
+            directory (str): The directory.
+
+        Returns:
+            ScoringEngine: The engine.
+        """
+        with open(os.path.join(directory, 'engine.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        scaler_path = os.path.join(directory, 'scaler.joblib')
+        return ScoringEngine(
+            ModelCache.read_model(os.path.join(directory, meta['model'])),
+            CategoryEncoder.load(os.path.join(directory, 'encoder.json')),
+            joblib.load(scaler_path) if os.path.exists(scaler_path) else None,
+            meta['feature_names'],
+            meta['threshold'],
+        )
+
+    @staticmethod
+    def frame(records, columns=None):
+        """Builds the DataFrame of a batch from CSV rows or dicts.
+
+        Empty strings become missing values and NUMERIC_COLUMNS are parsed as numbers, so a batch
+        has the values that pd.read_csv gives for the same rows of an export.
+
+        Args:
+            records (list): The rows, as lists of strings (with columns) or as dicts.
+            columns (list, optional): The header of CSV rows.
+
+        Returns:
+            pandas.DataFrame: The raw rows.
+        """
+        df = pd.DataFrame(records, columns=columns) if columns is not None else pd.DataFrame.from_records(records)
+        text = [column for column in df.columns if df[column].dtype == object or pd.api.types.is_string_dtype(df[column].dtype)]
+        df[text] = df[text].replace('', np.nan)
+        for column in ScoringEngine.NUMERIC_COLUMNS:
+            if column in text:
+                df[column] = pd.to_numeric(df[column], errors='coerce')
+        return df
+
+    def features(self, df):
+        """Preprocesses, encodes and scales a batch of raw rows.
+
+        Args:
+            df (pandas.DataFrame): The raw rows.
+
+        Returns:
+            tuple: The feature matrix (None if no row is left) and the preprocessed rows, whose index
+            is the index of their raw row.
+        """
+        df = df.dropna(subset=["RuleAnnotation.mitre_attack.id", "signature"])
+        df = df[[column for column in CsvPreprocessingScaler.PIPELINE_COLUMNS if column in df.columns]].copy()
+        if df.empty:
+            return None, df
+        rows = CsvPreprocessingScaler.explode_and_categorize(df)
+
+        if self.encoder.mode == 'onehot':
+            rows['tag'] = rows['tag'].str.replace('\n', '_')
+            X, names = CsvPreprocessingScaler.ohe_sparse_matrix(rows, self.encoder, include_unknown=True)
+            if self.feature_names is not None and names != self.feature_names:
+                raise ValueError("The encoded columns differ from the feature columns of the model")
+            if self.scaler is not None:
+                X = CsvPreprocessingScaler.stdScaler(X, names, self.scaler)
+            return X, rows
+
+        encoded = self.encoder.transform(rows).reset_index(drop=True)
+        if self.scaler is not None:
+            encoded = CsvPreprocessingScaler.stdScaler(encoded, scaler=self.scaler)
+        # '_time' as integer seconds, as in PreprocessingTrainTestSplit.preprocess_data
+        encoded['_time'] = pd.DatetimeIndex(encoded['_time']).as_unit('ns').asi8 // 10**9
+        if self.feature_names is not None:
+            encoded = encoded[self.feature_names]
+        return encoded, rows
+
+    def predict_proba(self, X):
+        """Returns the attack probability of each row of a feature matrix.
+
+        Args:
+            X (scipy.sparse matrix or pandas.DataFrame): The features.
+
+        Returns:
+            numpy.ndarray: The probabilities.
+        """
+        module = type(self.model).__module__
+        if module.startswith('xgboost') and type(self.model).__name__ == 'Booster':
+            from .lib import xgb
+            return self.model.predict(xgb.DMatrix(X))
+        if module.startswith('keras') or module.startswith('tensorflow'):
+            return np.asarray(self.model.predict(X.toarray() if sparse.issparse(X) else X, verbose=0)).ravel()
+        try:
+            return self.model.predict_proba(X)[:, 1]
+        except TypeError:
+            # Models such as QuadraticDiscriminantAnalysis only take dense input
+            if not sparse.issparse(X):
+                raise
+            return self.model.predict_proba(X.toarray())[:, 1]
+
+    def score(self, df):
+        """Scores a batch of raw rows.
+
+        Args:
+            df (pandas.DataFrame): The raw rows.
+
+        Returns:
+            pandas.DataFrame: One row per preprocessed row, with 'row' (the index of the raw row),
+            'signature', 'RuleAnnotation.mitre_attack.id', '_time', 'corrisponde_ad_attacco'
+            (the probability) and 'alert' (probability above the threshold).
+        """
+        start = time.perf_counter()
+        X, rows = self.features(df)
+        probabilities = self.predict_proba(X) if X is not None else np.array([], dtype=float)
+
+        result = pd.DataFrame({
+            'row': rows.index.to_numpy(),
+            'signature': rows['signature'].to_numpy(dtype=object) if 'signature' in rows else [],
+            'RuleAnnotation.mitre_attack.id': rows['RuleAnnotation.mitre_attack.id'].to_numpy(dtype=object) if 'RuleAnnotation.mitre_attack.id' in rows else [],
+            '_time': rows['_time'].to_numpy() if '_time' in rows else [],
+            'corrisponde_ad_attacco': probabilities,
+        })
+        result['alert'] = result['corrisponde_ad_attacco'] >= self.threshold
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies.append(elapsed)
+            self.rows += len(df)
+            self.batches += 1
+            self.busy_time += elapsed
+        return result
+
+    @staticmethod
+    def micro_batches(records, batch_size=1024, max_delay=None):
+        """Groups a stream of records into lists of at most batch_size.
+
+        With max_delay, a batch is also closed when its first record has waited max_delay seconds,
+        so a slow producer still gets its scores; the records are then read by a background thread,
+        and an exception raised while reading them (e.g. a malformed JSON line) is raised here.
+
+        Args:
+            records (iterable): The records.
+            batch_size (int): The maximum size of a batch.
+            max_delay (float, optional): The maximum wait of a record, in seconds.
+
+        Yields:
+            list: The batches.
+        """
+        if max_delay is None:
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+            return
+
+        end = object()
+        pending = queue.Queue(maxsize=4 * batch_size)
+        failure = []
+
+        def read():
+            try:
+                for record in records:
+                    pending.put(record)
+            except BaseException as e:
+                failure.append(e)
+            finally:
+                # The consumer always wakes up, even when the records fail
+                pending.put(end)
+
+        threading.Thread(target=read, daemon=True).start()
+        batch, deadline = [], None
+        while True:
+            try:
+                record = pending.get(timeout=None if deadline is None else max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                yield batch
+                batch, deadline = [], None
+                continue
+            if record is end:
+                if failure:
+                    raise failure[0]
+                break
+            if not batch:
+                deadline = time.perf_counter() + max_delay
+            batch.append(record)
+            if len(batch) == batch_size:
+                yield batch
+                batch, deadline = [], None
+        if batch:
+            yield batch
+
+    def score_stream(self, records, columns=None, batch_size=1024, max_delay=None):
+        """Scores a stream of rows in micro-batches.
+
+        Args:
+            records (iterable): The rows, as lists of strings (with columns) or as dicts.
+            columns (list, optional): The header of CSV rows.
+            batch_size (int): The maximum number of rows of a batch.
+            max_delay (float, optional): The maximum wait of a row before its batch is scored, in seconds.
+
+        Yields:
+            pandas.DataFrame: The scores of each batch, with 'row' numbering the rows of the whole stream.
+        """
+        offset = 0
+        for batch in ScoringEngine.micro_batches(records, batch_size, max_delay):
+            df = ScoringEngine.frame(batch, columns)
+            df.index = pd.RangeIndex(offset, offset + len(df))
+            offset += len(df)
+            yield self.score(df)
+
+    def stats(self):
+        """Returns the throughput and the latency percentiles of the scored batches.
+
+        Returns:
+            dict: 'rows', 'batches', 'throughput_rows_per_s' (raw rows per second of scoring time)
+            and 'p50_ms', 'p99_ms' (batch latencies over the recent window).
+        """
+        with self._lock:
+            latencies = np.array(self.latencies) * 1000
+            rows, batches, busy_time = self.rows, self.batches, self.busy_time
+        return {
+            'rows': rows,
+            'batches': batches,
+            'throughput_rows_per_s': rows / busy_time if busy_time > 0 else 0.0,
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        }
+
+    @staticmethod
+    def to_json_lines(result):
+        """Returns the scores of a batch as JSON lines."""
+        return result.to_json(orient='records', lines=True, date_format='iso') if not result.empty else ''
+
+    def serve_stdin(self, input=None, output=None, fmt='csv', batch_size=1024, max_delay=None):
+        """Scores CSV rows (with header) or JSON lines from a stream and writes the scores as JSON lines.
+
+        The statistics are written to stderr at the end of the input.
+
+        Args:
+            input (file, optional): The input stream. sys.stdin if None.
+            output (file, optional): The output stream. sys.stdout if None.
+            fmt (str): 'csv' or 'jsonl'.
+            batch_size (int): The maximum number of rows of a batch.
+            max_delay (float, optional): The maximum wait of a row before its batch is scored, in seconds.
+        """
+        input = sys.stdin if input is None else input
+        output = sys.stdout if output is None else output
+        if fmt == 'csv':
+            # csv.reader keeps the multi-line MITRE ids of a Splunk export in one row
+            reader = csv.reader(input)
+            columns = next(reader, None)
+            if columns is None:
+                return
+            records = reader
+        elif fmt == 'jsonl':
+            columns = None
+            records = (json.loads(line) for line in input if line.strip())
+        else:
+            raise ValueError("fmt must be 'csv' or 'jsonl'")
+
+        for result in self.score_stream(records, columns, batch_size, max_delay):
+            output.write(ScoringEngine.to_json_lines(result))
+            output.flush()
+        print(json.dumps(self.stats()), file=sys.stderr)
+
+    def http_server(self, host='127.0.0.1', port=8080, batch_size=1024):
+        """Returns the HTTP server of the engine, bound but not yet serving.
+
+        POST /score takes CSV rows with header (Content-Type text/csv), a JSON list of dicts or
+        JSON lines, and returns the scores as JSON lines. GET /stats returns stats().
+
+        Args:
+            host (str): The address to listen on.
+            port (int): The port, 0 for any free port.
+            batch_size (int): The maximum number of rows scored at a time.
+
+        Returns:
+            ThreadingHTTPServer: The server; its serve_forever() handles the requests.
+        """
+        engine = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def reply(self, status, body, content_type='application/json'):
+                data = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path != '/stats':
+                    return self.reply(404, json.dumps({'error': 'not found'}))
+                self.reply(200, json.dumps(engine.stats()))
+
+            def do_POST(self):
+                if self.path != '/score':
+                    return self.reply(404, json.dumps({'error': 'not found'}))
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+                try:
+                    if 'csv' in self.headers.get('Content-Type', ''):
+                        reader = csv.reader(io.StringIO(body))
+                        columns, records = next(reader, []), list(reader)
+                    else:
+                        stripped = body.strip()
+                        records = json.loads(stripped) if stripped.startswith('[') else [json.loads(line) for line in stripped.splitlines() if line.strip()]
+                        columns = None
+                    lines = ''.join(ScoringEngine.to_json_lines(result) for result in engine.score_stream(records, columns, batch_size))
+                except Exception as e:
+                    return self.reply(400, json.dumps({'error': str(e)}))
+                self.reply(200, lines, 'application/x-ndjson')
+
+            def log_message(self, format, *args):
+                # Access logs would dominate the output at high request rates
+                pass
+
+        return ThreadingHTTPServer((host, port), Handler)
+
+    def serve_http(self, host='127.0.0.1', port=8080, batch_size=1024):
+        """Scores the rows posted to a local HTTP server (see http_server), until interrupted.
+
+        Args:
+            host (str): The address to listen on.
+            port (int): The port.
+            batch_size (int): The maximum number of rows scored at a time.
+        """
+        server = self.http_server(host, port, batch_size)
+        print(f"Scoring service on http://{host}:{server.server_address[1]} (POST /score, GET /stats)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    @staticmethod
+    def main(argv=None):
+        """The command line interface: scores stdin or runs the HTTP service with a saved engine.
+
+        Args:
+            argv (list, optional): The arguments. sys.argv[1:] if None.
+        """
+        parser = argparse.ArgumentParser(prog='python -m file_py.scoring_engine', description='Scores raw Splunk rows with a saved ScoringEngine.')
+        parser.add_argument('bundle', help='the directory written by ScoringEngine.save')
+        mode = parser.add_mutually_exclusive_group(required=True)
+        mode.add_argument('--stdin', action='store_true', help='reads rows from stdin and writes JSON lines to stdout')
+        mode.add_argument('--http', type=int, metavar='PORT', help='serves POST /score and GET /stats on PORT')
+        parser.add_argument('--host', default='127.0.0.1', help='the address of the HTTP service (default: 127.0.0.1)')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv', help='the format of stdin (default: csv)')
+        parser.add_argument('--batch-size', type=int, default=1024, help='the maximum rows per micro-batch (default: 1024)')
+        parser.add_argument('--max-delay', type=float, help='the maximum wait of a stdin row before its batch is scored, in seconds')
+        args = parser.parse_args(argv)
+
+        engine = ScoringEngine.load(args.bundle)
+        if args.stdin:
+            engine.serve_stdin(fmt=args.format, batch_size=args.batch_size, max_delay=args.max_delay)
+        else:
+            engine.serve_http(args.host, args.http, args.batch_size)
+
+if __name__ == '__main__':
+    ScoringEngine.main()
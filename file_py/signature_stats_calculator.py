@@ -1,78 +1,308 @@
-from .lib import np, pd
+from .lib import np, pd, os, tempfile, ProcessPoolExecutor
+from .ragged_events import RaggedEvents
+
+# Contesto condiviso dai task di un processo worker, preparato da init_signature_worker
+_worker_context = None
 
 class SignatureStatsCalculator:
 
+    LIST_COLUMNS = ['RuleAnnotation.mitre_attack.id', 'severity_id', 'EventType', 'tag', 'signature']
+
+    STATS_COLUMNS = ["signature","Indice_Diff","Media_Differenza_Severity_min","Media_Differenza_Severity_mean","Media_Differenza_Severity_max","N_Max_Sev_Diff_15","N_Attacchi_Non_rilevati"]
+
+    # Funzioni di aggregazione ottimizzate
+    @staticmethod
+    def max_sev(x):
+        return max(x, default=0)
+
+    @staticmethod
+    def mean_sev(x):
+        return np.mean(x) if x else 0
+
+    @staticmethod
+    def min_sev(x):
+        return min(x, default=0)
+
+    @staticmethod
+    def list_difference(list1, list2):
+        set1, set2 = set(list1), set(list2)
+        return len(set1.symmetric_difference(set2)) / (len(set1) + len(set2))
+
+    @staticmethod
+    def calculate_difference(row1, row2):
+        numeric_columns = ['severity_max', 'severity_mean', 'severity_min']
+        differences = [abs(row1[col] - row2[col]) / max(row1[col], row2[col], 1) for col in numeric_columns]
+
+        differences.extend([SignatureStatsCalculator.list_difference(row1[col], row2[col]) for col in SignatureStatsCalculator.LIST_COLUMNS])
+
+        return np.mean(differences)
+
     @staticmethod
     def get_sig_stats(df1, sig_to_rem=None):
-        # Funzioni di aggregazione ottimizzate
-        def max_sev(x):
-            return max(x, default=0)
-        
-        def mean_sev(x):
-            return np.mean(x) if x else 0
-        
-        def min_sev(x):
-            return min(x, default=0)
-        
-        def list_difference(list1, list2):
-            set1, set2 = set(list1), set(list2)
-            return len(set1.symmetric_difference(set2)) / (len(set1) + len(set2))
-        
-        def calculate_difference(row1, row2):
-            numeric_columns = ['severity_max', 'severity_mean', 'severity_min']
-            differences = [abs(row1[col] - row2[col]) / max(row1[col], row2[col], 1) for col in numeric_columns]
-            
-            categorical_columns = ['RuleAnnotation.mitre_attack.id', 'severity_id', 'EventType', 'tag', 'signature']
-            differences.extend([list_difference(row1[col], row2[col]) for col in categorical_columns])
-            
-            return np.mean(differences)
-        
         # Creare una copia del dataframe e rimuovere le signature
         df1_wo_sig = df1.copy()
-        
+
         # Utilizzare mask e numpy per operazioni più efficienti
         mask = df1_wo_sig['signature'].apply(lambda x: sig_to_rem in x)
         indices_to_rem = np.where(mask)[0]
-        
+
         for idx in indices_to_rem:
             indices_to_keep = [i for i, sig in enumerate(df1_wo_sig.at[idx, 'signature']) if sig != sig_to_rem]
-            
-            for col in ['RuleAnnotation.mitre_attack.id', 'severity_id', 'EventType', 'tag', 'signature']:
+
+            for col in SignatureStatsCalculator.LIST_COLUMNS:
                 df1_wo_sig.at[idx, col] = [df1_wo_sig.at[idx, col][i] for i in indices_to_keep]
-        
+
         # Calcolare severity_max, severity_mean e severity_min usando funzioni di pandas
-        df1_wo_sig["severity_max"] = df1_wo_sig["severity_id"].apply(max_sev)
-        df1_wo_sig["severity_mean"] = df1_wo_sig["severity_id"].apply(mean_sev)
-        df1_wo_sig["severity_min"] = df1_wo_sig["severity_id"].apply(min_sev)
-        
+        df1_wo_sig["severity_max"] = df1_wo_sig["severity_id"].apply(SignatureStatsCalculator.max_sev)
+        df1_wo_sig["severity_mean"] = df1_wo_sig["severity_id"].apply(SignatureStatsCalculator.mean_sev)
+        df1_wo_sig["severity_min"] = df1_wo_sig["severity_id"].apply(SignatureStatsCalculator.min_sev)
+
         # Filtrare righe con severity_id vuoto
         non_empty_mask = df1_wo_sig["severity_id"].apply(bool)
         df_wosig_filtrato = df1_wo_sig[non_empty_mask].copy()
         df1_filtrato = df1[non_empty_mask].copy()
-        
+
         # Calcolare la differenza per ogni coppia di record corrispondenti
-        distances = df1_filtrato.apply(lambda row: calculate_difference(row, df_wosig_filtrato.loc[row.name]), axis=1)
-        
+        distances = df1_filtrato.apply(lambda row: SignatureStatsCalculator.calculate_difference(row, df_wosig_filtrato.loc[row.name]), axis=1)
+
         # Calcolare le differenze delle statistiche di severity
         sev_diff_min = df1_filtrato["severity_min"] - df_wosig_filtrato["severity_min"]
         sev_diff_mean = df1_filtrato["severity_mean"] - df_wosig_filtrato["severity_mean"]
         sev_diff_max = df1_filtrato["severity_max"] - df_wosig_filtrato["severity_max"]
-        
+
         # Conteggio record con diminuzione di severity_max >= 15
         count_max = (sev_diff_max >= 15).sum()
-        
+
         differences = [sig_to_rem, distances.mean(), sev_diff_min.mean(), sev_diff_mean.mean(), sev_diff_max.mean(), count_max, len(non_empty_mask) - non_empty_mask.sum()]
 
         return differences
 
-    def create_signature_stats(df1, df2):
+    @staticmethod
+    def prepare_signature_context(df1):
+        """
+        Prepara i dati condivisi dal calcolo delle statistiche di ogni signature, solo come array NumPy:
+
+        - le liste degli attacchi come codici interi piatti (RaggedEvents), con la riga di ogni evento;
+        - un indice invertito in formato CSR: le posizioni degli eventi della signature di codice c sono
+          occurrences[occurrence_starts[c]:occurrence_starts[c + 1]];
+        - le grandezze medie da get_sig_stats (distanza, differenze di severity min/mean/max e diff. max >= 15)
+          degli attacchi senza rimozioni, e le loro somme, che valgono per tutti gli attacchi non toccati.
+
+        Restituisce il contesto e il dizionario signature -> codice.
+        """
+        calc = SignatureStatsCalculator
+        events = RaggedEvents.from_event_df(df1, calc.LIST_COLUMNS)
+        n_rows = len(events)
+
+        # Codici delle colonne lista, una riga per colonna e una colonna per evento
+        codes = np.vstack([events.codes[col] for col in calc.LIST_COLUMNS])
+        severity = events.numeric('severity_id')
+        event_row = np.repeat(np.arange(n_rows), events.count())
+
+        signature_codes = events.codes['signature']
+        occurrences = np.argsort(signature_codes, kind='stable')
+        occurrence_starts = np.concatenate(([0], np.cumsum(np.bincount(signature_codes, minlength=len(events.vocabularies['signature'])))))
+
+        # Statistiche di event_df e statistiche ricalcolate senza rimozioni, nell'ordine max, mean, min
+        original = df1[['severity_max', 'severity_mean', 'severity_min']].to_numpy(dtype=float)
+        recomputed = np.column_stack([events.max('severity_id'), events.mean('severity_id'), events.min('severity_id')])
+        non_empty = events.count() > 0
+
+        base = np.column_stack([
+            calc.removal_distance(original, recomputed, np.zeros((n_rows, len(calc.LIST_COLUMNS)))),
+            original[:, 2] - recomputed[:, 2],
+            original[:, 1] - recomputed[:, 1],
+            original[:, 0] - recomputed[:, 0],
+            (original[:, 0] - recomputed[:, 0]) >= 15,
+        ])
+        # Come le medie di pandas, le grandezze mancanti non contano
+        base_valid = non_empty[:, None] & ~np.isnan(base)
 
+        context = {
+            'offsets': events.offsets,
+            'codes': codes,
+            'severity': severity,
+            'event_row': event_row,
+            'occurrences': occurrences,
+            'occurrence_starts': occurrence_starts,
+            'distinct': calc.distinct_counts(codes, event_row, n_rows),
+            'original': original,
+            'base': base,
+            'base_valid': base_valid,
+            'base_sum': np.where(base_valid, base, 0).sum(axis=0),
+            'base_count': base_valid.sum(axis=0),
+            'base_empty': np.array(n_rows - non_empty.sum()),
+        }
+        vocabulary = {value: code for code, value in enumerate(events.vocabularies['signature'])}
+        return context, vocabulary
+
+    @staticmethod
+    def removal_distance(original, removed, list_differences):
+        """
+        Distanza di calculate_difference, vettorizzata sulle righe: media delle differenze relative delle
+        statistiche di severity (max, mean, min) e delle differenze delle liste.
+        """
+        numeric = np.abs(original - removed) / np.maximum(np.maximum(original, removed), 1)
+        return np.concatenate([numeric, list_differences], axis=1).mean(axis=1)
+
+    @staticmethod
+    def distinct_counts(codes, segment, n_segments):
+        """
+        Numero di codici distinti di ogni segmento, per ogni colonna.
+
+        Args:
+        codes: Matrice dei codici, una riga per colonna e una colonna per evento.
+        segment: Segmento (attacco) di ogni evento.
+        n_segments: Numero di segmenti.
+
+        Returns:
+        Matrice (n_segments, colonne) dei conteggi.
+        """
+        counts = np.zeros((n_segments, codes.shape[0]), dtype=np.int64)
+        for i, column in enumerate(codes):
+            # Una chiave per coppia (segmento, codice): le chiavi distinte di un segmento sono i suoi codici distinti
+            width = int(column.max(initial=0)) + 1
+            keys = np.unique(segment * width + column)
+            counts[:, i] = np.bincount(keys // width, minlength=n_segments)
+        return counts
+
+    @staticmethod
+    def signature_stats_row(context, sig, code):
+        """
+        Calcola la riga di statistiche di una signature, con lo stesso risultato di get_sig_stats.
+
+        Il costo è proporzionale agli eventi degli attacchi che contengono la signature: le somme degli
+        attacchi senza rimozioni vengono corrette solo per quegli attacchi, con operazioni vettoriali.
+        """
+        calc = SignatureStatsCalculator
+        sums = context['base_sum'].astype(float)
+        counts = context['base_count'].astype(np.int64)
+        empty = int(context['base_empty'])
+
+        if code is not None and context['occurrence_starts'][code + 1] > context['occurrence_starts'][code]:
+            offsets = context['offsets']
+            positions = context['occurrences'][context['occurrence_starts'][code]:context['occurrence_starts'][code + 1]]
+            rows = np.unique(context['event_row'][positions])
+
+            # Tutti gli eventi degli attacchi toccati, attacco per attacco, e quelli che restano
+            lengths = offsets[rows + 1] - offsets[rows]
+            segment = np.repeat(np.arange(len(rows)), lengths)
+            events = offsets[rows][segment] + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            keep = np.ones(len(events), dtype=bool)
+            keep[np.searchsorted(events, positions)] = False
+            kept_segment = segment[keep]
+
+            valid = context['base_valid'][rows]
+            sums -= np.where(valid, context['base'][rows], 0).sum(axis=0)
+            counts -= valid.sum(axis=0)
+
+            kept_counts = np.bincount(kept_segment, minlength=len(rows))
+            remaining = kept_counts > 0
+            empty += int((~remaining).sum())
+            if remaining.any():
+                severity = context['severity'][events[keep]]
+                starts = np.concatenate(([0], np.cumsum(kept_counts)[:-1]))[remaining]
+                removed = np.column_stack([
+                    np.maximum.reduceat(severity, starts),
+                    np.bincount(kept_segment, weights=severity, minlength=len(rows))[remaining] / kept_counts[remaining],
+                    np.minimum.reduceat(severity, starts),
+                ])
+                original = context['original'][rows[remaining]]
+
+                # Le liste senza la signature sono un sottoinsieme: la differenza simmetrica è n1 - n2
+                n_all = context['distinct'][rows[remaining]]
+                n_kept = calc.distinct_counts(context['codes'][:, events[keep]], kept_segment, len(rows))[remaining]
+                diff_max = original[:, 0] - removed[:, 0]
+                values = np.column_stack([
+                    calc.removal_distance(original, removed, (n_all - n_kept) / (n_all + n_kept)),
+                    original[:, 2] - removed[:, 2],
+                    original[:, 1] - removed[:, 1],
+                    diff_max,
+                    diff_max >= 15,
+                ])
+                valid = ~np.isnan(values)
+                sums += np.where(valid, values, 0).sum(axis=0)
+                counts += valid.sum(axis=0)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+        return [sig, means[0], means[1], means[2], means[3], int(round(sums[4])), empty]
+
+    @staticmethod
+    def init_signature_worker(directory):
+        """
+        Inizializza un processo worker: il contesto preparato una sola volta dal processo principale
+        viene aperto in memory map dai file .npy, senza copie né ricalcoli.
+        """
+        global _worker_context
+        _worker_context = {
+            name[:-len('.npy')]: np.load(os.path.join(directory, name), mmap_mode='r')
+            for name in os.listdir(directory) if name.endswith('.npy')
+        }
+
+    @staticmethod
+    def signature_stats_chunk(items):
+        """Calcola nel processo worker le righe di statistiche di un gruppo di (signature, codice)."""
+        return [SignatureStatsCalculator.signature_stats_row(_worker_context, sig, code) for sig, code in items]
+
+    @staticmethod
+    def create_signature_stats(df1, df2, n_jobs=1, progress=False):
+        """
+        Crea il dataset con le statistiche di rimozione di ogni signature di df2 dagli attacchi di df1.
+
+        Il risultato è lo stesso di get_sig_stats chiamato per ogni signature (a meno dell'ordine delle somme
+        in virgola mobile), ma le grandezze vengono calcolate una sola volta per gli attacchi senza rimozioni
+        e, per ogni signature, corrette solo sugli attacchi che la contengono, grazie a un indice invertito
+        signature -> posizioni degli eventi: il costo di una signature è proporzionale alle sue occorrenze.
+
+        Con n_jobs > 1 (o -1 per usare tutti i core) le signature vengono divise in gruppi ed elaborate
+        da un pool di processi. Il contesto (solo array NumPy) viene preparato una sola volta e scritto in
+        file .npy temporanei, che ogni worker apre in memory map all'avvio, senza copiarlo né ricalcolarlo.
+        L'ordine delle righe resta quello delle signature in df2.
+
+        Args:
+        df1: DataFrame degli attacchi (event_df di RunLogParser.create_event_df).
+        df2: DataFrame degli eventi con la colonna 'signature'.
+        n_jobs: Numero di processi da usare.
+        progress: Se True, stampa l'avanzamento.
+        """
         if df1.empty | df2.empty:
             print("Non ci sono attacchi.")
             return
 
-        signature_stats=pd.DataFrame(columns=(["signature","Indice_Diff","Media_Differenza_Severity_min","Media_Differenza_Severity_mean","Media_Differenza_Severity_max","N_Max_Sev_Diff_15","N_Attacchi_Non_rilevati"]))
-        for e in df2["signature"].unique():
-            signature_stats.loc[len(signature_stats)]=SignatureStatsCalculator.get_sig_stats(df1,e)
+        calc = SignatureStatsCalculator
+        signatures = list(df2["signature"].unique())
+        total = len(signatures)
+
+        if n_jobs == -1:
+            n_jobs = os.cpu_count() or 1
+
+        # Il contesto è preparato una sola volta, anche con più processi
+        context, vocabulary = calc.prepare_signature_context(df1)
+        items = [(sig, vocabulary.get(sig)) for sig in signatures]
+
+        # Gruppi di signature: pochi task per worker, ma abbastanza da bilanciare il carico.
+        # L'avanzamento viene stampato una volta per gruppo anche nel calcolo seriale
+        chunksize = max(1, -(-total // (max(n_jobs, 1) * 4)))
+        chunks = [items[i:i + chunksize] for i in range(0, total, chunksize)]
+
+        rows = []
+        if n_jobs <= 1:
+            for chunk in chunks:
+                rows.extend(calc.signature_stats_row(context, sig, code) for sig, code in chunk)
+                if progress:
+                    print(f"Signature elaborate: {len(rows)}/{total}")
+            return pd.DataFrame(rows, columns=calc.STATS_COLUMNS)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name, array in context.items():
+                np.save(os.path.join(tmp_dir, name + '.npy'), array)
+
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=calc.init_signature_worker, initargs=(tmp_dir,)) as executor:
+                # map restituisce i risultati nell'ordine dei gruppi, quindi l'output è deterministico
+                for chunk_rows in executor.map(calc.signature_stats_chunk, chunks):
+                    rows.extend(chunk_rows)
+                    if progress:
+                        print(f"Signature elaborate: {len(rows)}/{total}")
 
-        return signature_stats
\ No newline at end of file
+        return pd.DataFrame(rows, columns=calc.STATS_COLUMNS)
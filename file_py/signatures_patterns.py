@@ -1,4 +1,4 @@
-from .lib import defaultdict
+from .lib import np, pd
 
 class SignaturePatterns:
     @staticmethod
@@ -7,56 +7,96 @@ class SignaturePatterns:
         Extract all sub-patterns of a given length from a sequence.
         """
         return [tuple(sequence[i:i + pattern_length]) for i in range(len(sequence) - pattern_length + 1)]
-    
+
+    @staticmethod
+    def count_ngrams(codes, run_ids, length):
+        """
+        Encode the n-grams of a given length that lie entirely inside a run of equal labels.
+
+        The n-grams are encoded as packed integer keys when the vocabulary allows it,
+        otherwise as rows of a stacked array of shifted codes.
+
+        Returns the key of every valid n-gram and its start position.
+        """
+        n = len(codes) - length + 1
+        if n <= 0:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty
+
+        # An n-gram is valid when its first and last events belong to the same run
+        starts = np.flatnonzero(run_ids[:n] == run_ids[length - 1:])
+        base = int(codes.max()) + 1 if len(codes) else 1
+
+        if base ** length < 2 ** 63:
+            keys = np.zeros(len(starts), dtype=np.int64)
+            for offset in range(length):
+                keys = keys * base + codes[starts + offset]
+        else:
+            # Too many signatures to pack the n-gram in an int64: use one row per n-gram
+            stacked = np.stack([codes[starts + offset] for offset in range(length)], axis=1)
+            keys = np.unique(stacked, axis=0, return_inverse=True)[1].reshape(-1)
+
+        return keys, starts
+
     @staticmethod
     def recognize_signatures_patterns(df, pattern_lengths=[2, 3, 4], min_frequency=2):
         """
-        Given a dataset with logs of events, this function recognizes patterns of Sigma Rules 
+        Given a dataset with logs of events, this function recognizes patterns of Sigma Rules
         which occur only when real attacks are taking place and not when Sigma Rules activated for non-attacks.
 
-        df columns of interest: 
+        df columns of interest:
         'signature' with Sigma Rules names;
         'corrisponde_ad_attacco' with boolean values for attacks (1) and non-attacks (0).
 
         Patterns are recognized only between series of consecutive attacks and consecutive non-attacks.
+
+        The signatures are integer-encoded, the runs are found with a vectorized diff of the labels and
+        the n-grams of each length are counted with np.unique over packed integer keys.
+
+        Returns a DataFrame with the columns 'pattern' (tuple of signatures), 'length' and 'frequency',
+        sorted by decreasing frequency and then by first occurrence.
         """
-        attack_patterns = defaultdict(int)
-        non_attack_patterns = defaultdict(int)
-
-        current_pattern = []
-        current_label = df['corrisponde_ad_attacco'].iloc[0]
-
-        for index, row in df.iterrows():
-            if row['corrisponde_ad_attacco'] == current_label:
-                current_pattern.append(row['signature'])
-            else:
-                if current_label == 1:
-                    for length in pattern_lengths:
-                        for pattern in SignaturePatterns.extract_patterns(current_pattern, length):
-                            attack_patterns[pattern] += 1
-                else:
-                    for length in pattern_lengths:
-                        for pattern in SignaturePatterns.extract_patterns(current_pattern, length):
-                            non_attack_patterns[pattern] += 1
-                
-                current_pattern = [row['signature']]
-                current_label = row['corrisponde_ad_attacco']
-
-        # Append the last pattern
-        if current_label == 1:
-            for length in pattern_lengths:
-                for pattern in SignaturePatterns.extract_patterns(current_pattern, length):
-                    attack_patterns[pattern] += 1
-        else:
-            for length in pattern_lengths:
-                for pattern in SignaturePatterns.extract_patterns(current_pattern, length):
-                    non_attack_patterns[pattern] += 1
-
-        # Find unique attack patterns that are not in non-attack patterns
-        unique_attack_patterns = {pattern: freq for pattern, freq in attack_patterns.items() 
-                                  if pattern not in non_attack_patterns and freq > min_frequency}
-        
-        sorted_patterns = sorted(unique_attack_patterns.items(), key=lambda x: x[1], reverse=True)
-        
-        for pattern, frequency in sorted_patterns:
-            print(f"Pattern: {pattern}, Frequenza: {frequency}")
\ No newline at end of file
+        columns = ['pattern', 'length', 'frequency']
+        if df.empty:
+            return pd.DataFrame(columns=columns)
+
+        codes, uniques = pd.factorize(df['signature'], use_na_sentinel=False)
+        codes = codes.astype(np.int64)
+        uniques = np.asarray(uniques, dtype=object)
+
+        # A new run starts wherever the label changes
+        labels = df['corrisponde_ad_attacco'].to_numpy()
+        change = np.concatenate(([False], labels[1:] != labels[:-1]))
+        run_ids = np.cumsum(change)
+        is_attack = labels == 1
+
+        frames = []
+        for length_idx, length in enumerate(pattern_lengths):
+            keys, starts = SignaturePatterns.count_ngrams(codes, run_ids, length)
+            if len(starts) == 0:
+                continue
+
+            attack = is_attack[starts]
+            attack_keys, first, counts = np.unique(keys[attack], return_index=True, return_counts=True)
+
+            # Keep only the patterns that never appear outside of attacks
+            keep = ~np.isin(attack_keys, keys[~attack]) & (counts > min_frequency)
+            first_starts = starts[attack][first[keep]]
+
+            frames.append(pd.DataFrame({
+                'start': first_starts,
+                'run': run_ids[first_starts],
+                'length_idx': length_idx,
+                'length': length,
+                'frequency': counts[keep],
+            }))
+
+        if not frames:
+            return pd.DataFrame(columns=columns)
+
+        patterns = pd.concat(frames, ignore_index=True)
+        # Ties keep the order in which the patterns are first met: run by run, length by length
+        patterns = patterns.sort_values(['frequency', 'run', 'length_idx', 'start'], ascending=[False, True, True, True], kind='stable')
+        patterns['pattern'] = [tuple(uniques[codes[start:start + length]]) for start, length in zip(patterns['start'], patterns['length'])]
+
+        return patterns[columns].reset_index(drop=True)
@@ -1,14 +1,52 @@
-from .lib import plt
+from .lib import plt, np, pd
+from .frame_memo import FrameMemo
 
 class StatSeverity:
     """
     Classe StatSeverity per l'analisi della severità.
 
+    Attributi
+    ---------
+    STATISTICS : dict
+        Le colonne delle statistiche di severità e il titolo del relativo istogramma.
+
     Metodi
     ------
+    compute_stat_severity(df)
+        Calcola gli istogrammi delle statistiche di severità massima, minima e media.
+
     plot_stat_severity(df)
         Genera e visualizza istogrammi per le statistiche di severità massima, minima e media.
     """
+
+    STATISTICS = {'severity_max': 'Criticità Massima', 'severity_min': 'Criticità Minima', 'severity_mean': 'Criticità Media'}
+
+    @staticmethod
+    @FrameMemo.memoize(columns=list(STATISTICS))
+    def compute_stat_severity(df):
+        """
+        Calcola gli istogrammi a 10 intervalli delle statistiche di severità massima, minima e media.
+
+        Il risultato è memorizzato per l'impronta del dataframe (vedi FrameMemo), quindi ridisegnare
+        gli istogrammi non ripete il calcolo.
+
+        Parametri
+        ----------
+        df : pandas.DataFrame
+            DataFrame con le colonne 'severity_max', 'severity_min' e 'severity_mean'.
+
+        Restituisce
+        -----------
+        pandas.DataFrame
+            Una riga per intervallo, con le colonne 'statistic', 'bin_left', 'bin_right' e 'count'.
+        """
+        tables = []
+        for column in StatSeverity.STATISTICS:
+            # Stessi intervalli di plt.hist(..., bins=10); le firme senza severità (<NA>) sono escluse
+            count, bins = np.histogram(df[column].dropna().to_numpy(dtype=float), bins=10)
+            tables.append(pd.DataFrame({'statistic': column, 'bin_left': bins[:-1], 'bin_right': bins[1:], 'count': count}))
+        return pd.concat(tables, ignore_index=True)
+
     @staticmethod
     def plot_stat_severity(df):
         """
@@ -27,52 +65,27 @@ class StatSeverity:
         
         fig, axs = plt.subplots(1, 3, figsize=(18, 8), sharey=True)
         fig.suptitle('Statistiche di Criticità per ogni attacco', fontsize=16)
-
-        # Istogramma per 'severity_max' nel primo subplot
-        n, bins, patches = axs[0].hist(df['severity_max'], bins=10, edgecolor='black')
-        axs[0].set_title('Criticità Massima')
-        axs[0].set_ylabel('Frequenza')
-
-        # Aggiungi i valori sopra le barre dell'istogramma 'severity_max'
-        for i in range(len(patches)):
-            if patches[i].get_height() > 0:  # Mostra il valore solo se è maggiore di zero
-                axs[0].text(patches[i].get_x() + patches[i].get_width() / 2, patches[i].get_height() + 0.5, int(patches[i].get_height()), ha='center')
-            axs[0].text(bins[i], -0.02, f'{bins[i]:.1f}', transform=axs[0].get_xaxis_transform(), ha='center', color='black', fontsize=10)
-
-        # Aggiungi manualmente il valore finale (100) spostato a sinistra di 0.2 unità sull'asse x
-        axs[0].text(bins[-1] - 0.2, -0.02, f'{bins[-1]:.1f}', transform=axs[0].get_xaxis_transform(), ha='center', color='black', fontsize=10)
-
-        axs[0].set_xticks([])  # Rimuovi le xticks dopo aver aggiunto le etichette manualmente
-
-        # Istogramma per 'severity_min' nel secondo subplot
-        n, bins, patches = axs[1].hist(df['severity_min'], bins=10, edgecolor='black')
-        axs[1].set_title('Criticità Minima')
-
-        # Aggiungi i valori sopra le barre dell'istogramma 'severity_min'
-        for i in range(len(patches)):
-            if patches[i].get_height() > 0:  # Mostra il valore solo se è maggiore di zero
-                axs[1].text(patches[i].get_x() + patches[i].get_width() / 2, patches[i].get_height() + 0.5, int(patches[i].get_height()), ha='center')
-            axs[1].text(bins[i], -0.02, f'{bins[i]:.1f}', transform=axs[1].get_xaxis_transform(), ha='center', color='black', fontsize=10)
-
-        # Aggiungi manualmente il valore finale (100) spostato a sinistra di 0.2 unità sull'asse x
-        axs[1].text(bins[-1] - 0.2, -0.02, f'{bins[-1]:.1f}', transform=axs[1].get_xaxis_transform(), ha='center', color='black', fontsize=10)
-
-        axs[1].set_xticks([])  # Rimuovi le xticks dopo aver aggiunto le etichette manualmente
-
-        # Istogramma per 'severity_mean' nel terzo subplot
-        n, bins, patches = axs[2].hist(df['severity_mean'], bins=10, edgecolor='black')
-        axs[2].set_title('Criticità Media')
-
-        # Aggiungi i valori sopra le barre dell'istogramma 'severity_mean'
-        for i in range(len(patches)):
-            if patches[i].get_height() > 0:  # Mostra il valore solo se è maggiore di zero
-                axs[2].text(patches[i].get_x() + patches[i].get_width() / 2, patches[i].get_height() + 0.5, int(patches[i].get_height()), ha='center')
-            axs[2].text(bins[i], -0.02, f'{bins[i]:.1f}', transform=axs[2].get_xaxis_transform(), ha='center', color='black', fontsize=10)
-        
-        # Aggiungi manualmente il valore finale (100) spostato a sinistra di 0.2 unità sull'asse x
-        axs[2].text(bins[-1] - 0.2, -0.02, f'{bins[-1]:.1f}', transform=axs[2].get_xaxis_transform(), ha='center', color='black', fontsize=10)
-
-        axs[2].set_xticks([])  # Rimuovi le xticks dopo aver aggiunto le etichette manualmente
+        histograms = StatSeverity.compute_stat_severity(df)
+
+        for k, (column, title) in enumerate(StatSeverity.STATISTICS.items()):
+            # Istogramma per la statistica nel k-esimo subplot, dai conteggi già calcolati
+            histogram = histograms[histograms['statistic'] == column]
+            bins = np.append(histogram['bin_left'].to_numpy(), histogram['bin_right'].iloc[-1])
+            n, bins, patches = axs[k].hist(histogram['bin_left'], bins=bins, weights=histogram['count'], edgecolor='black')
+            axs[k].set_title(title)
+            if k == 0:
+                axs[k].set_ylabel('Frequenza')
+
+            # Aggiungi i valori sopra le barre dell'istogramma
+            for i in range(len(patches)):
+                if patches[i].get_height() > 0:  # Mostra il valore solo se è maggiore di zero
+                    axs[k].text(patches[i].get_x() + patches[i].get_width() / 2, patches[i].get_height() + 0.5, int(patches[i].get_height()), ha='center')
+                axs[k].text(bins[i], -0.02, f'{bins[i]:.1f}', transform=axs[k].get_xaxis_transform(), ha='center', color='black', fontsize=10)
+
+            # Aggiungi manualmente il valore finale (100) spostato a sinistra di 0.2 unità sull'asse x
+            axs[k].text(bins[-1] - 0.2, -0.02, f'{bins[-1]:.1f}', transform=axs[k].get_xaxis_transform(), ha='center', color='black', fontsize=10)
+
+            axs[k].set_xticks([])  # Rimuovi le xticks dopo aver aggiunto le etichette manualmente
 
         plt.tight_layout()
         plt.show()
\ No newline at end of file
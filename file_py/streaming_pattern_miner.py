@@ -0,0 +1,190 @@
+from .lib import np, pd
+
+class StreamingPatternMiner:
+    """An incremental miner of attack-only signature patterns over a live event feed.
+
+    It finds the same patterns as SignaturePatterns.recognize_signatures_patterns, but the
+    events arrive in batches (e.g. from successive Splunk exports) and the counters are kept
+    between them. The last events of each batch are carried over to the next one, so runs of
+    consecutive attacks or non-attacks that span two batches are handled correctly.
+
+    Memory stays bounded:
+        - the non-attack n-grams are only needed to exclude patterns, so they go into a
+          count-min sketch of fixed size. The sketch can overestimate, so a pattern may be
+          excluded because of a hash collision, but a pattern seen in non-attacks is never kept;
+        - the attack n-grams are counted exactly, but when more than 2 * top_k are tracked
+          only the top_k most frequent are kept.
+
+    Methods:
+        update(batch): Consumes a batch of events.
+        snapshot(min_frequency): Returns the unique attack patterns found so far.
+        non_attack_estimate(pattern): Returns the sketch estimate of a pattern in non-attacks.
+        reset(): Forgets every event consumed so far.
+    """
+
+    # Multipliers of the hash functions of the sketch rows (odd 64-bit constants)
+    HASH_SEEDS = [0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93,
+                  0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9]
+
+    def __init__(self, pattern_lengths=(2, 3, 4), min_frequency=2, top_k=100000, sketch_width=2**20, sketch_depth=4):
+        """
+        Initializes the miner.
+
+        Args:
+            pattern_lengths (tuple): The lengths of the patterns to look for.
+            min_frequency (int): Patterns must occur more than this number of times in attacks.
+            top_k (int): The number of attack patterns kept when the attack counters are pruned.
+            sketch_width (int): The number of counters in each row of the count-min sketch.
+            sketch_depth (int): The number of rows of the count-min sketch (at most 8).
+        """
+        if not 1 <= sketch_depth <= len(StreamingPatternMiner.HASH_SEEDS):
+            raise ValueError(f"sketch_depth must be between 1 and {len(StreamingPatternMiner.HASH_SEEDS)}")
+        if min(pattern_lengths) < 1:
+            raise ValueError("pattern_lengths must be positive")
+
+        self.pattern_lengths = list(pattern_lengths)
+        self.min_frequency = min_frequency
+        self.top_k = top_k
+        self.sketch_width = sketch_width
+        self.sketch_depth = sketch_depth
+        self.reset()
+
+    def reset(self):
+        """Forgets every event consumed so far."""
+        self.vocabulary = {}
+        self.signatures = []
+        self.attack_counts = {}
+        self.sketch = np.zeros((self.sketch_depth, self.sketch_width), dtype=np.int64)
+        self.n_events = 0
+        # Last events of the stream, needed to complete the n-grams of the next batch
+        self._tail_codes = np.array([], dtype=np.int64)
+        self._tail_labels = np.array([], dtype=object)
+
+    def _encode(self, signatures):
+        """Maps the signatures to integer codes, adding the new ones to the vocabulary."""
+        inverse, values = pd.factorize(signatures, use_na_sentinel=False)
+        mapping = np.empty(len(values), dtype=np.int64)
+        for i, value in enumerate(values):
+            if value not in self.vocabulary:
+                self.vocabulary[value] = len(self.signatures)
+                self.signatures.append(value)
+            mapping[i] = self.vocabulary[value]
+        return mapping[inverse]
+
+    def _hash_rows(self, rows):
+        """Hashes each row of n-gram codes into one 64-bit value."""
+        h = np.full(len(rows), rows.shape[1], dtype=np.uint64)
+        for column in rows.T:
+            h = (h * np.uint64(1000003)) ^ column.astype(np.uint64)
+        return h
+
+    def _sketch_columns(self, hashes):
+        """Returns, for each row of the sketch, the counter of each hash."""
+        return [((hashes * np.uint64(seed)) >> np.uint64(32)) % np.uint64(self.sketch_width)
+                for seed in StreamingPatternMiner.HASH_SEEDS[:self.sketch_depth]]
+
+    def update(self, batch):
+        """Consumes a batch of events.
+
+        Args:
+            batch (pandas.DataFrame): The events in time order, with the columns 'signature'
+                and 'corrisponde_ad_attacco'.
+
+        Returns:
+            StreamingPatternMiner: The miner itself.
+        """
+        if batch.empty:
+            return self
+
+        codes = np.concatenate((self._tail_codes, self._encode(batch['signature'])))
+        labels = np.concatenate((self._tail_labels, batch['corrisponde_ad_attacco'].to_numpy(dtype=object)))
+        tail_length = len(self._tail_codes)
+
+        # A new run starts wherever the label changes, as in recognize_signatures_patterns
+        change = np.concatenate(([False], labels[1:] != labels[:-1]))
+        run_ids = np.cumsum(change)
+        is_attack = labels == 1
+
+        for length in self.pattern_lengths:
+            n = len(codes) - length + 1
+            if n <= 0:
+                continue
+            # Only the n-grams ending in this batch are new: the others were counted with the previous one
+            starts = np.arange(max(0, tail_length - length + 1), n)
+            starts = starts[run_ids[starts] == run_ids[starts + length - 1]]
+            rows = np.stack([codes[starts + offset] for offset in range(length)], axis=1)
+            attack = is_attack[starts]
+
+            patterns, counts = np.unique(rows[attack], axis=0, return_counts=True)
+            for pattern, count in zip(map(tuple, patterns.tolist()), counts.tolist()):
+                self.attack_counts[pattern] = self.attack_counts.get(pattern, 0) + count
+
+            hashes = self._hash_rows(rows[~attack])
+            for depth, columns in enumerate(self._sketch_columns(hashes)):
+                np.add.at(self.sketch[depth], columns.astype(np.int64), 1)
+
+        self.n_events += len(batch)
+        keep = max(self.pattern_lengths) - 1
+        self._tail_codes = codes[len(codes) - keep:] if keep else codes[:0]
+        self._tail_labels = labels[len(labels) - keep:] if keep else labels[:0]
+
+        if len(self.attack_counts) > 2 * self.top_k:
+            self._prune()
+        return self
+
+    def _prune(self):
+        """Keeps only the top_k most frequent attack patterns."""
+        patterns = list(self.attack_counts)
+        counts = np.fromiter(self.attack_counts.values(), dtype=np.int64, count=len(patterns))
+        top = np.sort(np.argpartition(counts, len(counts) - self.top_k)[len(counts) - self.top_k:])
+        self.attack_counts = {patterns[i]: int(counts[i]) for i in top}
+
+    def non_attack_estimate(self, pattern):
+        """Returns the count-min estimate of how many times a pattern occurred in non-attacks.
+
+        Args:
+            pattern (tuple): The signatures of the pattern.
+
+        Returns:
+            int: The estimate, never lower than the true count.
+        """
+        if any(signature not in self.vocabulary for signature in pattern):
+            return 0
+        row = np.array([[self.vocabulary[signature] for signature in pattern]], dtype=np.int64)
+        columns = self._sketch_columns(self._hash_rows(row))
+        return int(min(self.sketch[depth, columns[depth][0]] for depth in range(self.sketch_depth)))
+
+    def snapshot(self, min_frequency=None):
+        """Returns the unique attack patterns found so far.
+
+        Args:
+            min_frequency (int, optional): Overrides the min_frequency given at construction.
+
+        Returns:
+            pandas.DataFrame: The columns 'pattern' (tuple of signatures), 'length' and 'frequency',
+                sorted by decreasing frequency.
+        """
+        min_frequency = self.min_frequency if min_frequency is None else min_frequency
+        columns = ['pattern', 'length', 'frequency']
+        candidates = [(pattern, count) for pattern, count in self.attack_counts.items() if count > min_frequency]
+        if not candidates:
+            return pd.DataFrame(columns=columns)
+
+        rows_by_length = {}
+        for i, (pattern, _) in enumerate(candidates):
+            rows_by_length.setdefault(len(pattern), []).append(i)
+
+        # Patterns with a non-zero estimate may have occurred in non-attacks
+        unique = np.zeros(len(candidates), dtype=bool)
+        for indices in rows_by_length.values():
+            rows = np.array([candidates[i][0] for i in indices], dtype=np.int64)
+            columns_by_depth = self._sketch_columns(self._hash_rows(rows))
+            estimate = np.min([self.sketch[depth, columns_by_depth[depth].astype(np.int64)] for depth in range(self.sketch_depth)], axis=0)
+            unique[indices] = estimate == 0
+
+        patterns = pd.DataFrame({
+            'pattern': [tuple(self.signatures[code] for code in pattern) for (pattern, _), keep in zip(candidates, unique) if keep],
+            'length': [len(pattern) for (pattern, _), keep in zip(candidates, unique) if keep],
+            'frequency': [count for (_, count), keep in zip(candidates, unique) if keep],
+        })
+        return patterns.sort_values('frequency', ascending=False, kind='stable').reset_index(drop=True)
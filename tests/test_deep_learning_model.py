@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('keras')
+
+from file_py.deep_learning_model import DeepLearningModel
+from file_py.model_cache import ModelCache
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 6)).astype('float32')
+    y = (X[:, 0] + X[:, 1] > 0).astype(int)
+    return X[:150], y[:150], X[150:], y[150:]
+
+
+def test_train_and_load_from_cache(data, tmp_path, capsys):
+    cache = ModelCache(str(tmp_path / 'cache'))
+    model = DeepLearningModel.train_deep_learning_model(*data, cache=cache)
+    assert 'loaded from the model cache' not in capsys.readouterr().out
+
+    cached = DeepLearningModel.train_deep_learning_model(*data, cache=cache)
+    assert 'loaded from the model cache' in capsys.readouterr().out
+    X_test = data[2]
+    np.testing.assert_allclose(cached.predict(X_test, verbose=0), model.predict(X_test, verbose=0), rtol=1e-6)
+
+
+def test_cache_key_depends_on_the_data(data, tmp_path, capsys):
+    cache = ModelCache(str(tmp_path / 'cache'))
+    X_train, y_train, X_test, y_test = data
+    DeepLearningModel.train_deep_learning_model(X_train, y_train, X_test, y_test, cache=cache)
+    capsys.readouterr()
+    DeepLearningModel.train_deep_learning_model(X_train[:100], y_train[:100], X_test, y_test, cache=cache)
+    assert 'loaded from the model cache' not in capsys.readouterr().out
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+from scipy import sparse
+from sklearn.datasets import make_classification
+from sklearn.ensemble import ExtraTreesClassifier, GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.tree import DecisionTreeClassifier
+
+from file_py.flat_forest import FlatForest
+
+ATOL = 1e-6
+
+
+@pytest.fixture(scope='module')
+def data():
+    X, y = make_classification(n_samples=1200, n_features=12, random_state=0)
+    # Repeated values put samples exactly on the thresholds
+    X[:, 5] = np.round(X[:, 5], 1)
+    return X[:900], y[:900], X[900:]
+
+
+@pytest.fixture(scope='module')
+def data_with_nan(data):
+    X_train, y_train, X_test = (a.copy() for a in data)
+    X_train[::7, 3] = np.nan
+    X_test[::5, 3] = np.nan
+    return X_train, y_train, X_test
+
+
+@pytest.mark.parametrize('model', [
+    DecisionTreeClassifier(random_state=0),
+    RandomForestClassifier(n_estimators=30, random_state=0),
+    ExtraTreesClassifier(n_estimators=30, random_state=0),
+], ids=['decision_tree', 'random_forest', 'extra_trees'])
+def test_sklearn_trees_with_missing_values(data_with_nan, model):
+    X_train, y_train, X_test = data_with_nan
+    model.fit(X_train, y_train)
+    flat = FlatForest.compile(model, X_check=X_test, atol=ATOL)
+    assert flat.parity(model, X_test) <= ATOL
+    np.testing.assert_array_equal(flat.predict(X_test), model.predict(X_test))
+
+
+@pytest.mark.parametrize('loss', ['log_loss', 'exponential'])
+def test_gradient_boosting(data, loss):
+    X_train, y_train, X_test = data
+    model = GradientBoostingClassifier(loss=loss, n_estimators=40, random_state=0).fit(X_train, y_train)
+    flat = FlatForest.compile(model)
+    assert flat.parity(model, X_test) <= ATOL
+    np.testing.assert_array_equal(flat.predict(X_test), model.predict(X_test))
+
+
+def test_xgboost_with_missing_values(data_with_nan):
+    xgb = pytest.importorskip('xgboost')
+    X_train, y_train, X_test = data_with_nan
+    model = xgb.XGBClassifier(n_estimators=40, max_depth=4, n_jobs=1).fit(X_train, y_train)
+    flat = FlatForest.compile(model)
+    assert flat.parity(model, X_test) <= ATOL
+
+
+def test_xgboost_sparse_input(data):
+    xgb = pytest.importorskip('xgboost')
+    X_train, y_train, X_test = data
+    # Small values become implicit zeros, which XGBoost treats as missing
+    X_train, X_test = (sparse.csr_matrix(np.where(np.abs(X) < 0.8, 0.0, X)) for X in (X_train, X_test))
+    model = xgb.XGBClassifier(n_estimators=40, max_depth=4, n_jobs=1).fit(X_train, y_train)
+    flat = FlatForest.compile(model)
+    assert flat.parity(model, X_test) <= ATOL
+
+
+@pytest.mark.parametrize('with_nan', [False, True], ids=['dense', 'missing_values'])
+def test_catboost(data, data_with_nan, with_nan):
+    catboost = pytest.importorskip('catboost')
+    X_train, y_train, X_test = data_with_nan if with_nan else data
+    model = catboost.CatBoostClassifier(iterations=40, depth=4, thread_count=1, verbose=0, allow_writing_files=False)
+    model.fit(X_train, y_train)
+    # The symmetric trees are expanded into ordinary ones
+    flat = FlatForest.compile(model)
+    assert flat.parity(model, X_test) <= ATOL
+    np.testing.assert_array_equal(flat.predict(X_test), model.predict(X_test))
+
+
+def test_unsupported_model_is_rejected(data):
+    X_train, y_train, _ = data
+    with pytest.raises(ValueError):
+        FlatForest.compile(LogisticRegression().fit(X_train, y_train))
+
+
+def test_save_load_round_trip(data, tmp_path):
+    X_train, y_train, X_test = data
+    model = GradientBoostingClassifier(n_estimators=20, random_state=0).fit(X_train, y_train)
+    flat = FlatForest.compile(model)
+    path = tmp_path / 'model.npz'
+    flat.save(path)
+    loaded = FlatForest.load(path)
+    np.testing.assert_array_equal(loaded.predict_proba(X_test), flat.predict_proba(X_test))
+    np.testing.assert_array_equal(loaded.classes_, flat.classes_)
+    assert loaded.n_trees == flat.n_trees
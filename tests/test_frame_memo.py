@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from file_py.frame_memo import FrameMemo
+from file_py.stat_severity import StatSeverity
+
+
+def test_memoize_reuses_results_of_the_same_frame():
+    calls = []
+
+    @FrameMemo.memoize(columns=['signature'])
+    def counts(df):
+        calls.append(1)
+        return df['signature'].value_counts()
+
+    df = pd.DataFrame({'signature': np.arange(5000) % 7, 'other': 0})
+    counts(df)
+    counts(df)
+    assert len(calls) == 1
+    # Another frame object, even with the same content, is computed again
+    counts(df.copy())
+    assert len(calls) == 2
+    # A change of layout gives a new fingerprint
+    df.drop(index=0, inplace=True)
+    assert counts(df).sum() == 4999
+    assert len(calls) == 3
+
+
+def test_stat_severity_skips_missing_severities():
+    df = pd.DataFrame({
+        'severity_max': pd.array([1.0, None, 3.0], dtype='Float64'),
+        'severity_min': [1.0, np.nan, 2.0],
+        'severity_mean': pd.array([None, None, None], dtype='Float64'),
+    })
+    totals = StatSeverity.compute_stat_severity(df).groupby('statistic')['count'].sum()
+    assert totals.to_dict() == {'severity_max': 2, 'severity_mean': 0, 'severity_min': 2}
@@ -0,0 +1,59 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The backends deferred by lib.LAZY_IMPORTS / OPTIONAL_IMPORTS, the most expensive ones included
+HEAVY = ['sklearn', 'scipy', 'pyarrow', 'matplotlib', 'plotly', 'altair', 'seaborn', 'xgboost', 'catboost', 'tensorflow', 'keras']
+
+# Seconds a light module may add to a cold start on top of pandas; scikit-learn alone takes about one
+IMPORT_BUDGET = 0.5
+
+
+def import_profile(statement, baseline='import pandas'):
+    """Runs an import in a fresh interpreter after a baseline import.
+
+    Returns:
+        tuple: (heavy packages loaded by the whole run, seconds taken by the statement alone).
+    """
+    code = (f"import sys, json, time\n{baseline}\nstart = time.perf_counter()\n{statement}\n"
+            f"elapsed = time.perf_counter() - start\n"
+            f"print(json.dumps([[name for name in {HEAVY!r} if name in sys.modules], elapsed]))")
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    loaded, elapsed = json.loads(result.stdout.splitlines()[-1])
+    return set(loaded), elapsed
+
+
+def loaded_after(statement):
+    """Runs an import in a fresh interpreter and returns the heavy packages it loaded."""
+    return import_profile(statement, baseline='')[0]
+
+
+MODULES = ['csv_preprocessing_scaler', 'run_log_parser', 'category_encoder', 'ragged_events', 'preprocessing_cache']
+
+
+@pytest.mark.parametrize('module', MODULES)
+def test_import_does_not_load_heavy_backends(module):
+    # pandas may load pyarrow by itself (e.g. for its string dtype): only what the module adds counts
+    baseline = loaded_after('import pandas')
+    assert loaded_after(f'import file_py.{module}') - baseline == set()
+
+
+@pytest.mark.parametrize('module', MODULES)
+def test_cold_import_time(module):
+    _, elapsed = import_profile(f'import file_py.{module}')
+    print(f'file_py.{module}: {elapsed * 1000:.0f} ms after pandas')
+    assert elapsed < IMPORT_BUDGET
+
+
+def test_lazy_backends_load_on_use():
+    loaded = loaded_after(
+        "import pandas as pd\n"
+        "from file_py.csv_preprocessing_scaler import CsvPreprocessingScaler\n"
+        "CsvPreprocessingScaler.stdScaler(pd.DataFrame({'a': [1.0, 2.0], '_time': [0, 1]}))"
+    )
+    assert 'sklearn' in loaded
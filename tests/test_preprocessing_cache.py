@@ -0,0 +1,25 @@
+import os
+
+import pandas as pd
+import pytest
+
+from file_py.preprocessing_cache import PreprocessingCache
+
+EXPORT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'file_csv', 'LogSplunkWF_27_07.csv')
+
+
+@pytest.mark.parametrize('pruned', [True, False], ids=['pruned', 'full'])
+def test_cache_hit_equals_cache_miss(tmp_path, pruned):
+    cache = PreprocessingCache(str(tmp_path / 'cache'))
+    miss = cache.load(EXPORT, 'RawPreprocessing', pruned=pruned)
+    hit = cache.load(EXPORT, 'RawPreprocessing', pruned=pruned)
+    assert len(os.listdir(tmp_path / 'cache')) == 1
+    assert hit.dtypes.to_dict() == miss.dtypes.to_dict()
+    pd.testing.assert_frame_equal(hit, miss)
+
+
+def test_pruned_read_keeps_event_type_categorical(tmp_path):
+    cache = PreprocessingCache(str(tmp_path / 'cache'))
+    cache.load(EXPORT, 'RawPreprocessing', pruned=True)
+    hit = cache.load(EXPORT, 'RawPreprocessing', pruned=True)
+    assert isinstance(hit['EventType'].dtype, pd.CategoricalDtype)
@@ -0,0 +1,159 @@
+import csv
+import io
+import json
+import os
+import threading
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+from sklearn.ensemble import ExtraTreesClassifier
+from sklearn.preprocessing import StandardScaler
+
+from file_py.category_encoder import CategoryEncoder
+from file_py.csv_preprocessing_scaler import CsvPreprocessingScaler
+from file_py.scoring_engine import ScoringEngine
+
+EXPORT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'file_csv', 'LogSplunkWF_27_07.csv')
+
+
+@pytest.fixture(scope='module')
+def export_text():
+    """The header and the first 400 rows of a Splunk export, as CSV text."""
+    with open(EXPORT, newline='', encoding='utf-8') as f:
+        rows = [row for _, row in zip(range(401), csv.reader(f))]
+    text = io.StringIO()
+    csv.writer(text).writerows(rows)
+    return text.getvalue()
+
+
+@pytest.fixture(scope='module')
+def engine_and_reference(export_text):
+    """An engine trained on the export with the 'onehot' pipeline, and the probabilities of its rows."""
+    raw = pd.read_csv(io.StringIO(export_text), low_memory=False)
+    encoder = CategoryEncoder(CsvPreprocessingScaler.OHE_COLUMNS, mode='onehot')
+    X, names = CsvPreprocessingScaler.OhePreprocessing(raw, encoder, sparse_output=True)
+    scaler = StandardScaler(with_mean=False)
+    X = CsvPreprocessingScaler.stdScaler(X, names, scaler)
+    y = np.random.default_rng(0).integers(0, 2, X.shape[0])
+    model = ExtraTreesClassifier(n_estimators=20, random_state=0).fit(X, y)
+    return ScoringEngine(model, encoder, scaler, names, threshold=0.4), model.predict_proba(X)[:, 1]
+
+
+def scores_of(lines):
+    """The probabilities of JSON lines, which to_json writes with 10 digits."""
+    return np.array([json.loads(line)['corrisponde_ad_attacco'] for line in lines.splitlines() if line.strip()])
+
+
+def test_stdscaler_rejects_centering_for_sparse_input():
+    X = sparse.csr_matrix(np.array([[0.0, 1.0], [2.0, 0.0]]))
+    with pytest.raises(ValueError, match='with_mean=False'):
+        CsvPreprocessingScaler.stdScaler(X, ['a', 'b'], StandardScaler())
+
+
+def test_frame_parses_like_read_csv():
+    df = ScoringEngine.frame([['sig', '', '12', '4']], ['signature', 'tag', 'process_id', 'severity_id'])
+    assert pd.isna(df.loc[0, 'tag'])
+    assert df.loc[0, 'process_id'] == 12
+    assert pd.api.types.is_numeric_dtype(df['severity_id'])
+
+
+def test_save_load_round_trip(engine_and_reference, export_text, tmp_path):
+    engine, reference = engine_and_reference
+    engine.save(tmp_path / 'bundle')
+    loaded = ScoringEngine.load(tmp_path / 'bundle')
+    assert loaded.feature_names == engine.feature_names
+    assert loaded.threshold == engine.threshold
+    np.testing.assert_array_equal(loaded.scaler.scale_, engine.scaler.scale_)
+
+    raw = pd.read_csv(io.StringIO(export_text), low_memory=False)
+    result = loaded.score(raw)
+    np.testing.assert_allclose(result['corrisponde_ad_attacco'].to_numpy(), reference, rtol=1e-12, atol=1e-12)
+    assert (result['alert'] == (result['corrisponde_ad_attacco'] >= 0.4)).all()
+
+
+def test_serve_stdin_csv(engine_and_reference, export_text):
+    engine, reference = engine_and_reference
+    output = io.StringIO()
+    engine.serve_stdin(io.StringIO(export_text), output, fmt='csv', batch_size=64)
+    np.testing.assert_allclose(scores_of(output.getvalue()), reference, atol=1e-9)
+
+
+def test_micro_batches_sizes():
+    batches = list(ScoringEngine.micro_batches(range(10), batch_size=4))
+    assert batches == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_micro_batches_max_delay_closes_a_waiting_batch():
+    def slow_producer():
+        yield from (0, 1)
+        time.sleep(0.5)
+        yield from (2, 3)
+
+    batches = list(ScoringEngine.micro_batches(slow_producer(), batch_size=100, max_delay=0.05))
+    # The first two records do not wait for the slow ones
+    assert batches == [[0, 1], [2, 3]]
+
+
+def run_with_timeout(func, timeout=10):
+    """Runs func in a thread, so that a hang fails the test instead of blocking it.
+
+    Returns:
+        Exception or None: The exception raised by func.
+    """
+    outcome = []
+
+    def run():
+        try:
+            func()
+        except Exception as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'the call did not return'
+    return outcome[0] if outcome else None
+
+
+def test_micro_batches_max_delay_raises_the_errors_of_the_records():
+    def failing_producer():
+        yield 0
+        raise ValueError('bad record')
+
+    error = run_with_timeout(lambda: list(ScoringEngine.micro_batches(failing_producer(), batch_size=100, max_delay=0.05)))
+    assert isinstance(error, ValueError)
+
+
+def test_serve_stdin_malformed_json_line(engine_and_reference):
+    engine, _ = engine_and_reference
+    lines = io.StringIO('{"signature": "a"}\n{"signature": \n')
+    error = run_with_timeout(lambda: engine.serve_stdin(lines, io.StringIO(), fmt='jsonl', max_delay=0.05))
+    assert isinstance(error, json.JSONDecodeError)
+
+
+def test_http_handler(engine_and_reference, export_text):
+    engine, reference = engine_and_reference
+    server = engine.http_server('127.0.0.1', 0, batch_size=64)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f'http://127.0.0.1:{server.server_address[1]}'
+    try:
+        request = urllib.request.Request(f'{url}/score', data=export_text.encode('utf-8'), headers={'Content-Type': 'text/csv'})
+        with urllib.request.urlopen(request) as response:
+            np.testing.assert_allclose(scores_of(response.read().decode('utf-8')), reference, atol=1e-9)
+
+        request = urllib.request.Request(f'{url}/score', data=b'[{"signature": ', headers={'Content-Type': 'application/json'})
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(request)
+        assert error.value.code == 400
+
+        with urllib.request.urlopen(f'{url}/stats') as response:
+            assert json.loads(response.read())['rows'] > 0
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()